@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import Field, MongoDsn, RedisDsn, SecretStr, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,15 +19,52 @@ class Config(BaseSettings):
     S3_BUCKET: str
     S3_JAVGURU_FOLDER: str
     S3_THUMBNAILS_FOLDER: str
+    S3_PART_SIZE: int = Field(default=16 * 1024 * 1024)
+    S3_MAX_POOL_CONNECTIONS: int = Field(default=20)  # connections kept by the shared S3 client
+    S3_UPLOAD_CONCURRENCY: int = Field(default=4)  # multipart parts uploaded at once
 
     REDIS_DSN: RedisDsn
-
-    CHUNK: int = Field(default=4096)
+    EGRESS_ID: str = Field(default="")  # names this host's direct egress IP in shared clearances, default hostname
+
+    CHUNK: int = Field(default=64 * 1024)  # first read size, grows while the connection keeps up
+    CHUNK_MAX: int = Field(default=4 * 1024 * 1024)
+    DOWNLOAD_MODE: Literal["buffer", "stream", "spool"] = Field(default="buffer")
+    SPOOL_MAX_MEMORY: int = Field(default=256 * 1024 * 1024)  # spool mode moves bigger files to a temp file
+    DOWNLOAD_SEGMENTS: int = Field(default=1)  # parallel Range requests per video, 1 = single stream
+    DOWNLOAD_SEGMENT_SIZE: int = Field(default=16 * 1024 * 1024)
+    DOWNLOAD_BATCH_SIZE: int = Field(default=1)  # videos per download task; >1 pipelines resolving and transfers
+    DOWNLOAD_TRANSFERS: int = Field(default=2)  # concurrent transfers inside one batch
+    DOWNLOAD_LOOKAHEAD: int = Field(default=2)  # resolved srcs waiting for a free transfer
+    SRC_TTL: int = Field(default=600)  # seconds a resolved src is trusted before it is resolved again
+    DOWNLOAD_MAX_ATTEMPTS: int = Field(default=5)  # failed videos aren't claimed again after this many attempts
+    DOWNLOAD_CLAIM_TIMEOUT: int = Field(default=6 * 3600)  # seconds before a "downloading" video is claimed again
+    DOWNLOAD_HOST_CONCURRENCY: int = Field(default=2)  # transfers per CDN host across all workers (Redis)
+    DOWNLOAD_HOST_BANDWIDTH: int = Field(default=0)  # bytes/s per CDN host across all workers, 0 = unlimited
+    DOWNLOAD_PROXY_HOSTS: str | list[str] = Field(default_factory=list)  # CDN host patterns fetched via PROXY_POOL
+    DOWNLOAD_CONNECTIONS_PER_HOST: int = Field(default=8)
+    DNS_CACHE_TTL: int = Field(default=300)
+    DOWNLOAD_RCVBUF: int = Field(default=0)  # fixed socket receive buffer for downloads, 0 = OS autotuning
+    DOWNLOAD_PREPROBE: bool = Field(default=False)  # skip videos whose remote metadata shows they won't be imported
+    PREPROBE_WINDOW: int = Field(default=4 * 1024 * 1024)  # bytes fetched from each end of the file
+
+    THUMBNAIL_WORKERS: int = Field(default=5)  # concurrent poster downloads
+    THUMBNAIL_DERIVATIVES: str | list[str] = Field(default_factory=list)  # format:width, e.g. webp:320,avif:640
+    THUMBNAIL_PROCESSES: int = Field(default=2)  # processes encoding derivatives
+    THUMBNAIL_QUALITY: int = Field(default=80)
+    THUMBNAIL_FLUSH_ITEMS: int = Field(default=200)  # thumbnail URLs written per bulk update
+    THUMBNAIL_FLUSH_SECONDS: float = Field(default=5.0)  # ...or at least this often
 
     DRIVER: str
+    DRIVER_POOL_SIZE: int = Field(default=1)  # warm browsers per worker process
+    DRIVER_MAX_USES: int = Field(default=50)  # leases before a browser is replaced
+    DRIVER_MAX_RSS_GROWTH: int = Field(default=1024 * 1024 * 1024)  # replace a browser that grew by this much
+    CDP_BLOCKING: bool = Field(default=True)  # block trackers, ads and fonts through DevTools
+    BLOCKED_URLS: str | list[str] = Field(default_factory=list)  # extra Network.setBlockedURLs patterns
+    BROWSER_EARLY_RETURN: bool = Field(default=False)  # stop loading a page once its media request is seen
     AD_BLOCK: str
 
     SITE_NAME: str
+    CATALOG_MAX_AGE: int = Field(default=2 * 24 * 3600)  # seconds a complete sitemap harvest is trusted for the join
 
     G_SPREADSHEET_ID: str
     G_SPREADSHEET_MAIN_TAB: str = "Main"
@@ -35,9 +74,9 @@ class Config(BaseSettings):
 
     PROXY_POOL: str | list[str] = Field(default_factory=list)
 
-    @field_validator("PROXY_POOL", mode="before")
+    @field_validator("PROXY_POOL", "BLOCKED_URLS", "DOWNLOAD_PROXY_HOSTS", "THUMBNAIL_DERIVATIVES", mode="before")
     @classmethod
-    def parse_proxy_pool(cls, v):
+    def parse_comma_separated(cls, v):
         if isinstance(v, str):
             return [p.strip() for p in v.split(",") if p.strip()]
         return v
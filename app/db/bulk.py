@@ -0,0 +1,63 @@
+import asyncio
+import time
+from typing import Any
+
+from beanie import Document, PydanticObjectId
+from loguru import logger
+from pymongo import UpdateOne
+
+
+class BulkSetWriter:
+    """
+    Collects `$set` updates per document id and writes them with one bulk_write.
+
+    A flush happens once max_items documents are pending, and, while run() is active, at
+    least every max_wait seconds, so a slow trickle of updates still lands promptly. Later
+    updates of the same document are merged into the pending one. A failed flush is logged
+    and the updates are dropped; callers pick those documents up again on their next pass.
+    """
+
+    def __init__(self, model: type[Document], max_items: int = 200, max_wait: float = 5.0) -> None:
+        self.model = model
+        self.max_items = max(max_items, 1)
+        self.max_wait = max_wait
+        self.written = 0
+        self._pending: dict[PydanticObjectId, dict[str, Any]] = {}
+        self._last_flush = time.monotonic()
+        self._timer: asyncio.Task | None = None
+
+    async def set(self, document_id: PydanticObjectId, fields: dict[str, Any]) -> None:
+        self._pending.setdefault(document_id, {}).update(fields)
+        if len(self._pending) >= self.max_items:
+            await self.flush()
+
+    async def flush(self) -> int:
+        pending, self._pending = self._pending, {}
+        self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        requests = [UpdateOne({"_id": doc_id}, {"$set": fields}) for doc_id, fields in pending.items()]
+        try:
+            await self.model.get_motor_collection().bulk_write(requests, ordered=False)
+        except Exception as e:
+            logger.error(f"[Bulk] Failed to write {len(requests)} {self.model.__name__} updates: {e}")
+            return 0
+        self.written += len(requests)
+        return len(requests)
+
+    async def run(self) -> None:
+        """Flush on the max_wait timer until cancelled."""
+        while True:
+            await asyncio.sleep(max(self.max_wait - (time.monotonic() - self._last_flush), 0))
+            if time.monotonic() - self._last_flush >= self.max_wait:
+                await self.flush()
+
+    async def __aenter__(self) -> "BulkSetWriter":
+        self._timer = asyncio.create_task(self.run())
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        if self._timer:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+        await self.flush()
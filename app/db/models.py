@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Literal
 
-from beanie import Document, Link
+from beanie import Document, Indexed, Link
 from pydantic import BaseModel, Field, HttpUrl, model_validator
 
 
@@ -56,6 +56,37 @@ class Tag(Document):
         name = "tags"
 
 
+class MediaProbe(BaseModel):
+    """Technical info of a video file, probed once after download."""
+
+    width: int | None = None
+    height: int | None = None
+    duration_ms: int | None = None
+    bitrate: int | None = None
+    video_codec: str | None = None
+    audio_codec: str | None = None
+    container: str | None = None
+
+    @property
+    def resolution(self) -> str:
+        """Height normalized to "480p", "720p", "1080p", "2k" or "4k"; "unknown" if not detected."""
+        if not self.height:
+            return "unknown"
+        if self.height <= 480:
+            return "480p"
+        if self.height <= 720:
+            return "720p"
+        if self.height <= 1080:
+            return "1080p"
+        if self.height <= 1440:
+            return "2k"
+        return "4k"
+
+    @property
+    def runtime_minutes(self) -> int | None:
+        return int(self.duration_ms / 60000) if self.duration_ms else None
+
+
 class VideoSource(BaseModel):
     origin: str
     resolution: str
@@ -63,10 +94,46 @@ class VideoSource(BaseModel):
     file_name: str = ""
     file_size: int = 0
     hash_md5: str = ""
+    probe: MediaProbe | None = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     status: Literal["saved", "imported", "deleted"] = "saved"
 
 
+class ThumbnailDerivative(BaseModel):
+    """A resized/re-encoded copy of the poster, e.g. name "webp_320"."""
+
+    name: str
+    s3_url: str
+    width: int
+    size: int
+
+
+class ThumbnailMeta(BaseModel):
+    """What the poster looked like when it was last fetched, for dedupe and conditional refreshes."""
+
+    md5: str
+    etag: str | None = None
+    last_modified: str | None = None
+    checked_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+    size: int
+
+
+class DownloadProgress(BaseModel):
+    """State of an interrupted streaming download: what is already safely stored in S3."""
+
+    staging_key: str
+    upload_id: str = ""
+    parts: list[UploadedPart] = Field(default_factory=list)
+    bytes_received: int = 0
+    total_size: int | None = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Video(Document):
     title: str
     rewritten_title: str | None = None
@@ -76,6 +143,8 @@ class Video(Document):
 
     thumbnail_url: HttpUrl | None = None
     thumbnail_s3_url: HttpUrl | None = None
+    thumbnail_derivatives: list[ThumbnailDerivative] = Field(default_factory=list)
+    thumbnail_meta: ThumbnailMeta | None = None
 
     categories: list[Link[Category]] = Field(default_factory=list)
     tags: list[Link[Tag]] = Field(default_factory=list)
@@ -85,7 +154,7 @@ class Video(Document):
     directors: list[Link[Model]] = Field(default_factory=list)
 
     empty_actresses_source: bool = False
-    
+
     studio: Link[Studio] | None = None
     release_date: datetime | None = None
     uncensored: bool | None = None
@@ -93,17 +162,59 @@ class Video(Document):
     type_javtiful: str | None = None
 
     sources: list[VideoSource] = Field(default_factory=list)
+    download_progress: DownloadProgress | None = None
+    download_claim: str | None = None  # token of the fan-out run that queued this video
+    claimed_at: datetime | None = None  # when it was claimed or started; stale claims are taken over
+    download_attempts: int = 0
 
     javct_enriched: bool = False
+    javct_catalog_miss_at: datetime | None = None  # set with javct_enriched when the sitemap didn't list the code
     javtiful_enriched: bool = False
 
-    javguru_status: Literal["added", "parsed", "downloading", "downloaded", "failed", "imported", "deleted"]
+    javguru_status: Literal["added", "parsed", "downloading", "downloaded", "skipped", "failed", "imported", "deleted"]
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
         name = "videos"
 
 
+class JavctCatalogEntry(Document):
+    """A javct.net video harvested from the site's sitemap, keyed by the lowercased JAV code."""
+
+    jav_code: Indexed(str, unique=True)  # type: ignore
+    url: HttpUrl
+    last_modified: datetime | None = None
+    harvested_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "javct_catalog"
+
+
+class CatalogHarvest(Document):
+    """When a site's sitemap was last harvested completely; the catalogue join only trusts a recent one."""
+
+    site: Indexed(str, unique=True)  # type: ignore
+    entries: int = 0
+    completed_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "catalog_harvests"
+
+
+class StoredObject(Document):
+    """A video file kept in S3, keyed by its MD5 so identical files are stored once."""
+
+    hash_md5: Indexed(str, unique=True)  # type: ignore
+    s3_path: str
+    file_name: str = ""
+    file_size: int = 0
+    origin: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "stored_objects"
+
+
 # ---------- Scraper Schemas ----------
 class ParsedVideo(BaseModel):
     title: str
@@ -133,6 +244,8 @@ class VideoCSV(BaseModel):
     poster_for_main_page_url: str
     studio: str
     poster_for_video_page_url: str | None = None
+    # The KVS import is positional and headerless, so new columns go last.
+    poster_derivatives: list = Field(default_factory=list)
 
     @model_validator(mode="after")
     def validator(self):
@@ -140,6 +253,7 @@ class VideoCSV(BaseModel):
         self.models = ", ".join(self.models)
         self.categories = ", ".join(self.categories)
         self.tags = ", ".join(self.tags)
+        self.poster_derivatives = ", ".join(self.poster_derivatives)
         self.poster_for_video_page_url = self.poster_for_main_page_url
         return self
 
@@ -148,4 +262,18 @@ class KVSImportConfirm(BaseModel):
     video_ids: list[str]
 
 
-Collections = [Video, Model, Studio, Category, Tag]
+class S3ObjectEntry(Document):
+    """An object listed in the bucket by the last index refresh."""
+
+    key: Indexed(str, unique=True)  # type: ignore
+    folder: str
+    size: int
+    etag: str
+    last_modified: datetime | None = None
+    seen_at: datetime
+
+    class Settings:
+        name = "s3_objects"
+
+
+Collections = [Video, Model, Studio, Category, Tag, JavctCatalogEntry, CatalogHarvest, StoredObject, S3ObjectEntry]
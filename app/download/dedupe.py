@@ -0,0 +1,53 @@
+from loguru import logger
+from pymongo.errors import DuplicateKeyError
+
+from app.db.models import StoredObject, Video
+
+
+async def find_stored_object(md5: str) -> StoredObject | None:
+    if not md5:
+        return None
+    return await StoredObject.find_one(StoredObject.hash_md5 == md5)
+
+
+async def register_stored_object(
+    md5: str, s3_path: str, origin: str, file_name: str = "", file_size: int = 0
+) -> StoredObject:
+    """
+    Record an object stored under s3_path.
+
+    If the hash is already registered (another worker uploaded the same file meanwhile),
+    the existing record wins and is returned instead.
+    """
+    stored = StoredObject(
+        hash_md5=md5,
+        s3_path=s3_path,
+        origin=origin,
+        file_name=file_name or s3_path.rsplit("/", 1)[-1],
+        file_size=file_size,
+    )
+    try:
+        await stored.insert()
+    except DuplicateKeyError:
+        existing = await find_stored_object(md5)
+        if existing:
+            return existing
+        raise
+    return stored
+
+
+async def backfill_stored_objects() -> int:
+    """Register every hashed source already attached to a video. Returns the number of new records."""
+    known = {obj.hash_md5 for obj in await StoredObject.find_all().to_list()}
+    added = 0
+    async for video in Video.find({"sources.hash_md5": {"$nin": ["", None]}}):
+        for source in video.sources:
+            if not source.hash_md5 or source.hash_md5 in known or source.status == "deleted":
+                continue
+            await register_stored_object(
+                source.hash_md5, source.s3_path, source.origin, source.file_name, source.file_size
+            )
+            known.add(source.hash_md5)
+            added += 1
+    logger.info(f"[Dedupe] ✓ Registered {added} stored objects")
+    return added
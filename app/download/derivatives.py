@@ -0,0 +1,129 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from loguru import logger
+
+from app.config import config
+
+CONTENT_TYPES = {"webp": "image/webp", "avif": "image/avif", "jpg": "image/jpeg"}
+
+
+@dataclass(frozen=True)
+class DerivativeSpec:
+    format: str
+    width: int
+
+    @classmethod
+    def parse(cls, value: str) -> "DerivativeSpec":
+        """ "webp:320" -> DerivativeSpec("webp", 320)."""
+        fmt, _, width = value.strip().lower().partition(":")
+        return cls(fmt, int(width))
+
+    @property
+    def name(self) -> str:
+        return f"{self.format}_{self.width}"
+
+    @property
+    def content_type(self) -> str:
+        return CONTENT_TYPES[self.format]
+
+
+@dataclass
+class RenderedImage:
+    spec: DerivativeSpec
+    data: bytes
+    width: int
+
+
+# OpenCV is imported where images are handled, so processes that never render derivatives don't load it.
+
+
+def _quality_params(fmt: str, quality: int) -> list[int]:
+    import cv2
+
+    flag = {
+        "webp": cv2.IMWRITE_WEBP_QUALITY,
+        "jpg": cv2.IMWRITE_JPEG_QUALITY,
+        # Writers without AVIF support are filtered out by supported_specs.
+        "avif": getattr(cv2, "IMWRITE_AVIF_QUALITY", None),
+    }.get(fmt)
+    return [flag, quality] if flag is not None else []
+
+
+def render_derivatives(data: bytes, specs: list[DerivativeSpec], quality: int) -> list[RenderedImage]:
+    """Decode an image and encode it at each spec's width. Runs in a pool worker, so it must stay picklable."""
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("not a decodable image")
+    height, width = image.shape[:2]
+    rendered = []
+    for spec in specs:
+        # Never upscale: a derivative wider than the poster keeps the poster's size.
+        target_w = min(spec.width, width)
+        target_h = max(round(height * target_w / width), 1)
+        resized = image if target_w == width else cv2.resize(image, (target_w, target_h), interpolation=cv2.INTER_AREA)
+        ok, encoded = cv2.imencode(f".{spec.format}", resized, _quality_params(spec.format, quality))
+        if not ok:
+            raise ValueError(f"failed to encode {spec.name}")
+        rendered.append(RenderedImage(spec, encoded.tobytes(), target_w))
+    return rendered
+
+
+def supported_specs(values: list[str]) -> list[DerivativeSpec]:
+    if not values:
+        return []
+    import cv2
+
+    specs = []
+    for value in values:
+        spec = DerivativeSpec.parse(value)
+        if spec.format not in CONTENT_TYPES or not cv2.haveImageWriter(f"probe.{spec.format}"):
+            logger.warning(f"[Thumbnails] This OpenCV build can't write {spec.format}, derivative {spec.name} skipped")
+            continue
+        specs.append(spec)
+    return specs
+
+
+class DerivativeRenderer:
+    """
+    Renders thumbnail derivatives off the event loop.
+
+    Resizing and WebP/AVIF encoding are CPU-bound, so they run in a process pool while the
+    fetch loop keeps downloading. Celery's prefork children are daemonic and may not start
+    processes of their own; there the renderer falls back to threads (OpenCV releases the GIL).
+    """
+
+    def __init__(
+        self,
+        specs: list[str] = config.THUMBNAIL_DERIVATIVES,  # type: ignore
+        processes: int = config.THUMBNAIL_PROCESSES,
+        quality: int = config.THUMBNAIL_QUALITY,
+    ) -> None:
+        self.specs = supported_specs(specs)
+        self.processes = max(processes, 1)
+        self.quality = quality
+        self._executor: Executor | None = None
+
+    def __enter__(self) -> "DerivativeRenderer":
+        if self.specs:
+            if multiprocessing.current_process().daemon:
+                self._executor = ThreadPoolExecutor(max_workers=self.processes)
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.processes)
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def render(self, data: bytes) -> list[RenderedImage]:
+        if not self.specs or not self._executor:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, render_derivatives, data, self.specs, self.quality)
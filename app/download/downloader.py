@@ -1,16 +1,34 @@
+import hashlib
+import inspect
+from contextlib import AsyncExitStack, asynccontextmanager
 from dataclasses import dataclass
 from io import BytesIO
+from typing import AsyncIterator, Awaitable, Protocol
 
 import aiohttp
 
 from app.config import config
 from app.download.exceptions import DownloadFailedException
-from app.download.utils import calculate_md5, extract_filename
+from app.download.spool import SpooledBuffer
+from app.download.utils import extract_filename
+
+
+class Sink(Protocol):
+    """Anything bytes can be written to: a file, a BytesIO, a SpooledBuffer or an S3 MultipartUpload."""
+
+    def write(self, data: bytes, /) -> int | None | Awaitable[None]: ...
+
+
+@dataclass
+class DownloadResult:
+    filename: str
+    size: int
+    md5: str
 
 
 @dataclass
 class DownloadedFile:
-    content: BytesIO
+    content: BytesIO | SpooledBuffer
     filename: str
     md5: str
 
@@ -21,33 +39,83 @@ class Downloader:
         *,
         timeout: int = 3600,
         chunk_size: int = config.CHUNK,
+        max_chunk_size: int = config.CHUNK_MAX,
+        spool_max_memory: int | None = None,
     ):
+        """
+        Reads start at chunk_size bytes and double up to max_chunk_size while the connection
+        keeps the buffer full, so fast downloads take few reads and slow ones don't wait on a big one.
+
+        Used as an async context manager the downloader keeps one ClientSession for all calls;
+        otherwise every call opens its own.
+
+        With spool_max_memory set, download_file writes into a SpooledBuffer that moves to disk
+        above that many bytes; otherwise the file is collected in memory as a BytesIO.
+        """
         self.timeout = timeout
         self.chunk_size = chunk_size
+        self.max_chunk_size = max(max_chunk_size, chunk_size)
+        self.spool_max_memory = spool_max_memory
+        self._stack = AsyncExitStack()
+        self._session: aiohttp.ClientSession | None = None
 
-    async def download_file(
+    async def __aenter__(self) -> "Downloader":
+        self._session = await self._stack.enter_async_context(self._new_session())
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        self._session = None
+        await self._stack.aclose()
+
+    def _new_session(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    @asynccontextmanager
+    async def _session_scope(self) -> AsyncIterator[aiohttp.ClientSession]:
+        if self._session is not None:
+            yield self._session
+            return
+        async with self._new_session() as session:
+            yield session
+
+    async def download_to(
         self,
         url: str,
+        sink: Sink,
         headers: dict[str, str] | None = None,
-    ) -> DownloadedFile:
-        timeout = aiohttp.ClientTimeout(total=self.timeout)
-
-        async with aiohttp.ClientSession(timeout=timeout) as session:
+    ) -> DownloadResult:
+        """Stream the response body into sink, hashing it on the way. Each byte is handed over once."""
+        md5 = hashlib.md5()
+        size = 0
+        read_size = self.chunk_size
+        async with self._session_scope() as session:
             async with session.get(url, headers=headers) as response:
                 if response.status != 200:
                     raise DownloadFailedException(f"Download failed with status {response.status} for {url}")
 
-                chunks: list[bytes] = []
-
-                while True:
-                    chunk = await response.content.read(self.chunk_size)
-                    if not chunk:
-                        break
-                    chunks.append(chunk)
+                while chunk := await response.content.read(read_size):
+                    md5.update(chunk)
+                    size += len(chunk)
+                    written = sink.write(chunk)
+                    if inspect.isawaitable(written):
+                        await written
+                    if len(chunk) == read_size and read_size < self.max_chunk_size:
+                        read_size = min(read_size * 2, self.max_chunk_size)
 
-                content = b"".join(chunks)
-                file_obj = BytesIO(content)
-                filename = extract_filename(url)
-                md5_hash = calculate_md5(file_obj)
+        return DownloadResult(filename=extract_filename(url), size=size, md5=md5.hexdigest())
 
-                return DownloadedFile(content=file_obj, filename=filename, md5=md5_hash)
+    async def download_file(
+        self,
+        url: str,
+        headers: dict[str, str] | None = None,
+    ) -> DownloadedFile:
+        content: BytesIO | SpooledBuffer = (
+            SpooledBuffer(max_memory=self.spool_max_memory) if self.spool_max_memory is not None else BytesIO()
+        )
+        try:
+            result = await self.download_to(url, content, headers)
+        except BaseException:
+            content.close()
+            raise
+        content.seek(0)
+        return DownloadedFile(content=content, filename=result.filename, md5=result.md5)
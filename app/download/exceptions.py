@@ -2,3 +2,7 @@ class DownloadFailedException(Exception):
     def __init__(self, message: str):
         self.message = message
         super().__init__(self.message)
+
+
+class ResumeRejectedException(DownloadFailedException):
+    """The server can't continue an interrupted download (no Range support or the file has changed)."""
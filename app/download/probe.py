@@ -0,0 +1,100 @@
+import asyncio
+import shutil
+import tempfile
+from typing import BinaryIO
+
+import aiohttp
+from loguru import logger
+from pymediainfo import MediaInfo
+
+from app.config import config
+from app.db.models import MediaProbe
+from app.download.utils import MediaWindow
+
+
+def _parse_media_info(buf: BinaryIO) -> MediaInfo:
+    """
+    Parse a video with pymediainfo.
+
+    Buffers backed by a real file are parsed by path. In-memory buffers are parsed
+    straight from the object, and spilled to a temporary file only if that fails.
+    """
+    path = getattr(buf, "name", None)
+    if isinstance(path, str):
+        return MediaInfo.parse(path)
+    try:
+        buf.seek(0)
+        return MediaInfo.parse(buf)
+    except Exception:
+        with tempfile.NamedTemporaryFile(delete=True) as tmp_file:
+            buf.seek(0)
+            shutil.copyfileobj(buf, tmp_file)
+            tmp_file.flush()
+            return MediaInfo.parse(tmp_file.name)
+
+
+def probe_media(buf: BinaryIO, file_name: str = "") -> MediaProbe:
+    """Parse the file once and collect resolution, duration, bitrate, codecs and container."""
+    media_info = _parse_media_info(buf)
+    probe = MediaProbe()
+    for track in media_info.tracks:
+        if track.track_type == "General":
+            probe.container = probe.container or track.format
+            probe.bitrate = probe.bitrate or track.overall_bit_rate
+            probe.duration_ms = probe.duration_ms or (int(float(track.duration)) if track.duration else None)
+        elif track.track_type == "Video" and not probe.video_codec:
+            probe.video_codec = track.format
+            probe.width = track.width
+            probe.height = track.height
+            if track.duration:
+                # The video stream duration is preferred over the container one.
+                probe.duration_ms = int(float(track.duration))
+        elif track.track_type == "Audio" and not probe.audio_codec:
+            probe.audio_codec = track.format
+
+    if not probe.height:
+        logger.warning(f"resolution not detected {file_name}")
+    if not probe.duration_ms:
+        logger.warning(f"runtime not detected {file_name}")
+    return probe
+
+
+async def probe_media_async(buf: BinaryIO, file_name: str = "") -> MediaProbe:
+    """probe_media in the default thread pool, so parsing doesn't block the event loop."""
+    return await asyncio.to_thread(probe_media, buf, file_name)
+
+
+async def probe_remote(
+    session: aiohttp.ClientSession, url: str, window_size: int = config.PREPROBE_WINDOW
+) -> MediaProbe | None:
+    """
+    Probe a remote video without downloading it.
+
+    The first and the last window_size bytes are fetched with Range requests, which covers
+    the moov atom wherever the muxer put it, and parsed from a sparse file of the real size.
+    Returns None when the server doesn't honour ranges or doesn't report the total size.
+    """
+    window = MediaWindow(head_size=window_size, tail_size=window_size)
+    async with session.get(url, ssl=False, headers={"Range": f"bytes=0-{window_size - 1}"}) as response:
+        total_size = _range_total(response.status, response.headers.get("Content-Range", ""))
+        if total_size is None:
+            logger.info(f"No Range support, cannot probe before download {url}")
+            return None
+        window.feed(await response.read())
+
+    if total_size > len(window.head):
+        start = max(len(window.head), total_size - window_size)
+        async with session.get(url, ssl=False, headers={"Range": f"bytes={start}-{total_size - 1}"}) as response:
+            if _range_total(response.status, response.headers.get("Content-Range", "")) != total_size:
+                logger.info(f"Tail range rejected, cannot probe before download {url}")
+                return None
+            window.feed(await response.read())
+
+    with window.sparse_file(total_size) as probe_file:
+        return await probe_media_async(probe_file, url)
+
+
+def _range_total(status: int, content_range: str) -> int | None:
+    if status != 206 or "/" not in content_range or content_range.endswith("/*"):
+        return None
+    return int(content_range.rsplit("/", 1)[1])
@@ -0,0 +1,140 @@
+import asyncio
+import base64
+import binascii
+import random
+import re
+from collections import Counter
+from typing import Awaitable, Callable
+from urllib.parse import urljoin
+
+from curl_cffi.requests import AsyncSession
+from loguru import logger
+from selectolax.lexbor import LexborHTMLParser as HTMLTree
+
+from app.config import config
+from app.infra.clearance import clearance_store
+
+MEDIA_URL_RE = re.compile(r"""(?:https?:)?(?:\\?/){2}[^\s"'<>]+?\.(?:mp4|m3u8)(?:\?[^\s"'<>]*)?(?=["'\s<>]|$)""")
+BASE64_IFRAME_RE = re.compile(r""""iframe_url"\s*:\s*"([A-Za-z0-9+/=]{16,})\"""")
+IFRAME_SRC_ATTRS = ("src", "data-src", "data-litespeed-src", "data-lazy-src")
+
+
+def find_media_url(html: str | bytes, base_url: str) -> tuple[str | None, list[str]]:
+    """
+    Look for a playable media URL in a page.
+
+    Checks <video>/<source> tags first, then URLs of .mp4/.m3u8 files in inline scripts.
+    Returns (media_url, []) on success, otherwise (None, iframe URLs worth following):
+    player iframes and base64-encoded "iframe_url" values from inline JSON.
+    """
+    tree = HTMLTree(html)
+    for node in tree.css("video[src], video source[src]"):
+        src = (node.attributes.get("src") or "").strip()
+        if src and not src.startswith("blob:"):
+            return urljoin(base_url, src), []
+
+    for script in tree.css("script"):
+        text = script.text() or ""
+        if match := MEDIA_URL_RE.search(text):
+            url = match.group(0).replace("\\/", "/")
+            return urljoin(base_url, url), []
+
+    iframes: list[str] = []
+    for script in tree.css("script"):
+        for encoded in BASE64_IFRAME_RE.findall(script.text() or ""):
+            try:
+                iframes.append(urljoin(base_url, base64.b64decode(encoded).decode()))
+            except (binascii.Error, UnicodeDecodeError):
+                continue
+    for node in tree.css("iframe"):
+        for attr in IFRAME_SRC_ATTRS:
+            src = (node.attributes.get(attr) or "").strip()
+            if src and not src.startswith(("about:", "javascript:")):
+                iframes.append(urljoin(base_url, src))
+                break
+    return None, list(dict.fromkeys(iframes))
+
+
+class SrcResolver:
+    """
+    Resolve the playable video URL of a jav.guru page.
+
+    A plain curl_cffi fetch is tried first: the page and up to max_depth levels of player
+    iframes are parsed for a media URL. Only if that fails is the fallback called (in a thread),
+    which is expected to open the page in a browser. Per-strategy attempts and hits are counted
+    for the whole process and logged after every resolution.
+    """
+
+    attempts: Counter = Counter()
+    hits: Counter = Counter()
+
+    def __init__(
+        self,
+        fallback: Callable[[str], str | None] | None = None,
+        max_depth: int = 3,
+        proxy_pool: list[str] = config.PROXY_POOL,  # type: ignore
+        timeout: int = 20,
+    ) -> None:
+        self.fallback = fallback
+        self.max_depth = max_depth
+        self.proxy_pool = proxy_pool
+        self.timeout = timeout
+        self.impersonate_pool = ["chrome124", "chrome120"]
+
+    async def resolve(self, page_url: str) -> str | None:
+        src = await self._attempt("http", self._resolve_over_http(page_url))
+        if src is None and self.fallback:
+            src = await self._attempt("browser", asyncio.to_thread(self.fallback, page_url))
+        logger.info(f"[Resolver] {'✓' if src else '✗'} {page_url} | {self.success_rates()}")
+        return src
+
+    async def _attempt(self, strategy: str, resolution: Awaitable[str | None]) -> str | None:
+        self.attempts[strategy] += 1
+        try:
+            src = await resolution
+        except Exception as e:
+            logger.warning(f"[Resolver] {strategy} failed: {type(e).__name__} {e}")
+            src = None
+        if src:
+            self.hits[strategy] += 1
+        return src
+
+    @classmethod
+    def success_rates(cls) -> str:
+        return " · ".join(
+            f"{name} {cls.hits[name]}/{total} ({cls.hits[name] / total:.0%})" for name, total in cls.attempts.items()
+        )
+
+    async def _resolve_over_http(self, page_url: str) -> str | None:
+        proxy = random.choice(self.proxy_pool) if self.proxy_pool else None
+        async with AsyncSession(impersonate=random.choice(self.impersonate_pool), timeout=self.timeout) as session:
+            queue, seen = [(page_url, None, 0)], set()
+            while queue:
+                url, referer, depth = queue.pop(0)
+                if url in seen:
+                    continue
+                seen.add(url)
+                html = await self._fetch(session, url, referer, proxy)
+                if html is None:
+                    continue
+                media_url, iframes = find_media_url(html, url)
+                if media_url:
+                    return media_url
+                if depth < self.max_depth:
+                    queue.extend((iframe, url, depth + 1) for iframe in iframes)
+        return None
+
+    @staticmethod
+    async def _fetch(session: AsyncSession, url: str, referer: str | None, proxy: str | None) -> str | None:
+        # Resolving is the step a browser would otherwise take over, so its direct clearance is worth the proxy.
+        kwargs = await clearance_store.request_kwargs(url, proxy, direct_fallback=True)
+        if referer:
+            kwargs["headers"] = {**kwargs.get("headers", {}), "Referer": referer}
+        resp = await session.get(url, allow_redirects=True, **kwargs)
+        if resp.status_code == 403 or "cf-chl" in resp.text:
+            logger.debug(f"[Resolver] Challenge on {url}")
+            return None
+        if resp.status_code != 200:
+            logger.debug(f"[Resolver] HTTP {resp.status_code} {url}")
+            return None
+        return resp.text
@@ -0,0 +1,160 @@
+from datetime import datetime
+from urllib.parse import urlparse
+
+from beanie.operators import In
+from loguru import logger
+from pymongo import UpdateOne
+
+from app.config import config
+from app.db.models import S3ObjectEntry, StoredObject, Video
+from app.infra.s3 import s3
+
+
+def folder_prefix(folder: str) -> str:
+    return f"{folder.strip('/')}/"
+
+
+def indexed_folders() -> list[str]:
+    return [folder_prefix(config.S3_JAVGURU_FOLDER), folder_prefix(config.S3_THUMBNAILS_FOLDER)]
+
+
+def s3_key_from_path(s3_path: str, bucket: str = config.S3_BUCKET) -> str:
+    """Object key of an https://{endpoint}/{bucket}/{key} URL as stored on videos."""
+    path = urlparse(s3_path).path.lstrip("/")
+    return path.removeprefix(f"{bucket}/")
+
+
+def _is_indexed(key: str, folders: list[str]) -> bool:
+    return key.startswith(tuple(folders))
+
+
+async def refresh_s3_index(folders: list[str] | None = None, batch_size: int = 1000, s3_client=s3) -> int:
+    """
+    Mirror the keys, sizes and ETags under the given folders into the s3_objects collection.
+
+    Listed objects are upserted in bulk and stamped with this run's time; entries under the
+    folders that the listing didn't return are removed afterwards. Returns the number of objects.
+    """
+    folders = folders or indexed_folders()
+    started = datetime.utcnow()
+    collection = S3ObjectEntry.get_motor_collection()
+    total = 0
+    for folder in folders:
+        batch: list[UpdateOne] = []
+        async for obj in s3_client.iter_objects(folder):
+            entry = {
+                "folder": folder,
+                "size": obj.get("Size", 0),
+                "etag": obj.get("ETag", "").strip('"'),
+                "last_modified": obj.get("LastModified"),
+                "seen_at": started,
+            }
+            batch.append(UpdateOne({"key": obj["Key"]}, {"$set": entry}, upsert=True))
+            if len(batch) >= batch_size:
+                await collection.bulk_write(batch, ordered=False)
+                total += len(batch)
+                batch = []
+        if batch:
+            await collection.bulk_write(batch, ordered=False)
+            total += len(batch)
+    removed = await S3ObjectEntry.find(In(S3ObjectEntry.folder, folders), S3ObjectEntry.seen_at < started).delete()
+    logger.info(f"[S3Index] ✓ Indexed {total} objects, dropped {removed.deleted_count if removed else 0} stale")
+    return total
+
+
+async def indexed_keys(folder: str | None = None) -> dict[str, S3ObjectEntry]:
+    query = S3ObjectEntry.find(S3ObjectEntry.folder == folder) if folder else S3ObjectEntry.find_all()
+    return {entry.key: entry async for entry in query}
+
+
+async def _referenced_keys() -> set[str]:
+    """Keys that videos, stored objects or unfinished downloads point at."""
+    keys = set()
+    async for video in Video.find_all():
+        keys.update(s3_key_from_path(s.s3_path) for s in video.sources if s.status != "deleted")
+        if video.thumbnail_s3_url:
+            keys.add(s3_key_from_path(str(video.thumbnail_s3_url)))
+        keys.update(s3_key_from_path(d.s3_url) for d in video.thumbnail_derivatives)
+        if video.download_progress:
+            keys.add(video.download_progress.staging_key)
+    keys.update([s3_key_from_path(obj.s3_path) async for obj in StoredObject.find_all()])
+    return keys
+
+
+async def find_orphans() -> list[S3ObjectEntry]:
+    """Indexed objects nothing refers to."""
+    referenced = await _referenced_keys()
+    return [entry for key, entry in (await indexed_keys()).items() if key not in referenced]
+
+
+async def _listed_at(folders: list[str]) -> dict[str, datetime]:
+    """When each folder was last listed, i.e. the seen_at stamp of its latest refresh."""
+    listed = {}
+    for folder in folders:
+        latest = await S3ObjectEntry.find(S3ObjectEntry.folder == folder).sort(-S3ObjectEntry.seen_at).first_or_none()
+        if latest:
+            listed[folder] = latest.seen_at
+    return listed
+
+
+async def repair_sources(dry_run: bool = False, s3_client=s3) -> dict[str, int]:
+    """
+    Bring videos and stored objects in line with the index.
+
+    Sources whose object is gone are marked "deleted", missing file sizes are filled in from
+    the index, thumbnail URLs of missing thumbnails are cleared so ThumbnailSaver fetches
+    them again, and StoredObject records of gone files are dropped so new downloads aren't
+    linked to them. Only keys under indexed folders are judged. The index is a snapshot, so
+    records created after their folder was listed are skipped and every key it lacks is
+    confirmed missing with a HEAD request before anything changes. Returns counts per fix.
+    """
+    index = await indexed_keys()
+    folders = indexed_folders()
+    listed_at = await _listed_at(folders)
+
+    async def is_gone(key: str, created_at: datetime | None) -> bool:
+        if key in index or not _is_indexed(key, folders):
+            return False
+        folder = next(f for f in folders if key.startswith(f))
+        if folder not in listed_at or (created_at and created_at > listed_at[folder]):
+            return False
+        return not await s3_client.object_exists(key)
+
+    fixed = {"sources_deleted": 0, "sizes_filled": 0, "thumbnails_cleared": 0, "stored_objects_deleted": 0}
+    collection = Video.get_motor_collection()
+    async for video in Video.find_all():
+        # Targeted $set per source, matched by s3_path, so a concurrent download or thumbnail run isn't overwritten.
+        update: dict = {}
+        array_filters: list[dict] = []
+        for i, source in enumerate(video.sources):
+            key = s3_key_from_path(source.s3_path)
+            if source.status == "deleted":
+                continue
+            if await is_gone(key, source.created_at):
+                update[f"sources.$[s{i}].status"] = "deleted"
+                fixed["sources_deleted"] += 1
+            elif key in index and not source.file_size:
+                update[f"sources.$[s{i}].file_size"] = index[key].size
+                fixed["sizes_filled"] += 1
+            else:
+                continue
+            array_filters.append({f"s{i}.s3_path": source.s3_path})
+        if update and not dry_run:
+            await collection.update_one({"_id": video.id}, {"$set": update}, array_filters=array_filters)
+        if video.thumbnail_s3_url:
+            thumbnail = str(video.thumbnail_s3_url)
+            checked_at = video.thumbnail_meta.checked_at if video.thumbnail_meta else None
+            if await is_gone(s3_key_from_path(thumbnail), checked_at):
+                fixed["thumbnails_cleared"] += 1
+                if not dry_run:
+                    # Only the URL that was judged gone; a thumbnail saved meanwhile stays.
+                    await collection.update_one(
+                        {"_id": video.id, "thumbnail_s3_url": thumbnail}, {"$set": {"thumbnail_s3_url": None}}
+                    )
+    async for stored in StoredObject.find_all():
+        if await is_gone(s3_key_from_path(stored.s3_path), stored.created_at):
+            fixed["stored_objects_deleted"] += 1
+            if not dry_run:
+                await stored.delete()
+    logger.info(f"[S3Index] ✓ Repair {'(dry run) ' if dry_run else ''}{fixed}")
+    return fixed
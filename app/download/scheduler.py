@@ -0,0 +1,230 @@
+import asyncio
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import AsyncIterator, Callable, Generic, Iterable, TypeVar
+from urllib.parse import urlparse
+
+import redis
+import redis.asyncio as aioredis
+from beanie import PydanticObjectId
+from loguru import logger
+from pydantic import BaseModel, Field
+
+from app.config import config
+from app.utils.csv_dump import RESOLUTIONS
+
+T = TypeVar("T")
+
+# Resolution a new guru download is expected to have. Videos with a source at least this good aren't candidates.
+TARGET_RESOLUTION = "1080p"
+COVERING_RESOLUTIONS = RESOLUTIONS[: RESOLUTIONS.index(TARGET_RESOLUTION) + 1]
+# Size estimate for videos with an unknown runtime.
+DEFAULT_RUNTIME_MINUTES = 120
+
+
+class DownloadCandidate(BaseModel):
+    """The fields of a Video the scheduler ranks on."""
+
+    id: PydanticObjectId = Field(alias="_id")
+    site: str = "unknown"
+    release_date: datetime | None = None
+    runtime_minutes: int | None = None
+    download_attempts: int = 0
+
+
+def priority_key(candidate: DownloadCandidate) -> tuple:
+    """
+    Sort key, lower first: fewer failed attempts, newer release, smaller estimated size
+    (runtime is the only size hint before the src is known).
+    """
+    released = candidate.release_date.timestamp() if candidate.release_date else float("-inf")
+    return (
+        candidate.download_attempts,
+        -released,
+        candidate.runtime_minutes or DEFAULT_RUNTIME_MINUTES,
+    )
+
+
+def schedule(candidates: Iterable[DownloadCandidate]) -> list[DownloadCandidate]:
+    """Order candidates by priority, taking turns between origin sites so one site can't fill a run."""
+    by_site: dict[str, deque[DownloadCandidate]] = defaultdict(deque)
+    for candidate in sorted(candidates, key=priority_key):
+        by_site[candidate.site].append(candidate)
+    queues = sorted(by_site.values(), key=lambda q: priority_key(q[0]))
+    ordered = []
+    while queues:
+        for queue in queues:
+            ordered.append(queue.popleft())
+        queues = [q for q in queues if q]
+    return ordered
+
+
+def url_host(url: str) -> str:
+    return urlparse(url).hostname or ""
+
+
+class TransferScheduler(Generic[T]):
+    """
+    Hands resolved downloads to transfer workers, at most host_concurrency at a time per CDN host.
+
+    Items are served in the order they were put (the claim order, i.e. priority); an item whose
+    host is saturated waits while items for other hosts go ahead, so one slow host can't take
+    every transfer slot. At most `capacity` items wait at once; put() blocks beyond that.
+    """
+
+    def __init__(self, capacity: int, host_concurrency: int = config.DOWNLOAD_HOST_CONCURRENCY) -> None:
+        self.capacity = max(capacity, 1)
+        self.host_concurrency = max(host_concurrency, 1)
+        self._waiting: list[tuple[str, T]] = []
+        self._active: dict[str, int] = defaultdict(int)
+        self._closed = False
+        self._changed = asyncio.Condition()
+
+    async def put(self, url: str, item: T) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: len(self._waiting) < self.capacity)
+            self._waiting.append((url_host(url), item))
+            self._changed.notify_all()
+
+    async def close(self) -> None:
+        """No more items will be put; get() returns None once the waiting ones are handed out."""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    async def get(self) -> tuple[str, T] | None:
+        """Take the first waiting item whose host has a free slot; release(host) when its transfer ends."""
+        async with self._changed:
+            while True:
+                for i, (host, item) in enumerate(self._waiting):
+                    if self._active[host] < self.host_concurrency:
+                        del self._waiting[i]
+                        self._active[host] += 1
+                        self._changed.notify_all()
+                        return host, item
+                if self._closed and not self._waiting:
+                    return None
+                await self._changed.wait()
+
+    async def release(self, host: str) -> None:
+        async with self._changed:
+            self._active[host] -= 1
+            self._changed.notify_all()
+
+
+class HostLimits:
+    """
+    Transfer slots and bandwidth per CDN host, shared by every download worker through Redis.
+
+    A transfer holds one of `concurrency` slot keys of its host. Slots are set NX with a lease
+    that is renewed while the transfer runs, so the slot of a crashed worker frees itself.
+    Bandwidth is counted in one-second windows: a reader reserves bytes in the current window,
+    in quanta so not every chunk is a round trip, and waits for the next window once it is full.
+    If Redis is unreachable transfers go ahead without limits.
+    """
+
+    PREFIX = "download_host"
+    LEASE = 60
+    POLL = 1.0
+
+    def __init__(
+        self,
+        concurrency: int = config.DOWNLOAD_HOST_CONCURRENCY,
+        rate: int = config.DOWNLOAD_HOST_BANDWIDTH,
+        redis_url: str = config.REDIS_DSN.unicode_string(),
+        client: Callable[[], aioredis.Redis] | None = None,
+    ) -> None:
+        self.concurrency = max(concurrency, 1)
+        self.rate = rate
+        self.quantum = max(rate // 20, 1)
+        self._client_factory = client or (lambda: aioredis.Redis.from_url(redis_url))
+        self._client: aioredis.Redis | None = None
+        self._credit: dict[str, int] = defaultdict(int)
+
+    @property
+    def client(self) -> aioredis.Redis:
+        # Created lazily inside the running loop; close() drops it at the end of each asyncio.run.
+        if self._client is None:
+            self._client = self._client_factory()
+        return self._client
+
+    async def close(self) -> None:
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
+        self._credit.clear()
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """Hold a transfer slot of url's host for the duration of the block."""
+        held = await self._acquire(url_host(url))
+        renewal = asyncio.create_task(self._renew(*held)) if held else None
+        try:
+            yield
+        finally:
+            if renewal:
+                renewal.cancel()
+            if held:
+                await self._release(*held)
+
+    async def _acquire(self, host: str) -> tuple[str, bytes] | None:
+        token = uuid.uuid4().hex.encode()
+        waiting = False
+        while True:
+            try:
+                for i in range(self.concurrency):
+                    key = f"{self.PREFIX}:{host}:slot:{i}"
+                    if await self.client.set(key, token, nx=True, ex=self.LEASE):
+                        return key, token
+            except redis.RedisError as e:
+                logger.warning(f"[HostLimits] No slot check for {host}, transferring anyway: {e}")
+                return None
+            if not waiting:
+                logger.info(f"[HostLimits] {host} is at {self.concurrency} transfers, waiting for a slot")
+                waiting = True
+            await asyncio.sleep(self.POLL)
+
+    async def _renew(self, key: str, token: bytes) -> None:
+        while True:
+            await asyncio.sleep(self.LEASE / 3)
+            try:
+                if await self.client.get(key) == token:
+                    await self.client.expire(key, self.LEASE)
+            except redis.RedisError as e:
+                logger.warning(f"[HostLimits] Failed to renew {key}: {e}")
+
+    async def _release(self, key: str, token: bytes) -> None:
+        try:
+            if await self.client.get(key) == token:
+                await self.client.delete(key)
+        except redis.RedisError as e:
+            logger.warning(f"[HostLimits] Failed to release {key}, it expires in {self.LEASE}s: {e}")
+
+    async def throttle(self, url: str, nbytes: int) -> None:
+        """Wait until nbytes more may be read from url's host."""
+        if self.rate <= 0:
+            return
+        host = url_host(url)
+        while self._credit[host] < nbytes:
+            want = max(nbytes - self._credit[host], self.quantum)
+            window = int(time.time())
+            key = f"{self.PREFIX}:{host}:bytes:{window}"
+            try:
+                used = await self.client.incrby(key, want)
+                await self.client.expire(key, 2)
+                # A window that wasn't full yet admits the whole reservation, so chunks bigger than rate still pass.
+                if used - want < self.rate:
+                    self._credit[host] += want
+                    break
+                await self.client.decrby(key, want)
+            except redis.RedisError as e:
+                logger.warning(f"[HostLimits] No bandwidth check for {host}, reading anyway: {e}")
+                return
+            await asyncio.sleep(max(window + 1 - time.time(), 0))
+        self._credit[host] -= nbytes
+
+
+host_limits = HostLimits()
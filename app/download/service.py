@@ -1,71 +1,105 @@
+import asyncio
 import hashlib
-import tempfile
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
 from io import BytesIO
+from typing import AsyncIterator, Mapping
 
 import aiohttp
+from beanie import PydanticObjectId
+from beanie.operators import In
 from loguru import logger
-from pymediainfo import MediaInfo
+from pydantic import BaseModel, Field
 from pymongo.errors import DuplicateKeyError
 from selenium.webdriver.common.by import By
 
 from app.config import config
 from app.db.database import init_mongo
-from app.db.models import Video, VideoSource
-from app.download.exceptions import DownloadFailedException
+from app.db.models import DownloadProgress, MediaProbe, StoredObject, UploadedPart, Video, VideoSource
+from app.download.dedupe import find_stored_object, register_stored_object
+from app.download.exceptions import DownloadFailedException, ResumeRejectedException
+from app.download.probe import probe_media_async, probe_remote
+from app.download.resolver import SrcResolver
+from app.download.scheduler import COVERING_RESOLUTIONS, DownloadCandidate, TransferScheduler, host_limits, schedule
+from app.download.segments import SegmentedFetcher
+from app.download.spool import SpooledBuffer
+from app.download.transport import download_transport
+from app.download.utils import MediaWindow
 from app.infra.s3 import s3
-from app.parser.driver import SeleniumDriver
+from app.parser.driver import get_driver_pool
 from app.parser.interactions import SeleniumService
 from app.parser.sites.guru import GuruAdapter
+from app.utils.csv_dump import CSVDump
 
 
 class GuruDownloader:
     """
-    Video -> page_link -> open -> _extract_video_src() -> download -> update Video -> upload to S3
+    Video -> page_link -> resolve src (HTTP, then browser) -> download -> update Video -> upload to S3
+
+    Without a resolver the page is always opened in the given SeleniumService.
     """
 
-    def __init__(self, selenium: SeleniumService, parser: GuruAdapter) -> None:
+    def __init__(
+        self,
+        selenium: SeleniumService | None,
+        parser: GuruAdapter,
+        mode: str = config.DOWNLOAD_MODE,
+        segments: int = config.DOWNLOAD_SEGMENTS,
+        spool_max_memory: int = config.SPOOL_MAX_MEMORY,
+        preprobe: bool = config.DOWNLOAD_PREPROBE,
+        resolver: SrcResolver | None = None,
+    ) -> None:
         self.selenium = selenium
+        self.resolver = resolver
         self.parser = parser
+        self.mode = mode
+        self.segments = segments
+        self.spool_max_memory = spool_max_memory
+        self.preprobe = preprobe
 
     async def __call__(self, video: Video) -> bool:
+        src = await self.resolve(video)
+        return bool(src) and await self.transfer(video, src)
+
+    async def resolve(self, video: Video) -> str | None:
+        """Find the playable src of the video page; None if it can't be resolved."""
         page_url = str(video.page_link)
         try:
-            self.selenium.get(page_url, wait_selector=(By.XPATH, "//div[contains(@class,'inside-article')]"))  # type: ignore
-            src = self.parser._extract_video_src(self.selenium, timeout_sec=2)
-            if not src:
-                logger.error(f"No video src on {page_url}")
-                return False
+            if self.resolver:
+                src = await self.resolver.resolve(page_url)
+            else:
+                src = self.resolve_in_browser(self.selenium, self.parser, page_url)  # type: ignore
+        except Exception as e:
+            logger.exception(e)
+            src = None
+        if not src:
+            logger.error(f"No video src on {page_url}")
+        return src
 
-            buf = await self._download_to_buffer(src)
-            if not buf.getbuffer().nbytes:
-                logger.error(f"empty buffer {page_url}")
+    async def transfer(self, video: Video, src: str) -> bool:
+        """Download src into S3 and attach the new source to the video."""
+        try:
+            if self.preprobe and not video.download_progress and await self._is_low_value(src, video):
+                video.javguru_status = "skipped"
                 return False
 
-            file_size = buf.getbuffer().nbytes
-            md5 = hashlib.md5(buf.getbuffer()).hexdigest()
-
-            s3_filename = f"{video.jav_code}_{md5}.mp4"
-            s3_key = f"{config.S3_JAVGURU_FOLDER}/{s3_filename}".lstrip("/")
-            buf.seek(0)
-            await s3.put_object(buf, s3_key)
-
-            s3_path = f"https://{config.S3_ENDPOINT}/{config.S3_BUCKET}/{s3_key}"
-            resolution = self._detect_resolution(buf, s3_filename)
-            runtime_minutes = self._detect_runtime(buf, s3_filename)
-
-            video.runtime_minutes = runtime_minutes
+            async with host_limits.slot(src):
+                if self.mode == "stream":
+                    source = await self._stream_to_s3(src, video)
+                elif self.mode == "spool":
+                    source = await self._spool_to_s3(src, video.jav_code)
+                else:
+                    source = await self._buffer_to_s3(src, video.jav_code)
+            if not source:
+                logger.error(f"empty buffer {video.page_link}")
+                return False
 
-            source = VideoSource(
-                origin="guru",
-                resolution=resolution,
-                s3_path=s3_path,
-                file_name=s3_filename,
-                file_size=file_size,
-                hash_md5=md5,
-            )
+            video.runtime_minutes = source.probe.runtime_minutes if source.probe else None
             video.sources.append(source)
             await video.save()
-            logger.success(f"OK {s3_filename} | {file_size} bytes | {resolution}")
+            logger.success(f"OK {source.file_name} | {source.file_size} bytes | {source.resolution}")
             return True
         except (DownloadFailedException, DuplicateKeyError) as e:
             logger.error(f"{type(e).__name__}: {e}")
@@ -73,115 +107,488 @@ class GuruDownloader:
             logger.exception(e)
         return False
 
-    async def _download_to_buffer(self, url: str, timeout_sec: int = 3600) -> BytesIO:
-        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout_sec)) as session:
-            async with session.get(url, ssl=False) as response:
-                if response.status != 200:
-                    raise DownloadFailedException(f"HTTP {response.status} {url}")
-                buf = BytesIO()
-                async for chunk in response.content.iter_chunked(64 * 1024):
-                    buf.write(chunk)
-                buf.seek(0)
-                return buf
+    @staticmethod
+    def resolve_in_browser(selenium: SeleniumService, parser: GuruAdapter, page_url: str) -> str | None:
+        if config.BROWSER_EARLY_RETURN and (src := selenium.get_media_url(page_url)):
+            return src
+        selenium.get(page_url, wait_selector=(By.XPATH, "//div[contains(@class,'inside-article')]"))  # type: ignore
+        return parser._extract_video_src(selenium, timeout_sec=2)
+
+    @staticmethod
+    async def _is_low_value(src: str, video: Video) -> bool:
+        """Probe the remote file's metadata and tell whether CSVDump would never export it."""
+        try:
+            probe = await asyncio.wait_for(probe_remote(download_transport.session(src), src), timeout=120)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Pre-download probe failed, downloading anyway {src}: {type(e).__name__} {e}")
+            return False
+        if not probe or not probe.height or CSVDump.would_import(video.sources, probe.resolution):
+            return False
+        logger.info(f"Skip {video.jav_code}: remote file is {probe.resolution}, it wouldn't be imported")
+        return True
+
+    @staticmethod
+    def _s3_key(s3_filename: str) -> str:
+        return f"{config.S3_JAVGURU_FOLDER}/{s3_filename}".lstrip("/")
 
     @staticmethod
-    def _detect_runtime(buf: BytesIO, s3_filename: str) -> int | None:
+    def _s3_path(s3_key: str) -> str:
+        return f"https://{config.S3_ENDPOINT}/{config.S3_BUCKET}/{s3_key}"
+
+    async def _register_upload(self, md5: str, s3_key: str, s3_filename: str, file_size: int) -> StoredObject:
+        """Record a fresh upload; if the same file was stored meanwhile under another key, drop ours."""
+        stored = await register_stored_object(md5, self._s3_path(s3_key), "guru", s3_filename, file_size)
+        if stored.s3_path != self._s3_path(s3_key):
+            logger.info(f"{s3_filename} was stored concurrently as {stored.s3_path}, removing the duplicate")
+            await s3.delete_object(s3_key)
+        return stored
+
+    @staticmethod
+    def _make_source(stored: StoredObject, probe: MediaProbe, file_size: int) -> VideoSource:
+        return VideoSource(
+            origin="guru",
+            resolution=probe.resolution,
+            s3_path=stored.s3_path,
+            file_name=stored.file_name,
+            file_size=file_size,
+            hash_md5=stored.hash_md5,
+            probe=probe,
+        )
+
+    async def _buffer_to_s3(self, src: str, jav_code: str) -> VideoSource | None:
+        """Download the whole video into memory, then upload it with a single PutObject."""
+        buf = await self._download_to_buffer(src)
+        if not buf.getbuffer().nbytes:
+            return None
+
+        file_size = buf.getbuffer().nbytes
+        md5 = hashlib.md5(buf.getbuffer()).hexdigest()
+
+        s3_filename = f"{jav_code}_{md5}.mp4"
+        if stored := await find_stored_object(md5):
+            logger.info(f"{s3_filename} is already stored as {stored.s3_path}, upload skipped")
+        else:
+            s3_key = self._s3_key(s3_filename)
+            buf.seek(0)
+            await s3.put_object(buf, s3_key)
+            stored = await self._register_upload(md5, s3_key, s3_filename, file_size)
+
+        probe = await probe_media_async(buf, s3_filename)
+        return self._make_source(stored, probe, file_size)
+
+    async def _spool_to_s3(self, src: str, jav_code: str) -> VideoSource | None:
         """
-        Parse video buffer with pymediainfo and return runtime in minutes.
+        Download into a SpooledBuffer: memory up to SPOOL_MAX_MEMORY, a single temp file above it.
 
-        Runtime is extracted from track.duration (milliseconds → minutes).
-        If not detected or parsing fails, returns None.
+        Hashing and the multipart upload read the data back through a memoryview/mmap,
+        and MediaInfo parses the temp file by path instead of copying it again.
         """
-        try:
-            buf.seek(0)
-            media_info = MediaInfo.parse(buf)
-            for track in media_info.tracks:
-                if track.track_type == "Video" and track.duration:
-                    return int(track.duration / 60000)
-        except Exception:
-            with tempfile.NamedTemporaryFile(delete=True) as tmp_file:
-                buf.seek(0)
-                tmp_file.write(buf.read())
-                tmp_file.flush()
-                media_info = MediaInfo.parse(tmp_file.name)
-                for track in media_info.tracks:
-                    if track.track_type == "Video" and track.duration:
-                        return int(track.duration / 60000)
-
-        logger.warning(f"runtime not detected {s3_filename}")
-        return None
+        with SpooledBuffer(max_memory=self.spool_max_memory) as spool:
+            async for chunk in self._iter_download(src):
+                spool.write(chunk)
+            if not spool.size:
+                return None
 
-    @staticmethod
-    def _detect_resolution(buf: BytesIO, s3_filename: str) -> str:
+            md5 = await asyncio.to_thread(spool.md5)
+            s3_filename = f"{jav_code}_{md5}.mp4"
+            if stored := await find_stored_object(md5):
+                logger.info(f"{s3_filename} is already stored as {stored.s3_path}, upload skipped")
+            else:
+                s3_key = self._s3_key(s3_filename)
+                async with s3.multipart_upload(s3_key) as upload:
+                    with spool.view() as view:
+                        for offset in range(0, spool.size, upload.part_size):
+                            await upload.write(view[offset : offset + upload.part_size])
+                stored = await self._register_upload(md5, s3_key, s3_filename, spool.size)
+
+            probe = await probe_media_async(spool, s3_filename)  # type: ignore
+            return self._make_source(stored, probe, spool.size)
+
+    async def _stream_to_s3(self, src: str, video: Video) -> VideoSource | None:
         """
-        Parse video buffer with pymediainfo and return resolution label.
+        Pipe HTTP chunks straight into an S3 multipart upload.
+
+        MD5 and size are computed as the bytes pass through, and only the head and tail
+        of the file are kept for media probing. The object is uploaded under a staging key
+        and moved server-side to {jav_code}_{md5}.mp4 once the hash is known. If a file with
+        that hash is already stored, the upload is aborted instead of completed.
 
-        Resolution is derived from track.height and normalized to:
-        "480p", "720p", "1080p", "2k", or "4k".
-        If not detected, returns "unknown".
+        Every uploaded part is recorded in video.download_progress, so a failed attempt
+        is continued from the last confirmed offset with a Range request.
         """
-        height = None
-        try:
-            buf.seek(0)
-            media_info = MediaInfo.parse(buf)
-            for track in media_info.tracks:
-                if track.track_type == "Video" and track.height:
-                    height = track.height
-                    break
+        progress = await self._resume_point(video)
+        if progress:
+            try:
+                return await self._stream_attempt(src, video, progress)
+            except ResumeRejectedException as e:
+                logger.warning(f"Cannot resume {video.jav_code}: {e}. Restarting from zero.")
+                await s3.abort_multipart_upload(progress.staging_key, progress.upload_id)
+
+        progress = DownloadProgress(staging_key=self._s3_key(f"{video.jav_code}_{uuid.uuid4().hex}.part"))
+        return await self._stream_attempt(src, video, progress)
+
+    async def _stream_attempt(self, src: str, video: Video, progress: DownloadProgress) -> VideoSource | None:
+        resumed = progress.bytes_received > 0
+        md5 = hashlib.md5()
+        window = MediaWindow()
+        stored: StoredObject | None = None
+
+        async def on_part(part_number: int, etag: str, size: int) -> None:
+            progress.parts.append(UploadedPart(part_number=part_number, etag=etag, size=size))
+            progress.bytes_received += size
+            await self._save_progress(video, progress)
+
+        async with s3.multipart_upload(
+            progress.staging_key,
+            upload_id=progress.upload_id or None,
+            parts=[{"PartNumber": p.part_number, "ETag": p.etag} for p in progress.parts],
+            on_part=on_part,
+            abort_on_error=False,
+        ) as upload:
+            if not progress.upload_id:
+                progress.upload_id = upload.upload_id  # type: ignore
+                await self._save_progress(video, progress)
+            if progress.total_size and progress.bytes_received >= progress.total_size:
+                # Every part is confirmed, only completing the upload failed last time.
+                logger.info(f"All {progress.total_size} bytes of {video.jav_code} are uploaded, completing")
             else:
-                logger.warning(f"resolution not detected {s3_filename}")
-                return "unknown"
-
-        except Exception:
-            with tempfile.NamedTemporaryFile(delete=True) as tmp_file:
-                buf.seek(0)
-                tmp_file.write(buf.read())
-                tmp_file.flush()
-
-                media_info = MediaInfo.parse(tmp_file.name)
-                for track in media_info.tracks:
-                    if track.track_type == "Video" and track.height:
-                        height = track.height
-                        break
-                else:
-                    logger.warning(f"resolution not detected {s3_filename}")
-                    return "unknown"
+                async for chunk in self._iter_download(src, start=progress.bytes_received, progress=progress):
+                    if not resumed:
+                        md5.update(chunk)
+                        window.feed(chunk)
+                    await upload.write(chunk)
+            if not progress.bytes_received and not upload.pending:
+                await upload.abort()
+                await self._save_progress(video, None)
+                return None
+            if not resumed and (stored := await find_stored_object(md5.hexdigest())):
+                progress.bytes_received += upload.pending
+                await upload.abort()
 
-        if height <= 480:
-            return "480p"
-        if height <= 720:
-            return "720p"
-        if height <= 1080:
-            return "1080p"
-        if height <= 1440:
-            return "2k"
-        return "4k"
+        file_size = progress.bytes_received
+        await self._save_progress(video, None)
+        if resumed:
+            # Part of the file came from an earlier attempt, so hash and probe the assembled object instead.
+            md5, window = await self._scan_uploaded(progress.staging_key)
+            if stored := await find_stored_object(md5.hexdigest()):
+                await s3.delete_object(progress.staging_key)
 
+        s3_filename = f"{video.jav_code}_{md5.hexdigest()}.mp4"
+        if stored:
+            logger.info(f"{s3_filename} is already stored as {stored.s3_path}, upload dropped")
+        else:
+            s3_key = self._s3_key(s3_filename)
+            await s3.move_object(progress.staging_key, s3_key, file_size)
+            stored = await self._register_upload(md5.hexdigest(), s3_key, s3_filename, file_size)
 
-async def run_download(video_id: str, origin_source: str, headless: bool) -> None:
-    await init_mongo()
+        with window.sparse_file(file_size) as probe_file:
+            probe = await probe_media_async(probe_file, s3_filename)
+        return self._make_source(stored, probe, file_size)
+
+    async def _resume_point(self, video: Video) -> DownloadProgress | None:
+        """Return the saved progress trimmed to the parts S3 actually holds, or None to start over."""
+        progress = video.download_progress
+        if not progress or not progress.upload_id:
+            return None
+
+        stored = await s3.list_parts(progress.staging_key, progress.upload_id)
+        if stored is None:
+            logger.warning(f"Multipart upload for {video.jav_code} is gone, starting over")
+            await self._save_progress(video, None)
+            return None
+
+        stored_etags = {part["PartNumber"]: part["ETag"] for part in stored}
+        confirmed: list[UploadedPart] = []
+        for part in sorted(progress.parts, key=lambda p: p.part_number):
+            if part.part_number != len(confirmed) + 1 or stored_etags.get(part.part_number) != part.etag:
+                break
+            confirmed.append(part)
+        progress.parts = confirmed
+        progress.bytes_received = sum(part.size for part in confirmed)
+        logger.info(f"Resuming {video.jav_code} from byte {progress.bytes_received} of {progress.total_size}")
+        return progress
+
+    @staticmethod
+    async def _save_progress(video: Video, progress: DownloadProgress | None) -> None:
+        if progress:
+            progress.updated_at = datetime.utcnow()
+        video.download_progress = progress
+        await Video.find_one(Video.id == video.id).update(
+            {"$set": {"download_progress": progress.model_dump() if progress else None}}
+        )
+
+    @staticmethod
+    async def _scan_uploaded(s3_key: str) -> tuple["hashlib._Hash", MediaWindow]:
+        md5 = hashlib.md5()
+        window = MediaWindow()
+        async for chunk in s3.iter_object(s3_key):
+            md5.update(chunk)
+            window.feed(chunk)
+        return md5, window
+
+    async def _iter_download(
+        self,
+        url: str,
+        start: int = 0,
+        progress: DownloadProgress | None = None,
+        timeout_sec: int = 3600,
+    ) -> AsyncIterator[bytes]:
+        session = download_transport.session(url)
+        timeout = aiohttp.ClientTimeout(total=timeout_sec)
+        if self.segments > 1:
+            fetcher = SegmentedFetcher(session, concurrency=self.segments)
+            total_size, ranged = await fetcher.probe(url)
+            if ranged and total_size and total_size - start > fetcher.segment_size:
+                self._record_total_size(progress, total_size, start, url)
+                async for chunk in fetcher.iter_range(url, start, total_size):
+                    await host_limits.throttle(url, len(chunk))
+                    yield chunk
+                return
+            if not ranged:
+                logger.info(f"No Range support, falling back to a single stream {url}")
+
+        headers = {"Range": f"bytes={start}-"} if start else None
+        async with session.get(url, ssl=False, headers=headers, timeout=timeout) as response:
+            if start and response.status == 200:
+                raise ResumeRejectedException(f"Range requests are not supported by {url}")
+            if response.status not in (200, 206):
+                raise DownloadFailedException(f"HTTP {response.status} {url}")
+            self._record_total_size(progress, self._total_size(response.headers, start), start, url)
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                await host_limits.throttle(url, len(chunk))
+                yield chunk
+
+    @staticmethod
+    def _record_total_size(progress: DownloadProgress | None, total_size: int | None, start: int, url: str) -> None:
+        if progress is None:
+            return
+        if start and progress.total_size and total_size != progress.total_size:
+            raise ResumeRejectedException(f"Size changed {progress.total_size} -> {total_size} {url}")
+        progress.total_size = total_size
+
+    @staticmethod
+    def _total_size(headers: Mapping[str, str], start: int) -> int | None:
+        content_range = headers.get("Content-Range", "")
+        if "/" in content_range and not content_range.endswith("/*"):
+            return int(content_range.rsplit("/", 1)[1])
+        if content_length := headers.get("Content-Length"):
+            return start + int(content_length)
+        return None
+
+    async def _download_to_buffer(self, url: str, timeout_sec: int = 3600) -> BytesIO:
+        buf = BytesIO()
+        async for chunk in self._iter_download(url, timeout_sec=timeout_sec):
+            buf.write(chunk)
+        buf.seek(0)
+        return buf
+
+
+class _VideoId(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+
+
+def downloadable() -> dict:
+    """Filter for videos a download run may claim."""
+    return {
+        # No source yet, or only lower-resolution ones that a guru download would replace in the export.
+        "sources": {
+            "$not": {
+                "$elemMatch": {
+                    "status": {"$ne": "deleted"},
+                    "$or": [{"origin": "guru"}, {"resolution": {"$in": COVERING_RESOLUTIONS}}],
+                }
+            }
+        },
+        # Missing on videos created before attempts were counted, hence $not rather than $lt.
+        "download_attempts": {"$not": {"$gte": config.DOWNLOAD_MAX_ATTEMPTS}},
+        "$or": [
+            {"javguru_status": "parsed"},
+            # Interrupted streaming downloads continue from the last uploaded part.
+            {"javguru_status": "failed", "download_progress": {"$ne": None}},
+            # Claims whose task was lost or whose worker died mid-download.
+            {
+                "javguru_status": "downloading",
+                "claimed_at": {"$lt": datetime.utcnow() - timedelta(seconds=config.DOWNLOAD_CLAIM_TIMEOUT)},
+            },
+        ],
+    }
+
+
+async def claim_videos_for_download(limit: int, window: int = 5) -> tuple[str, list[str]]:
+    """
+    Atomically move up to `limit` downloadable videos to "downloading" under a new claim token.
+
+    `limit * window` candidates are ranked by the scheduler (priority keys, turns between sites)
+    and the best `limit` are claimed. The status change and the token are written in one update
+    whose filter repeats the selection criteria, so a video picked by two overlapping runs is
+    claimed by only one. Returns the token and the claimed ids in priority order.
+    """
+    claim = uuid.uuid4().hex
+    candidates = (
+        await Video.find(downloadable())
+        .sort(+Video.download_attempts, -Video.release_date)
+        .limit(limit * window)
+        .project(DownloadCandidate)
+        .to_list()
+    )
+    picked = [c.id for c in schedule(candidates)[:limit]]
+    if not picked:
+        return claim, []
+    await Video.find(In(Video.id, picked), downloadable()).update(
+        {"$set": {"javguru_status": "downloading", "download_claim": claim, "claimed_at": datetime.utcnow()}}
+    )
+    claimed = {c.id for c in await Video.find(Video.download_claim == claim).project(_VideoId).to_list()}
+    return claim, [str(video_id) for video_id in picked if video_id in claimed]
+
+
+async def release_claim(claim: str) -> int:
+    """Hand videos of a claim whose tasks were never sent back to the pool. Returns how many."""
+    result = await Video.find(Video.download_claim == claim, Video.javguru_status == "downloading").update(
+        {"$set": {"javguru_status": "parsed", "download_claim": None, "claimed_at": None}}
+    )
+    released = result.modified_count if result else 0
+    logger.warning(f"Released {released} videos of claim {claim}")
+    return released
+
+
+@dataclass
+class ResolvedSrc:
+    """A resolved video src waiting for transfer. CDN links are signed and expire, so they carry a deadline."""
+
+    video: Video
+    url: str
+    ttl: int = config.SRC_TTL
+    resolved_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() - self.resolved_at > self.ttl
+
+
+async def _start_download(video_id: str, claim: str | None) -> Video | None:
     video = await Video.get(video_id)
     if not video:
-        raise ValueError(f"No video {video_id} found in DB!")
-    if origin_source == "guru":
-        if video.javguru_status != "parsed":
+        logger.error(f"No video {video_id} found in DB!")
+        return None
+    if claim:
+        if video.download_claim != claim or video.javguru_status != "downloading":
+            logger.info(f"Video {video_id} is no longer held by claim {claim}. Download rejected.")
+            return None
+    else:
+        resumable = (
+            video.javguru_status == "failed"
+            and video.download_progress
+            and video.download_attempts < config.DOWNLOAD_MAX_ATTEMPTS
+        )
+        if video.javguru_status != "parsed" and not resumable:
             logger.info(f"Video {video_id} has javguru status {video.javguru_status}. Download rejected.")
-            return
-        video.javguru_status = "downloading"
-        await video.save()
-        with SeleniumDriver(headless=headless) as driver:
-            selenium = SeleniumService(driver)
-            adapter = GuruAdapter()
-            downloader = GuruDownloader(selenium, adapter)
-            success = await downloader(video=video)
-        if success:
-            video.javguru_status = "downloaded"
-            await video.save()
-            return
+            return None
+    video.javguru_status = "downloading"
+    video.claimed_at = datetime.utcnow()  # stale-claim timeout counts from the start of the download
+    video.download_attempts += 1
+    await video.save()
+    return video
+
+
+async def _finish_download(video: Video, success: bool) -> None:
+    video.download_claim = None
+    video.claimed_at = None
+    if success:
+        video.javguru_status = "downloaded"
+    elif video.javguru_status != "skipped":
         video.javguru_status = "failed"
-        await video.save()
-        return
+    progress = video.download_progress
+    if not success and progress and video.download_attempts >= config.DOWNLOAD_MAX_ATTEMPTS:
+        # Out of attempts, nothing will resume it: open uploads are billed and invisible to listings.
+        logger.warning(f"Giving up on {video.jav_code} after {video.download_attempts} attempts")
+        if progress.upload_id:
+            await s3.abort_multipart_upload(progress.staging_key, progress.upload_id)
+        video.download_progress = None
+    await video.save()
+
+
+def make_guru_downloader(headless: bool) -> GuruDownloader:
+    adapter = GuruAdapter()
+
+    def resolve_with_browser(page_url: str) -> str | None:
+        # A browser is leased only when the page can't be resolved over plain HTTP.
+        with get_driver_pool(headless).lease() as driver:
+            return GuruDownloader.resolve_in_browser(SeleniumService(driver), adapter, page_url)
+
+    return GuruDownloader(None, adapter, resolver=SrcResolver(fallback=resolve_with_browser))
+
+
+async def run_download_pipeline(
+    video_ids: list[str],
+    downloader: GuruDownloader,
+    claim: str | None = None,
+    transfers: int = config.DOWNLOAD_TRANSFERS,
+    lookahead: int = config.DOWNLOAD_LOOKAHEAD,
+    src_ttl: int = config.SRC_TTL,
+    host_concurrency: int = config.DOWNLOAD_HOST_CONCURRENCY,
+) -> None:
+    """
+    Resolve and transfer a batch of videos as two overlapping stages.
+
+    One stage resolves src URLs (HTTP or the browser pool) ahead of time, the other streams
+    resolved URLs to S3 with `transfers` concurrent downloads. A TransferScheduler holding up to
+    `lookahead` items joins them, so the browser works on the next pages while the link is busy
+    with the current file, and no CDN host gets more than `host_concurrency` of the transfers.
+    A src that waited longer than its TTL is resolved again before the transfer.
+    """
+    transfers = max(transfers, 1)
+    resolved: TransferScheduler[ResolvedSrc] = TransferScheduler(lookahead, host_concurrency)
+
+    async def resolve_stage() -> None:
+        try:
+            for video_id in video_ids:
+                video = await _start_download(video_id, claim)
+                if not video:
+                    continue
+                src = await downloader.resolve(video)
+                if not src:
+                    await _finish_download(video, False)
+                    continue
+                await resolved.put(src, ResolvedSrc(video, src, ttl=src_ttl))
+        finally:
+            await resolved.close()
+
+    async def transfer_stage() -> None:
+        while (next_item := await resolved.get()) is not None:
+            host, item = next_item
+            try:
+                src: str | None = item.url
+                if item.expired:
+                    logger.info(f"Src of {item.video.jav_code} is older than {item.ttl}s, resolving again")
+                    src = await downloader.resolve(item.video)
+                success = bool(src) and await downloader.transfer(item.video, src)  # type: ignore
+                await _finish_download(item.video, success)
+            finally:
+                await resolved.release(host)
+
+    await asyncio.gather(resolve_stage(), *(transfer_stage() for _ in range(transfers)))
+
+
+async def run_download(video_id: str, origin_source: str, headless: bool, claim: str | None = None) -> None:
+    await init_mongo()
+    if origin_source == "guru":
+        try:
+            async with s3:
+                await run_download_pipeline([video_id], make_guru_downloader(headless), claim, transfers=1, lookahead=1)
+        finally:
+            await download_transport.close()
+            await host_limits.close()
 
     elif origin_source == "pornolab":
         # TODO: implement a mechanism to send a task to the Pornolab downloader.
         pass
+
+
+async def run_download_batch(video_ids: list[str], headless: bool, claim: str | None = None) -> None:
+    await init_mongo()
+    try:
+        async with s3:
+            await run_download_pipeline(video_ids, make_guru_downloader(headless), claim)
+    finally:
+        await download_transport.close()
+        await host_limits.close()
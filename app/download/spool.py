@@ -0,0 +1,83 @@
+import hashlib
+import mmap
+import tempfile
+from contextlib import contextmanager
+from io import BytesIO
+from typing import BinaryIO, Iterator
+
+from app.config import config
+
+
+class SpooledBuffer:
+    """
+    Download target with a memory ceiling.
+
+    Bytes are kept in memory until max_memory is exceeded, then moved once to a named temp file.
+    Readers get a zero-copy view (memoryview or mmap) for hashing and uploading, and MediaInfo
+    can parse the file by its path, so the data touches disk at most once.
+    """
+
+    def __init__(self, max_memory: int = config.SPOOL_MAX_MEMORY) -> None:
+        self.max_memory = max_memory
+        self.size = 0
+        self._file: BinaryIO = BytesIO()
+        self._path: str | None = None
+
+    def __enter__(self) -> "SpooledBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    @property
+    def name(self) -> str | None:
+        """Path of the backing temp file, None while the data is still in memory."""
+        return self._path
+
+    @property
+    def rolled_over(self) -> bool:
+        return self._path is not None
+
+    def write(self, data: bytes) -> int:
+        if not self.rolled_over and self.size + len(data) > self.max_memory:
+            self._rollover()
+        written = self._file.write(data)
+        self.size += written
+        return written
+
+    def _rollover(self) -> None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".mp4")
+        tmp.write(self._file.getbuffer())  # type: ignore
+        self._file.close()
+        self._file = tmp  # type: ignore
+        self._path = tmp.name
+
+    def read(self, size: int = -1) -> bytes:
+        return self._file.read(size)
+
+    def seek(self, offset: int, whence: int = 0) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    @contextmanager
+    def view(self) -> Iterator[memoryview | mmap.mmap]:
+        """Read-only view over everything written so far; no writes are allowed while it is open."""
+        if not self.rolled_over:
+            with self._file.getbuffer() as view:  # type: ignore
+                yield view
+            return
+        self._file.flush()
+        if not self.size:
+            yield memoryview(b"")
+            return
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+    def md5(self) -> str:
+        with self.view() as view:
+            return hashlib.md5(view).hexdigest()
+
+    def close(self) -> None:
+        self._file.close()
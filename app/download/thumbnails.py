@@ -1,65 +1,254 @@
 import asyncio
+import hashlib
 import io
+import time
+from dataclasses import dataclass
 
-import httpx
+import aiohttp
+from beanie import PydanticObjectId
 from loguru import logger
+from pydantic import BaseModel, Field, HttpUrl
 
 from app.config import config
-from app.db.models import Video
+from app.db.bulk import BulkSetWriter
+from app.db.models import S3ObjectEntry, ThumbnailDerivative, ThumbnailMeta, Video
+from app.download.derivatives import DerivativeRenderer
+from app.download.exceptions import DownloadFailedException
+from app.download.s3_index import folder_prefix, indexed_keys, s3_key_from_path
+from app.download.transport import DownloadTransport, download_transport
 from app.infra.s3 import s3
 
 
+class PendingThumbnail(BaseModel):
+    """The only Video fields the saver reads."""
+
+    id: PydanticObjectId = Field(alias="_id")
+    jav_code: str
+    thumbnail_url: HttpUrl
+    thumbnail_s3_url: HttpUrl | None = None
+    thumbnail_meta: ThumbnailMeta | None = None
+
+
+@dataclass
+class ThumbnailStats:
+    saved: int = 0
+    shared: int = 0
+    linked: int = 0
+    unchanged: int = 0
+    failed: int = 0
+
+    @property
+    def processed(self) -> int:
+        return self.saved + self.shared + self.linked + self.unchanged + self.failed
+
+
 class ThumbnailSaver:
-    def __init__(self, s3_client=s3):
+    """
+    Download posters of videos without thumbnail_s3_url and store them in S3.
+
+    A projection-only cursor feeds a bounded queue, so memory stays flat however large the
+    backlog is, and a fixed number of workers drain it. A failing thumbnail is logged and
+    counted without stopping the others. The new URLs are written in bulk `$set` batches every
+    flush_items videos or flush_seconds. Progress is logged every progress_every items;
+    since finished videos drop out of the query, an interrupted run simply continues.
+
+    Posters are stored under their MD5, so byte-identical images share one S3 object (and one
+    set of derivatives); the hash, ETag and Last-Modified go to Video.thumbnail_meta. With
+    refresh=True the saver instead revisits videos that already have a thumbnail, sends a
+    conditional request built from that metadata and re-uploads only posters whose content changed.
+    """
+
+    def __init__(
+        self,
+        s3_client=s3,
+        transport: DownloadTransport = download_transport,
+        workers: int = config.THUMBNAIL_WORKERS,
+        progress_every: int = 500,
+        renderer: DerivativeRenderer | None = None,
+        flush_items: int = config.THUMBNAIL_FLUSH_ITEMS,
+        flush_seconds: float = config.THUMBNAIL_FLUSH_SECONDS,
+        refresh: bool = False,
+    ):
         self._s3 = s3_client
+        self._transport = transport
+        self._renderer = renderer or DerivativeRenderer()
+        self._updates = BulkSetWriter(Video, flush_items, flush_seconds)
+        self.workers = max(workers, 1)
+        self.progress_every = progress_every
+        self.refresh = refresh
+        self._indexed: dict[str, S3ObjectEntry] = {}
+        self._stored: dict[str, int] = {}
+        self._stats = ThumbnailStats()
+        self._started = 0.0
+
+    async def __call__(self) -> ThumbnailStats:
+        self._stats = ThumbnailStats()
+        self._started = time.monotonic()
+        # Thumbnails the bucket already holds (per the S3 index) are linked without re-uploading.
+        self._indexed = await indexed_keys(folder_prefix(config.S3_THUMBNAILS_FOLDER))
+        self._stored = {}
+        pending: asyncio.Queue[PendingThumbnail | None] = asyncio.Queue(maxsize=self.workers * 2)
+        action = "Refreshing" if self.refresh else "Saving"
+        logger.info(f"[Thumbnails] {action} thumbnails in S3 with {self.workers} workers")
+        with self._renderer:
+            async with self._updates:
+                await asyncio.gather(self._produce(pending), *(self._work(pending) for _ in range(self.workers)))
+        logger.info(f"[Thumbnails] ✓ Finished: {self._stats}, {self._updates.written} videos updated")
+        return self._stats
 
-    async def __call__(self, _semaphore: int = 5):
-        videos = await Video.find_many(
-            Video.thumbnail_url != None,  # noqa
-            Video.thumbnail_s3_url == None,  # noqa
-            fetch_links=True,
-        ).to_list()
-        if not videos:
-            logger.info("No videos found for ThumbnailServer.")
-            return
-        logger.info(f"Starting downloading and saving thumbnails for {len(videos)} videos on S3")
-        semaphore = asyncio.Semaphore(_semaphore)
-        async with httpx.AsyncClient(verify=False, timeout=30) as client:
-            tasks = [
-                self._download_and_save_thumbnail(
-                    client,
-                    semaphore,
-                    video.thumbnail_url.unicode_string(),  # type: ignore
-                    f"{video.jav_code.replace(' ', '').replace('/', '').lower()}.jpg",
-                    video,
+    async def _produce(self, pending: asyncio.Queue) -> None:
+        try:
+            if self.refresh:
+                linked = Video.thumbnail_s3_url != None  # noqa
+            else:
+                linked = Video.thumbnail_s3_url == None  # noqa
+            query = Video.find(Video.thumbnail_url != None, linked)  # noqa
+            async for item in query.sort(+Video.id).project(PendingThumbnail):
+                await pending.put(item)
+        finally:
+            for _ in range(self.workers):
+                await pending.put(None)
+
+    async def _work(self, pending: asyncio.Queue) -> None:
+        while (item := await pending.get()) is not None:
+            try:
+                outcome = await self._save_thumbnail(item)
+                setattr(self._stats, outcome, getattr(self._stats, outcome) + 1)
+            except Exception as e:
+                self._stats.failed += 1
+                logger.error(f"[Thumbnails] {item.jav_code}: {type(e).__name__} {e}")
+            if self._stats.processed % self.progress_every == 0:
+                rate = self._stats.processed / max(time.monotonic() - self._started, 1e-6)
+                logger.info(f"[Thumbnails] {self._stats} at {rate:.1f}/s, last {item.id}")
+
+    @staticmethod
+    def _file_stem(jav_code: str) -> str:
+        return jav_code.replace(" ", "").replace("/", "").lower()
+
+    @staticmethod
+    def _s3_url(s3_key: str) -> str:
+        return f"https://{config.S3_ENDPOINT}/{config.S3_BUCKET}/{s3_key}"
+
+    def _known_size(self, s3_key: str) -> int | None:
+        """Size of an object the bucket already holds, per the index or this run's uploads."""
+        if s3_key in self._stored:
+            return self._stored[s3_key]
+        entry = self._indexed.get(s3_key)
+        return entry.size if entry else None
+
+    def _derivative_keys(self, stem: str) -> dict[str, str]:
+        return {
+            spec.name: f"{config.S3_THUMBNAILS_FOLDER}/{stem}_{spec.width}.{spec.format}"
+            for spec in self._renderer.specs
+        }
+
+    def _stored_derivatives(self, keys: dict[str, str]) -> list[ThumbnailDerivative] | None:
+        """Derivatives that are all in the bucket already, or None if any is missing."""
+        sizes = [self._known_size(key) for key in keys.values()]
+        if any(size is None for size in sizes):
+            return None
+        return [
+            ThumbnailDerivative(name=spec.name, s3_url=self._s3_url(key), width=spec.width, size=size)
+            for spec, key, size in zip(self._renderer.specs, keys.values(), sizes)
+        ]
+
+    def _conditional_headers(self, item: PendingThumbnail) -> dict[str, str]:
+        meta = item.thumbnail_meta
+        if not self.refresh or not meta:
+            return {}
+        headers = {}
+        if meta.etag:
+            headers["If-None-Match"] = meta.etag
+        if meta.last_modified:
+            headers["If-Modified-Since"] = meta.last_modified
+        return headers
+
+    def _is_current(self, item: PendingThumbnail, md5: str) -> bool:
+        """Whether the linked poster already has this content."""
+        if item.thumbnail_meta:
+            return item.thumbnail_meta.md5 == md5
+        if not item.thumbnail_s3_url:
+            return False
+        # Posters saved before hashes were recorded: a single-part upload's S3 ETag is its MD5.
+        entry = self._indexed.get(s3_key_from_path(str(item.thumbnail_s3_url)))
+        return entry is not None and entry.etag == md5
+
+    async def _save_thumbnail(self, item: PendingThumbnail) -> str:
+        """Store the poster and its derivatives and link them. Returns the ThumbnailStats field to count."""
+        url = item.thumbnail_url.unicode_string()
+        if not self.refresh:
+            # Posters stored under their jav code before content addressing.
+            stem = self._file_stem(item.jav_code)
+            s3_key = f"{config.S3_THUMBNAILS_FOLDER}/{stem}.jpg"
+            derivatives = self._stored_derivatives(self._derivative_keys(stem))
+            if self._known_size(s3_key) is not None and derivatives is not None:
+                await self._link(item, s3_key, derivatives)
+                return "linked"
+
+        session = self._transport.session(url)
+        headers = self._conditional_headers(item)
+        async with session.get(url, ssl=False, headers=headers, timeout=aiohttp.ClientTimeout(total=30)) as response:
+            if response.status == 304 and headers:
+                return "unchanged"
+            if response.status != 200:
+                raise DownloadFailedException(f"HTTP {response.status} {url}")
+            file_bytes = io.BytesIO()
+            async for chunk in response.content.iter_chunked(8192):
+                file_bytes.write(chunk)
+            meta = ThumbnailMeta(
+                md5=hashlib.md5(file_bytes.getbuffer()).hexdigest(),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        if self.refresh and self._is_current(item, meta.md5):
+            await self._updates.set(item.id, {"thumbnail_meta": meta.model_dump()})
+            return "unchanged"
+
+        s3_key = f"{config.S3_THUMBNAILS_FOLDER}/{meta.md5}.jpg"
+        derivative_keys = self._derivative_keys(meta.md5)
+        shared = self._known_size(s3_key) is not None
+        if not shared:
+            file_bytes.seek(0)
+            await self._s3.put_object(file_bytes, s3_key, content_type="image/jpeg")
+            self._stored[s3_key] = file_bytes.getbuffer().nbytes
+        derivatives = self._stored_derivatives(derivative_keys)
+        if derivatives is None:
+            derivatives = await self._save_derivatives(item, file_bytes.getvalue(), derivative_keys)
+        await self._link(item, s3_key, derivatives, meta)
+        return "shared" if shared else "saved"
+
+    async def _save_derivatives(
+        self, item: PendingThumbnail, data: bytes, keys: dict[str, str]
+    ) -> list[ThumbnailDerivative]:
+        """Render and upload the configured derivatives; the original poster is kept even if this fails."""
+        try:
+            rendered = await self._renderer.render(data)
+            derivatives = []
+            for image in rendered:
+                key = keys[image.spec.name]
+                await self._s3.put_object(io.BytesIO(image.data), key, content_type=image.spec.content_type)
+                self._stored[key] = len(image.data)
+                derivatives.append(
+                    ThumbnailDerivative(
+                        name=image.spec.name, s3_url=self._s3_url(key), width=image.width, size=len(image.data)
+                    )
                 )
-                for video in videos
-            ]
-            await asyncio.gather(*tasks)
+            return derivatives
+        except Exception as e:
+            logger.warning(f"[Thumbnails] {item.jav_code}: derivatives failed, keeping the original: {e}")
+            return []
 
-    async def _download_and_save_thumbnail(
+    async def _link(
         self,
-        http_client: httpx.AsyncClient,
-        semaphore: asyncio.Semaphore,
-        url: str,
-        file_name: str,
-        video: Video,
+        item: PendingThumbnail,
+        s3_key: str,
+        derivatives: list[ThumbnailDerivative],
+        meta: ThumbnailMeta | None = None,
     ) -> None:
-        async with semaphore:
-            async with http_client.stream("GET", url) as response:
-                if response.status_code != 200:
-                    logger.warning(f"Failed to download thumbnail, response status: {response.status_code}, URL: {url}")
-                    return
-                file_bytes = io.BytesIO()
-                async for chunk in response.aiter_bytes(chunk_size=8192):
-                    file_bytes.write(chunk)
-                file_bytes.seek(0)
-                s3_key = f"{config.S3_THUMBNAILS_FOLDER}/{file_name}"
-            try:
-                await self._s3.put_object(file_bytes, s3_key, content_type="image/jpeg")
-                video.thumbnail_s3_url = f"https://{config.S3_ENDPOINT}/{config.S3_BUCKET}/{s3_key}"  # type: ignore
-                await video.save()  # type: ignore
-                logger.info(f"Thumbnail {file_name} successfully uploaded to S3")
-            except Exception as e:
-                logger.error(f"Error occurred when uploading thumbnail {file_name} to S3: {e}")
-                raise
+        update = {
+            "thumbnail_s3_url": self._s3_url(s3_key),
+            "thumbnail_derivatives": [d.model_dump() for d in derivatives],
+        }
+        if meta:
+            update["thumbnail_meta"] = meta.model_dump()
+        await self._updates.set(item.id, update)
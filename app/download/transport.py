@@ -0,0 +1,126 @@
+import asyncio
+import socket
+from fnmatch import fnmatchcase
+
+import aiohttp
+from aiohttp_socks import ProxyConnector
+
+from app.config import config
+from app.download.scheduler import url_host
+from app.infra.proxy_manager import ProxyManager
+
+
+class TunedConnector(aiohttp.TCPConnector):
+    """
+    TCPConnector that sets SO_RCVBUF on each socket before it connects.
+
+    The TCP window scale is agreed on during the handshake, so the buffer has to be set
+    before connect() to have any effect. aiohttp 3.9 has no socket factory hook, so the
+    connection is opened here from a prepared socket.
+    """
+
+    def __init__(self, rcvbuf: int, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.rcvbuf = rcvbuf
+
+    async def _wrap_create_connection(
+        self,
+        protocol_factory,
+        host: str,
+        port: int,
+        *,
+        req,
+        timeout: aiohttp.ClientTimeout,
+        client_error: type[Exception] = aiohttp.ClientConnectorError,
+        family: int = 0,
+        proto: int = 0,
+        flags: int = 0,
+        local_addr=None,
+        **kwargs,
+    ):
+        # Resolvers may leave the family unset; host is already a resolved address here.
+        family = family or (socket.AF_INET6 if ":" in host else socket.AF_INET)
+        sock = socket.socket(family, socket.SOCK_STREAM, proto)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+            sock.setblocking(False)
+            if local_addr:
+                sock.bind(local_addr)
+            async with asyncio.timeout(timeout.sock_connect):
+                await self._loop.sock_connect(sock, (host, port))
+        except OSError as e:
+            sock.close()
+            if isinstance(e, asyncio.TimeoutError):
+                raise
+            raise client_error(req.connection_key, e) from e
+        except BaseException:
+            sock.close()
+            raise
+        return await super()._wrap_create_connection(
+            protocol_factory, sock=sock, req=req, timeout=timeout, client_error=client_error, **kwargs
+        )
+
+
+class DownloadTransport:
+    """
+    Pooled aiohttp sessions for video and thumbnail downloads, one per (host, proxy).
+
+    Hosts matching proxy_hosts (fnmatch patterns) are fetched through the proxy pool, rotating
+    proxies per session() call, so CDNs that throttle by IP see several egress addresses; every
+    other host is fetched directly. Connections and DNS answers are cached by the connectors,
+    so consecutive downloads from one CDN skip the TCP/TLS setup. With rcvbuf > 0, direct
+    sockets get a fixed receive buffer of that size. That turns off the kernel's receive buffer
+    autotuning, and Linux caps it at net.core.rmem_max, so the default 0 leaves it to the OS.
+
+    Sessions belong to the event loop that created them; call close() before that loop ends.
+    """
+
+    def __init__(
+        self,
+        proxy_hosts: list[str] = config.DOWNLOAD_PROXY_HOSTS,  # type: ignore
+        proxies: ProxyManager | None = None,
+        connections_per_host: int = config.DOWNLOAD_CONNECTIONS_PER_HOST,
+        dns_cache_ttl: int = config.DNS_CACHE_TTL,
+        rcvbuf: int = config.DOWNLOAD_RCVBUF,
+        timeout: int = 3600,
+    ) -> None:
+        self.proxy_hosts = proxy_hosts
+        self.proxies = proxies or ProxyManager()
+        self.connections_per_host = connections_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.rcvbuf = rcvbuf
+        self.timeout = timeout
+        self._sessions: dict[tuple[str, str | None], aiohttp.ClientSession] = {}
+
+    def route(self, url: str) -> str | None:
+        """The proxy to fetch url through, or None for a direct connection."""
+        host = url_host(url)
+        if not any(fnmatchcase(host, pattern) for pattern in self.proxy_hosts):
+            return None
+        return self.proxies.get_next_proxy()
+
+    def session(self, url: str) -> aiohttp.ClientSession:
+        proxy = self.route(url)
+        key = (url_host(url), proxy)
+        session = self._sessions.get(key)
+        if session is None or session.closed:
+            session = self._sessions[key] = self._new_session(proxy)
+        return session
+
+    def _new_session(self, proxy: str | None) -> aiohttp.ClientSession:
+        options = dict(limit_per_host=self.connections_per_host, ttl_dns_cache=self.dns_cache_ttl)
+        if proxy:
+            connector = ProxyConnector.from_url(proxy, rdns=True, **options)
+        elif self.rcvbuf > 0:
+            connector = TunedConnector(self.rcvbuf, **options)
+        else:
+            connector = aiohttp.TCPConnector(**options)
+        return aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    async def close(self) -> None:
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(s.close() for s in sessions if not s.closed))
+
+
+download_transport = DownloadTransport()
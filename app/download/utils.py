@@ -1,5 +1,9 @@
 import hashlib
+import tempfile
+from collections import deque
+from contextlib import contextmanager
 from io import BytesIO
+from typing import BinaryIO, Iterator
 from urllib.parse import urlparse
 
 
@@ -23,3 +27,41 @@ def extract_filename(url: str) -> str:
         filename = filename.split("?")[0]
 
     return filename if filename else "download"
+
+
+class MediaWindow:
+    """
+    Keeps the head and a rolling tail of a byte stream.
+
+    MP4 metadata (the moov atom) sits either at the start or at the end of the file,
+    so these two windows are enough for MediaInfo without holding the whole video.
+    """
+
+    def __init__(self, head_size: int = 16 * 1024 * 1024, tail_size: int = 16 * 1024 * 1024) -> None:
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.head = bytearray()
+        self._tail: deque[bytes] = deque()
+        self._tail_len = 0
+
+    def feed(self, chunk: bytes) -> None:
+        if len(self.head) < self.head_size:
+            self.head += chunk[: self.head_size - len(self.head)]
+        self._tail.append(chunk)
+        self._tail_len += len(chunk)
+        while self._tail and self._tail_len - len(self._tail[0]) >= self.tail_size:
+            self._tail_len -= len(self._tail.popleft())
+
+    @contextmanager
+    def sparse_file(self, total_size: int) -> Iterator[BinaryIO]:
+        """Lay head and tail out at their real offsets in a sparse temp file of total_size bytes."""
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as tmp:
+            tmp.write(self.head)
+            tail = b"".join(self._tail)
+            tail_offset = max(len(self.head), total_size - len(tail))
+            tmp.seek(tail_offset)
+            tmp.write(tail[tail_offset - (total_size - len(tail)) :])
+            tmp.truncate(total_size)
+            tmp.flush()
+            tmp.seek(0)
+            yield tmp  # type: ignore
@@ -3,6 +3,7 @@ from loguru import logger
 from app.config import config
 from app.db.database import init_mongo
 from app.db.models import Video, VideoSource
+from app.download.dedupe import register_stored_object
 from app.google_export.gsheets import gsheets
 
 
@@ -134,6 +135,8 @@ class GSheetService:
                     hash_md5=file_hash,
                 )
             )
+            if file_hash:
+                await register_stored_object(file_hash, s3_path, "pornolab")
             video.runtime_minutes = runtime
             await video.save()
             row[-1] = "✓"
@@ -168,6 +171,8 @@ class GSheetService:
                     hash_md5=file_hash,
                 )
             )
+            if file_hash:
+                await register_stored_object(file_hash, s3_path, "ijavtorrent")
             video.runtime_minutes = runtime
             # video.javguru_status = "downloaded"
             await video.save()
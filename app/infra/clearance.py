@@ -0,0 +1,121 @@
+import hashlib
+import json
+import socket
+import time
+from typing import Callable
+from urllib.parse import urlparse
+
+import redis
+import redis.asyncio as aioredis
+from loguru import logger
+from pydantic import BaseModel
+
+from app.config import config
+
+
+class Clearance(BaseModel):
+    cookies: dict[str, str]
+    user_agent: str
+    expires_at: float
+
+
+class ClearanceStore:
+    """
+    Cloudflare clearance shared between browsers and HTTP sessions through Redis.
+
+    cf_clearance is bound to the egress IP and the user agent, so entries are keyed by
+    domain and proxy and carry the browser's user agent. Direct connections are keyed by
+    egress, this host's EGRESS_ID or hostname, because workers on other machines leave
+    from other IPs. A browser saves the cookies after a challenge is solved; curl_cffi
+    sessions load them before requests to the same domain through the same proxy.
+    Lookups are cached in-process for cache_ttl seconds.
+    """
+
+    PREFIX = "cf_clearance"
+    DEFAULT_TTL = 30 * 60
+
+    def __init__(
+        self,
+        redis_url: str = config.REDIS_DSN.unicode_string(),
+        sync_client: Callable[[], redis.Redis] | None = None,
+        async_client: Callable[[], aioredis.Redis] | None = None,
+        cache_ttl: int = 60,
+        egress: str = config.EGRESS_ID or socket.gethostname(),
+    ) -> None:
+        self._sync_client = sync_client or (lambda: redis.Redis.from_url(redis_url))
+        self._async_client = async_client or (lambda: aioredis.Redis.from_url(redis_url))
+        self.cache_ttl = cache_ttl
+        self.egress = egress
+        self._cache: dict[str, tuple[float, Clearance | None]] = {}
+
+    @staticmethod
+    def domain(url: str) -> str:
+        host = urlparse(url).hostname or url
+        return host.removeprefix("www.").lstrip(".")
+
+    def key(self, url: str, proxy: str | None) -> str:
+        # Proxy URLs contain credentials, so only a digest goes into the key.
+        egress = hashlib.sha1(proxy.encode()).hexdigest()[:16] if proxy else f"direct@{self.egress}"
+        return f"{self.PREFIX}:{self.domain(url)}:{egress}"
+
+    @staticmethod
+    def is_clearance_cookie(name: str) -> bool:
+        return name == "cf_clearance" or name.startswith(("__cf", "cf_chl"))
+
+    def save(self, url: str, proxy: str | None, cookies: list[dict], user_agent: str) -> Clearance | None:
+        """Store the Cloudflare cookies a browser holds for url. Called from sync Selenium code."""
+        picked = [c for c in cookies if self.is_clearance_cookie(c.get("name", ""))]
+        if not any(c["name"] == "cf_clearance" for c in picked):
+            return None
+        expiries = [c["expiry"] for c in picked if c["name"] == "cf_clearance" and c.get("expiry")]
+        expires_at = min(expiries) if expiries else time.time() + self.DEFAULT_TTL
+        ttl = int(expires_at - time.time())
+        if ttl <= 0:
+            return None
+        clearance = Clearance(
+            cookies={c["name"]: c["value"] for c in picked}, user_agent=user_agent, expires_at=expires_at
+        )
+        try:
+            with self._sync_client() as client:
+                client.set(self.key(url, proxy), clearance.model_dump_json(), ex=ttl)
+        except redis.RedisError as e:
+            logger.warning(f"[Clearance] Failed to save clearance for {self.domain(url)}: {e}")
+            return None
+        self._cache[self.key(url, proxy)] = (time.monotonic(), clearance)
+        logger.info(f"[Clearance] ✓ Shared clearance for {self.domain(url)}, valid for {ttl // 60} min")
+        return clearance
+
+    async def load(self, url: str, proxy: str | None) -> Clearance | None:
+        key = self.key(url, proxy)
+        cached = self._cache.get(key)
+        if cached and time.monotonic() - cached[0] < self.cache_ttl:
+            clearance = cached[1]
+        else:
+            try:
+                async with self._async_client() as client:
+                    raw = await client.get(key)
+            except redis.RedisError as e:
+                logger.warning(f"[Clearance] Failed to load clearance for {self.domain(url)}: {e}")
+                return None
+            clearance = Clearance(**json.loads(raw)) if raw else None
+            self._cache[key] = (time.monotonic(), clearance)
+        if clearance and clearance.expires_at <= time.time():
+            return None
+        return clearance
+
+    async def request_kwargs(self, url: str, proxy: str | None, direct_fallback: bool = False) -> dict:
+        """
+        curl_cffi request arguments for url: the proxy to use, plus cookies and user agent if a clearance is stored.
+
+        Browsers run without a proxy. With direct_fallback, a proxied request that has no clearance
+        of its own goes direct when this host holds one, trading the proxy for the solved challenge.
+        """
+        clearance = await self.load(url, proxy)
+        if not clearance and proxy and direct_fallback and (clearance := await self.load(url, None)):
+            proxy = None
+        if not clearance:
+            return {"proxy": proxy}
+        return {"proxy": proxy, "cookies": clearance.cookies, "headers": {"User-Agent": clearance.user_agent}}
+
+
+clearance_store = ClearanceStore()
@@ -11,3 +11,11 @@ queue = Celery(broker=config.REDIS_DSN.unicode_string(), include=["app.infra.wor
 queue.conf.worker_pool_restarts = True
 queue.conf.broker_connection_retry_on_startup = True
 queue.conf.broker_heartbeat = 0
+
+# Downloads run on their own queue; the concurrency of the worker consuming it is the download limit.
+# Each worker process takes one download at a time and acknowledges it only when it is finished.
+queue.conf.task_routes = {
+    "download_single_video": {"queue": "downloads"},
+    "download_video_batch": {"queue": "downloads"},
+}
+queue.conf.worker_prefetch_multiplier = 1
@@ -1,28 +1,308 @@
+import asyncio
+import base64
+import hashlib
 import io
+import mmap
+import os
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable
 
+import aiohttp
+from aiobotocore.config import AioConfig
 from aiobotocore.session import get_session as s3_get_session
+from botocore.exceptions import BotoCoreError, ClientError
+from loguru import logger
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_exponential
 
 from app.config import config
 
 
+def _is_retryable_part_error(e: BaseException) -> bool:
+    """Connection problems, timeouts, throttling and 5xx responses are worth another attempt."""
+    if isinstance(e, ClientError):
+        error = e.response.get("Error", {})
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        return status >= 500 or error.get("Code") in ("RequestTimeout", "SlowDown", "BadDigest")
+    return isinstance(e, (BotoCoreError, aiohttp.ClientError, asyncio.TimeoutError))
+
+
+class MultipartUpload:
+    """
+    Streaming writer on top of an S3 multipart upload.
+
+    Bytes passed to write() are cut into part_size parts, and up to `concurrency` parts are
+    uploaded at once, so memory stays at about concurrency + 1 parts no matter how large the
+    object is. Each part carries its Content-MD5 and is retried on transient errors.
+    Leaving the context completes the upload, or aborts it if an exception was raised.
+
+    Pass upload_id and parts to continue an upload started earlier; with abort_on_error=False
+    a failed upload is left open so that it can be resumed later. on_part is awaited with
+    (part_number, etag, size) for every uploaded part, in part order: a part that finishes early
+    is reported after the ones before it, so the reported parts always form a contiguous prefix.
+    """
+
+    MIN_PART_SIZE = 5 * 1024 * 1024
+
+    def __init__(
+        self,
+        s3_client: "S3Client",
+        key: str,
+        content_type: str = "video/mp4",
+        content_disposition: str = "inline",
+        part_size: int = config.S3_PART_SIZE,
+        upload_id: str | None = None,
+        parts: list[dict] | None = None,
+        on_part: Callable[[int, str, int], Awaitable[None]] | None = None,
+        abort_on_error: bool = True,
+        concurrency: int = config.S3_UPLOAD_CONCURRENCY,
+        retries: int = 5,
+        retry_backoff: float = 1.0,
+    ) -> None:
+        self.key = key
+        self.part_size = max(part_size, self.MIN_PART_SIZE)
+        self.upload_id = upload_id
+        self.parts: list[dict] = list(parts or [])
+        self.concurrency = max(concurrency, 1)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.result: dict | None = None
+        self._on_part = on_part
+        self._abort_on_error = abort_on_error
+        self._s3 = s3_client
+        self._content_type = content_type
+        self._content_disposition = content_disposition
+        self._buffer = bytearray()
+        self._stack = AsyncExitStack()
+        self._client = None
+        self._closed = False
+        self._next_part = max((p["PartNumber"] for p in self.parts), default=0) + 1
+        self._slots = asyncio.Semaphore(self.concurrency)
+        self._in_flight: set[asyncio.Task] = set()
+        self._finished: dict[int, tuple[str, int]] = {}
+        self._report_lock = asyncio.Lock()
+        self._error: BaseException | None = None
+        self._written = 0
+        self._reported = 0
+
+    async def __aenter__(self) -> "MultipartUpload":
+        self._client = await self._stack.enter_async_context(self._s3.client)
+        if self.upload_id is None:
+            upload = await self._client.create_multipart_upload(
+                Bucket=self._s3.bucket,
+                Key=self.key,
+                ContentType=self._content_type,
+                ContentDisposition=self._content_disposition,
+            )
+            self.upload_id = upload["UploadId"]
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        try:
+            if not self._closed:
+                if not exc_type:
+                    try:
+                        await self.complete()
+                    except BaseException:
+                        await self._cleanup()
+                        raise
+                else:
+                    await self._cleanup()
+        finally:
+            await self._stack.aclose()
+
+    async def _cleanup(self) -> None:
+        if self._abort_on_error:
+            await self.abort()
+        else:
+            # Let the parts in flight land so they are reported and the upload can be resumed from them.
+            await self._drain(raise_errors=False)
+
+    @property
+    def pending(self) -> int:
+        """Bytes written but not reported as uploaded parts yet."""
+        return self._written - self._reported
+
+    async def write(self, data: bytes | memoryview) -> None:
+        view = memoryview(data)
+        self._written += len(view)
+        if self._buffer:
+            missing = self.part_size - len(self._buffer)
+            self._buffer += view[:missing]
+            view = view[missing:]
+            if len(self._buffer) == self.part_size:
+                await self._submit(self._buffer)
+                self._buffer.clear()
+        # Whole parts are sent straight from the caller's data without passing through the buffer.
+        while len(view) >= self.part_size:
+            await self._submit(view[: self.part_size])
+            view = view[self.part_size :]
+        self._buffer += view
+
+    async def _submit(self, data: bytes | bytearray | memoryview) -> None:
+        await self._slots.acquire()
+        if self._error:
+            self._slots.release()
+            raise self._error
+        part_number = self._next_part
+        self._next_part += 1
+        # The copy is taken before write() returns, so callers may reuse or unmap their buffer.
+        task = asyncio.create_task(self._upload_part(part_number, bytes(data)))
+        self._in_flight.add(task)
+        task.add_done_callback(self._part_done)
+
+    def _part_done(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        self._slots.release()
+        if not task.cancelled() and task.exception() and not self._error:
+            self._error = task.exception()
+
+    async def _upload_part(self, part_number: int, body: bytes) -> None:
+        content_md5 = base64.b64encode(hashlib.md5(body).digest()).decode()
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.retries),
+            wait=wait_exponential(multiplier=self.retry_backoff, max=30),
+            retry=retry_if_exception(_is_retryable_part_error),
+            reraise=True,
+        ):
+            with attempt:
+                response = await self._client.upload_part(  # type: ignore
+                    Bucket=self._s3.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    PartNumber=part_number,
+                    Body=body,
+                    ContentMD5=content_md5,
+                )
+                if (number := attempt.retry_state.attempt_number) > 1:
+                    logger.info(f"[S3] Part {part_number} of {self.key} uploaded on attempt {number}")
+        self._finished[part_number] = (response["ETag"], len(body))
+        await self._report_finished()
+
+    async def _report_finished(self) -> None:
+        async with self._report_lock:
+            next_number = max((p["PartNumber"] for p in self.parts), default=0) + 1
+            while next_number in self._finished:
+                etag, size = self._finished.pop(next_number)
+                self.parts.append({"PartNumber": next_number, "ETag": etag})
+                self._reported += size
+                if self._on_part:
+                    await self._on_part(next_number, etag, size)
+                next_number += 1
+
+    async def _drain(self, raise_errors: bool = True) -> None:
+        while self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if raise_errors and self._error:
+            raise self._error
+
+    async def complete(self) -> dict:
+        # An upload needs at least one part, even an empty one.
+        if self._buffer or self._next_part == 1:
+            await self._submit(self._buffer)
+            self._buffer.clear()
+        await self._drain()
+        self._closed = True
+        self.result = await self._client.complete_multipart_upload(  # type: ignore
+            Bucket=self._s3.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+        return self.result
+
+    async def abort(self) -> None:
+        self._closed = True
+        self._buffer.clear()
+        for task in self._in_flight:
+            task.cancel()
+        await self._drain(raise_errors=False)
+        try:
+            await self._client.abort_multipart_upload(  # type: ignore
+                Bucket=self._s3.bucket, Key=self.key, UploadId=self.upload_id
+            )
+        except Exception as e:
+            logger.error(f"Failed to abort multipart upload {self.upload_id} for {self.key}: {e}")
+
+
 class S3Client:
-    def __init__(self, endpoint: str, access_key: str, secret_key: str, bucket: str) -> None:
+    """
+    Async S3 operations on one bucket.
+
+    start() (or `async with s3:`) opens a long-lived client with a pool of max_pool_connections
+    connections for the running event loop, and every call on that loop reuses it until close().
+    Without a started client each call opens and closes its own, as a one-off script would.
+    """
+
+    MAX_COPY_SIZE = 5 * 1024**3  # CopyObject limit, bigger objects are copied part by part
+
+    def __init__(
+        self,
+        endpoint: str,
+        access_key: str,
+        secret_key: str,
+        bucket: str,
+        max_pool_connections: int = config.S3_MAX_POOL_CONNECTIONS,
+    ) -> None:
         self._bucket = bucket
         self._endpoint = endpoint
         self._access_key = access_key
         self._secret_key = secret_key
-        self._client = s3_get_session()
+        self._session = s3_get_session()
+        self._config = AioConfig(max_pool_connections=max_pool_connections)
+        self._clients: dict[asyncio.AbstractEventLoop, tuple[AsyncExitStack, object]] = {}
 
     @property
-    def client(self):
-        return self._client.create_client(
+    def bucket(self) -> str:
+        return self._bucket
+
+    def _create_client(self):
+        return self._session.create_client(
             "s3",
             endpoint_url=f"https://{self._endpoint}",
             aws_access_key_id=self._access_key,
             aws_secret_access_key=self._secret_key,
             verify=False,
+            config=self._config,
         )
 
+    @property
+    def client(self):
+        """Async context manager yielding the started client of this loop, or a fresh one-off client."""
+        return self._client_scope()
+
+    @asynccontextmanager
+    async def _client_scope(self):
+        started = self._clients.get(asyncio.get_running_loop())
+        if started:
+            yield started[1]
+            return
+        async with self._create_client() as client:
+            yield client
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        # Clients of finished loops can't be closed any more, only forgotten.
+        for stale in [other for other in self._clients if other.is_closed()]:
+            del self._clients[stale]
+        if loop in self._clients:
+            return
+        stack = AsyncExitStack()
+        client = await stack.enter_async_context(self._create_client())
+        self._clients[loop] = (stack, client)
+        logger.debug(f"[S3] Client started for {self._endpoint}/{self._bucket}")
+
+    async def close(self) -> None:
+        started = self._clients.pop(asyncio.get_running_loop(), None)
+        if started:
+            await started[0].aclose()
+
+    async def __aenter__(self) -> "S3Client":
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
     async def put_object(
         self,
         file: io.BytesIO,
@@ -30,8 +310,7 @@ class S3Client:
         content_type: str = "video/mp4",
         content_disposition: str = "inline",
     ) -> dict:
-        s3_client = self.client
-        async with s3_client as client:
+        async with self.client as client:
             upload = await client.put_object(
                 Bucket=self._bucket,
                 Key=filename,
@@ -41,15 +320,168 @@ class S3Client:
             )
             return upload
 
+    def multipart_upload(
+        self,
+        filename: str,
+        content_type: str = "video/mp4",
+        content_disposition: str = "inline",
+        part_size: int = config.S3_PART_SIZE,
+        upload_id: str | None = None,
+        parts: list[dict] | None = None,
+        on_part: Callable[[int, str, int], Awaitable[None]] | None = None,
+        abort_on_error: bool = True,
+        concurrency: int = config.S3_UPLOAD_CONCURRENCY,
+    ) -> MultipartUpload:
+        return MultipartUpload(
+            self,
+            filename,
+            content_type,
+            content_disposition,
+            part_size,
+            upload_id,
+            parts,
+            on_part,
+            abort_on_error,
+            concurrency,
+        )
+
+    async def upload_file(
+        self,
+        source: str | os.PathLike | mmap.mmap | memoryview | bytes,
+        filename: str,
+        content_type: str = "video/mp4",
+        content_disposition: str = "inline",
+        part_size: int = config.S3_PART_SIZE,
+        concurrency: int = config.S3_UPLOAD_CONCURRENCY,
+    ) -> dict:
+        """
+        Multipart upload of a local file or an in-memory buffer.
+
+        A path is memory-mapped, so parts are read straight from the page cache and only the
+        parts in flight are copied.
+        """
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "rb") as file:
+                if not os.fstat(file.fileno()).st_size:
+                    return await self.upload_file(b"", filename, content_type, content_disposition, part_size)
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return await self.upload_file(
+                        mapped, filename, content_type, content_disposition, part_size, concurrency
+                    )
+
+        with memoryview(source) as view:
+            upload = self.multipart_upload(
+                filename, content_type, content_disposition, part_size, concurrency=concurrency
+            )
+            async with upload:
+                for offset in range(0, len(view), upload.part_size):
+                    await upload.write(view[offset : offset + upload.part_size])
+        return upload.result  # type: ignore
+
+    async def list_parts(self, filename: str, upload_id: str) -> list[dict] | None:
+        """Parts already stored for an open multipart upload, or None if the upload no longer exists."""
+        parts = []
+        async with self.client as client:
+            try:
+                paginator = client.get_paginator("list_parts")
+                async for page in paginator.paginate(Bucket=self._bucket, Key=filename, UploadId=upload_id):
+                    parts.extend(page.get("Parts", []))
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") == "NoSuchUpload":
+                    return None
+                raise
+        return parts
+
+    async def abort_multipart_upload(self, filename: str, upload_id: str) -> None:
+        async with self.client as client:
+            try:
+                await client.abort_multipart_upload(Bucket=self._bucket, Key=filename, UploadId=upload_id)
+            except ClientError as e:
+                logger.warning(f"Failed to abort multipart upload {upload_id} for {filename}: {e}")
+
+    async def iter_object(self, filename: str, chunk_size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+        async with self.client as client:
+            response = await client.get_object(Bucket=self._bucket, Key=filename)
+            body = response["Body"]
+            async with body:
+                async for chunk in body.iter_chunks(chunk_size):
+                    yield chunk
+
+    async def move_object(
+        self,
+        source: str,
+        target: str,
+        size: int,
+        content_type: str = "video/mp4",
+        content_disposition: str = "inline",
+        part_size: int = config.S3_PART_SIZE,
+    ) -> None:
+        """Server-side copy of an object to a new key followed by deletion of the old one."""
+        copy_source = {"Bucket": self._bucket, "Key": source}
+        async with self.client as client:
+            if size <= self.MAX_COPY_SIZE:
+                await client.copy_object(Bucket=self._bucket, Key=target, CopySource=copy_source)
+            else:
+                upload = await client.create_multipart_upload(
+                    Bucket=self._bucket,
+                    Key=target,
+                    ContentType=content_type,
+                    ContentDisposition=content_disposition,
+                )
+                upload_id = upload["UploadId"]
+                part_size = max(part_size, MultipartUpload.MIN_PART_SIZE)
+                parts = []
+                try:
+                    for part_number, start in enumerate(range(0, size, part_size), start=1):
+                        end = min(start + part_size, size) - 1
+                        response = await client.upload_part_copy(
+                            Bucket=self._bucket,
+                            Key=target,
+                            UploadId=upload_id,
+                            PartNumber=part_number,
+                            CopySource=copy_source,
+                            CopySourceRange=f"bytes={start}-{end}",
+                        )
+                        parts.append({"PartNumber": part_number, "ETag": response["CopyPartResult"]["ETag"]})
+                    await client.complete_multipart_upload(
+                        Bucket=self._bucket, Key=target, UploadId=upload_id, MultipartUpload={"Parts": parts}
+                    )
+                except Exception:
+                    await client.abort_multipart_upload(Bucket=self._bucket, Key=target, UploadId=upload_id)
+                    raise
+            await client.delete_object(Bucket=self._bucket, Key=source)
+
+    async def delete_object(self, filename: str) -> None:
+        async with self.client as client:
+            await client.delete_object(Bucket=self._bucket, Key=filename)
+
+    async def iter_objects(self, prefix: str = "") -> AsyncIterator[dict]:
+        """Every object under prefix, as returned in the Contents of list_objects_v2 pages."""
+        async with self.client as client:
+            paginator = client.get_paginator("list_objects_v2")
+            async for page in paginator.paginate(Bucket=self._bucket, Prefix=prefix):
+                for obj in page.get("Contents", []):
+                    yield obj
+
     async def object_info(self, filename: str) -> dict:
         async with self.client as client:
             obj_info = await client.head_object(Bucket=self._bucket, Key=filename)
         return obj_info
 
-    async def get_download_link(self, filename: str, expires_in: int = None):
-        async with self._client as client:
+    async def object_exists(self, filename: str) -> bool:
+        async with self.client as client:
+            try:
+                await client.head_object(Bucket=self._bucket, Key=filename)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                    return False
+                raise
+        return True
+
+    async def get_download_link(self, filename: str, expires_in: int = 3600) -> str:
+        async with self.client as client:
             url = await client.generate_presigned_url(
-                "get_object", Params={"Bucket": config.MINIO_BUCKET, "Key": filename}, ExpiresIn=expires_in
+                "get_object", Params={"Bucket": self._bucket, "Key": filename}, ExpiresIn=expires_in
             )
         return url
 
@@ -1,23 +1,38 @@
 import asyncio
-import time
 from typing import Literal
 
+from celery import group
+from celery.signals import worker_process_shutdown
 from loguru import logger
 
+from app.config import config
 from app.db.database import init_mongo
-from app.db.models import Video
-from app.download.service import run_download
+from app.download.service import claim_videos_for_download, release_claim, run_download, run_download_batch
 from app.google_export.export import GSheetService
 from app.infra.queue import queue
-from app.parser.crawl import (get_current_range, pipeline_enrich, pipeline_guru_enrich, pipeline_guru_pages,
-                              pipeline_thumbnails, pipeline_titles, save_next_range)
+from app.parser.crawl import (get_current_range, pipeline_backfill_stored_objects, pipeline_enrich,
+                              pipeline_guru_enrich, pipeline_guru_pages, pipeline_javct_catalog,
+                              pipeline_refresh_s3_index, pipeline_thumbnails, pipeline_titles, save_next_range)
+from app.parser.driver import close_driver_pools
 
 
-@queue.task(name="download_single_video")
-def download_video_task(video_id: str, origin_source: Literal["guru", "pornolab"], headless: bool) -> None:
+@worker_process_shutdown.connect
+def close_browsers(**_) -> None:
+    close_driver_pools()
+
+
+@queue.task(name="download_single_video", acks_late=True)
+def download_video_task(
+    video_id: str, origin_source: Literal["guru", "pornolab"], headless: bool, claim: str | None = None
+) -> None:
     if origin_source not in ("guru", "pornolab"):
         raise ValueError("Origin source must be in ('guru', 'pornolab')!")
-    asyncio.run(run_download(video_id, origin_source, headless))
+    asyncio.run(run_download(video_id, origin_source, headless, claim))
+
+
+@queue.task(name="download_video_batch", acks_late=True)
+def download_video_batch_task(video_ids: list[str], headless: bool, claim: str | None = None) -> None:
+    asyncio.run(run_download_batch(video_ids, headless, claim))
 
 
 @queue.task(name="download_videos_from_guru")
@@ -25,12 +40,15 @@ def download_fresh_videos_from_guru_task(limit: int = 50, headless: bool = True)
     """
     Initiates a task to download fresh videos from Javguru.
 
-    This function triggers background tasks that download a specified number of fresh videos.
+    This function claims up to `limit` downloadable videos in one atomic update (they become
+    "downloading" under a claim token, so overlapping runs never queue a video twice) and sends
+    the download tasks as a single Celery group: one per video, or one per DOWNLOAD_BATCH_SIZE videos
+    which then pipeline src resolving and transfers. The tasks go to the "downloads" queue,
+    whose worker concurrency is the download concurrency limit.
     It should be used as the main entry point for starting the download process.
 
     Args:
         limit (int): The maximum number of videos to download.
-        origin_source (Literal["guru", "pornolab"]): The source where the system should download from.
         headless (bool, optional): Whether to run the download process using Selenium in headless mode.
             Defaults to True.
 
@@ -38,21 +56,32 @@ def download_fresh_videos_from_guru_task(limit: int = 50, headless: bool = True)
         str: A descriptive message about the result.
     """
 
-    async def look_up(limit: int) -> list:
+    async def claim(limit: int) -> tuple[str, list[str]]:
         await init_mongo()
-        return await Video.find({"sources": {"$size": 0}, "javguru_status": "parsed"}).limit(limit).to_list()
+        return await claim_videos_for_download(limit)
 
-    videos_to_download = asyncio.run(look_up(limit))
-    if not videos_to_download:
+    async def release(claim_token: str) -> None:
+        await init_mongo()
+        await release_claim(claim_token)
+
+    claim_token, video_ids = asyncio.run(claim(limit))
+    if not video_ids:
         return "No videos found to download."
 
-    video_ids = []
-    for video in videos_to_download:
-        download_video_task.delay(str(video.id), "guru", headless)
-        video_ids.append(str(video.id))
-        time.sleep(0.5)
+    batch_size = max(config.DOWNLOAD_BATCH_SIZE, 1)
+    if batch_size == 1:
+        tasks = [download_video_task.s(video_id, "guru", headless, claim_token) for video_id in video_ids]
+    else:
+        batches = [video_ids[i : i + batch_size] for i in range(0, len(video_ids), batch_size)]
+        tasks = [download_video_batch_task.s(batch, headless, claim_token) for batch in batches]
+    try:
+        group(tasks).apply_async()
+    except Exception:
+        # Nothing will start these videos, so don't leave them "downloading" under a dead claim.
+        asyncio.run(release(claim_token))
+        raise
 
-    return f"Sent {len(videos_to_download)} videos for download from javguru: {', '.join(video_ids)}"
+    return f"Sent {len(video_ids)} videos for download from javguru: {', '.join(video_ids)}"
 
 
 @queue.task(name="guru_pipeline_pages")
@@ -65,6 +94,11 @@ def guru_pipeline_enrich_task(max_videos: int) -> None:
     asyncio.run(pipeline_guru_enrich(max_videos))
 
 
+@queue.task(name="harvest_javct_catalog")
+def harvest_javct_catalog_task() -> None:
+    asyncio.run(pipeline_javct_catalog())
+
+
 @queue.task(name="enrich_videos_with_data")
 def enrich_videos_with_data_task(site_name: str, max_videos: int) -> None:
     asyncio.run(pipeline_enrich(site_name=site_name, max_videos=max_videos))
@@ -76,8 +110,8 @@ def generate_new_titles_task() -> None:
 
 
 @queue.task(name="save_video_thumbnails")
-def save_video_thumbnails_task() -> None:
-    asyncio.run(pipeline_thumbnails())
+def save_video_thumbnails_task(refresh: bool = False) -> None:
+    asyncio.run(pipeline_thumbnails(refresh))
 
 
 @queue.task(name="export_video_data_to_gsheet")
@@ -96,6 +130,16 @@ def export_video_data_to_gsheet_task(
     )
 
 
+@queue.task(name="backfill_stored_objects")
+def backfill_stored_objects_task() -> None:
+    asyncio.run(pipeline_backfill_stored_objects())
+
+
+@queue.task(name="refresh_s3_index")
+def refresh_s3_index_task(repair: bool = False) -> None:
+    asyncio.run(pipeline_refresh_s3_index(repair))
+
+
 @queue.task(name="update_s3_paths_and_resolutions")
 def update_s3_paths_and_resolutions_task(read_range: str = "A2:T", write_start_cell: str = "P2") -> None:
     gsheet_svc = GSheetService()
@@ -126,6 +170,11 @@ def guru_pipeline_enrich_caller():
     logger.info(f"Sent task: guru enrichment ({max_videos} videos)")
 
 
+def harvest_javct_catalog_task_caller():
+    harvest_javct_catalog_task.delay()
+    logger.info("Sent task to harvest the javct catalogue")
+
+
 def enrich_videos_with_data_task_caller(site_name: str):
     current_data = get_current_range()
     max_videos = current_data["max_videos"]
@@ -138,9 +187,9 @@ def generate_new_titles_task_caller():
     logger.info("Sent task to generate new titles.")
 
 
-def save_video_thumbnails_task_caller():
-    save_video_thumbnails_task.delay()
-    logger.info("Sent task to save video thumbnails")
+def save_video_thumbnails_task_caller(refresh: bool = False):
+    save_video_thumbnails_task.delay(refresh)
+    logger.info(f"Sent task to {'refresh' if refresh else 'save'} video thumbnails")
 
 
 def export_video_data_to_gsheet_task_caller(
@@ -152,6 +201,16 @@ def export_video_data_to_gsheet_task_caller(
     logger.info("Sent task to export video data to gsheet")
 
 
+def backfill_stored_objects_task_caller():
+    backfill_stored_objects_task.delay()
+    logger.info("Sent task to register stored video files by MD5")
+
+
+def refresh_s3_index_task_caller(repair: bool = False):
+    refresh_s3_index_task.delay(repair)
+    logger.info("Sent task to refresh the S3 object index")
+
+
 def update_s3_paths_and_resolutions_task_caller(read_range: str = "A2:T", write_start_cell: str = "P2"):
     update_s3_paths_and_resolutions_task.delay(**locals())
     logger.info("Sent task to update S3 paths and resolutions in gsheet")
@@ -6,6 +6,7 @@ from loguru import logger
 
 from app.db.database import init_mongo
 from app.db.models import KVSImportConfirm, Video
+from app.infra.s3 import s3
 from app.utils.csv_dump import csv_dump
 
 
@@ -14,7 +15,11 @@ async def lifespan(app: FastAPI):
     logger.info("Initializing MongoDB...")
     await init_mongo()
     logger.success("MongoDB initialized")
-    yield
+    await s3.start()
+    try:
+        yield
+    finally:
+        await s3.close()
 
 
 app = FastAPI(title="JavGuru Parser/Downloader", version="1.0.0", lifespan=lifespan)
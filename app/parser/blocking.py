@@ -0,0 +1,65 @@
+from dataclasses import dataclass, field
+from fnmatch import fnmatchcase
+from urllib.parse import urlparse
+
+from app.config import config
+
+# Wildcard patterns in the Network.setBlockedURLs syntax, applied on every site.
+DEFAULT_BLOCKED_URLS = [
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*googlesyndication.com*",
+    "*facebook.net*",
+    "*hotjar.com*",
+    "*yandex.ru/metrika*",
+    "*mc.yandex.ru*",
+    "*histats.com*",
+    "*exoclick.com*",
+    "*exosrv.com*",
+    "*juicyads.com*",
+    "*trafficjunky*",
+    "*popads.net*",
+    "*adsterra*",
+    "*fonts.googleapis.com*",
+    "*fonts.gstatic.com*",
+    "*.woff*",
+    "*.ttf*",
+    "*.otf*",
+    "*.png*",
+    "*.jpg*",
+    "*.jpeg*",
+    "*.gif*",
+    "*.webp*",
+    "*.svg*",
+]
+
+
+@dataclass
+class BlockingRules:
+    """deny adds patterns for one site; allow lists default patterns that must stay unblocked there."""
+
+    deny: list[str] = field(default_factory=list)
+    allow: list[str] = field(default_factory=list)
+
+
+SITE_RULES: dict[str, BlockingRules] = {
+    "jav.guru": BlockingRules(deny=["*/wp-content/plugins/*ads*", "*/wp-json/*", "*gravatar.com*"]),
+    "javct.net": BlockingRules(),
+    "javtiful.com": BlockingRules(),
+}
+
+
+def site_domain(url: str) -> str:
+    return (urlparse(url).hostname or "").removeprefix("www.")
+
+
+def blocked_patterns(url: str) -> list[str]:
+    """Patterns to block while the browser is on url's site."""
+    rules = SITE_RULES.get(site_domain(url), BlockingRules())
+    patterns = [*DEFAULT_BLOCKED_URLS, *config.BLOCKED_URLS, *rules.deny]
+    return [p for p in dict.fromkeys(patterns) if p not in rules.allow]
+
+
+def is_blocked(request_url: str, patterns: list[str]) -> bool:
+    return any(fnmatchcase(request_url, pattern) for pattern in patterns)
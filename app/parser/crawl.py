@@ -8,7 +8,11 @@ from loguru import logger
 
 from app.config import config
 from app.db.database import init_mongo
+from app.download.dedupe import backfill_stored_objects
+from app.download.s3_index import find_orphans, refresh_s3_index, repair_sources
 from app.download.thumbnails import ThumbnailSaver
+from app.download.transport import download_transport
+from app.infra.s3 import s3
 from app.infra.title_generator import TitleGenerator
 from app.parser.service import Parser
 from app.parser.sites.guru import GuruAdapter
@@ -50,6 +54,17 @@ async def pipeline_guru_enrich(max_videos: int):
         logger.error("[GURU] Enrichment pipeline failed", e, exc_info=True)
 
 
+async def pipeline_javct_catalog():
+    await init_mongo()
+    try:
+        async with Parser(adapter=JavctAdapter()) as parser:
+            await parser.get_catalog()
+        logger.info("[JAVCT] Catalogue harvested")
+    except Exception as e:
+        traceback.print_exc()
+        logger.error("[JAVCT] Catalogue pipeline failed", e, exc_info=True)
+
+
 async def pipeline_enrich(site_name: Literal["javct", "javtiful"], max_videos: int):
     if site_name not in ("javct", "javtiful"):
         raise ValueError("Site name arg must be either javct or javtiful!")
@@ -71,13 +86,32 @@ async def pipeline_titles(max_batches: int = 0):
     await generator.run_pipeline(max_batches=max_batches)
 
 
-async def pipeline_thumbnails():
+async def pipeline_thumbnails(refresh: bool = False):
     await init_mongo()
-    saver = ThumbnailSaver()
-    await saver()
+    saver = ThumbnailSaver(refresh=refresh)
+    try:
+        async with s3:
+            await saver()
+    finally:
+        await download_transport.close()
     logger.info("Process finished")
 
 
+async def pipeline_refresh_s3_index(repair: bool = False):
+    await init_mongo()
+    async with s3:
+        await refresh_s3_index()
+        orphans = await find_orphans()
+        logger.info(f"[S3Index] {len(orphans)} objects are not referenced by any video")
+        # Repair HEADs keys missing from the index, so it needs the open client too.
+        await repair_sources(dry_run=not repair)
+
+
+async def pipeline_backfill_stored_objects():
+    await init_mongo()
+    await backfill_stored_objects()
+
+
 RANGE_PATH = Path(__file__).parent / "current_range.json"
 
 
@@ -1,5 +1,13 @@
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
 import undetected_chromedriver as uc
 from fake_useragent import FakeUserAgent
+from loguru import logger
+from selenium.common.exceptions import WebDriverException
 from selenium_stealth import stealth
 
 from app.config import config
@@ -42,6 +50,9 @@ class SeleniumDriver:
             "profile.managed_default_content_settings.media_stream": 2,  # off media
         }
         options.add_experimental_option("prefs", prefs)
+        if config.BROWSER_EARLY_RETURN:
+            # SeleniumService.get_media_url watches network requests through the performance log.
+            options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
 
         self.driver = uc.Chrome(
             driver_executable_path=driver_path,
@@ -66,3 +77,186 @@ class SeleniumDriver:
     def __exit__(self, exc_type, exc_val, exc_tb):
         if self.driver:
             self.driver.quit()
+
+
+def _process_tree_rss(pid: int) -> int | None:
+    """Resident memory of a process and all its descendants in bytes, read from /proc. None off Linux."""
+    proc = Path("/proc")
+    if not proc.is_dir():
+        return None
+    children: dict[int, list[int]] = {}
+    rss: dict[int, int] = {}
+    for entry in proc.iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / "stat").read_text()
+            # The process name may contain spaces, the fields after it are fixed.
+            fields = stat[stat.rfind(")") + 2 :].split()
+            children.setdefault(int(fields[1]), []).append(int(entry.name))
+            rss[int(entry.name)] = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            continue
+    if pid not in rss:
+        return None
+    total, stack = 0, [pid]
+    while stack:
+        current = stack.pop()
+        total += rss.get(current, 0)
+        stack.extend(children.get(current, []))
+    return total
+
+
+class _PooledDriver:
+    def __init__(self, holder: SeleniumDriver) -> None:
+        self.holder = holder
+        self.driver = holder.driver
+        self.uses = 0
+        self.baseline_rss = self.rss()
+
+    def rss(self) -> int | None:
+        pid = getattr(self.driver, "browser_pid", None)
+        return _process_tree_rss(pid) if pid else None
+
+    def healthy(self) -> bool:
+        try:
+            return self.driver.execute_script("return document.readyState") is not None
+        except Exception:
+            return False
+
+    def quit(self) -> None:
+        try:
+            self.holder.__exit__(None, None, None)
+        except Exception as e:
+            logger.warning(f"[DriverPool] Failed to quit browser: {e}")
+
+
+class DriverPool:
+    """
+    Warm browser sessions reused across downloads in one worker process.
+
+    lease() hands a driver to exactly one caller at a time. Sessions that fail a health check
+    or raise a WebDriverException are dropped. After max_uses leases, or when the browser's
+    memory has grown by more than max_rss_growth bytes, the session is replaced. Its cookies
+    (including solved Cloudflare clearances) are moved to the new browser.
+    """
+
+    def __init__(
+        self,
+        size: int = config.DRIVER_POOL_SIZE,
+        max_uses: int = config.DRIVER_MAX_USES,
+        max_rss_growth: int = config.DRIVER_MAX_RSS_GROWTH,
+        headless: bool = True,
+        factory: Callable[..., SeleniumDriver] = SeleniumDriver,
+    ) -> None:
+        self.max_uses = max_uses
+        self.max_rss_growth = max_rss_growth
+        self.headless = headless
+        self._factory = factory
+        self._slots = threading.BoundedSemaphore(max(size, 1))
+        self._lock = threading.Lock()
+        self._idle: list[_PooledDriver] = []
+        self._cookies: list[dict] = []
+        self._closed = False
+
+    @contextmanager
+    def lease(self) -> Iterator[uc.Chrome]:
+        with self._slots:
+            session = self._acquire()
+            broken = False
+            try:
+                yield session.driver
+            except WebDriverException:
+                broken = True
+                raise
+            finally:
+                session.uses += 1
+                self._release(session, broken)
+
+    def _acquire(self) -> _PooledDriver:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("DriverPool is closed")
+            session = self._idle.pop() if self._idle else None
+        if session and session.healthy():
+            return session
+        if session:
+            logger.warning("[DriverPool] Browser failed the health check, starting a new one")
+            self._retire(session)
+        return self._start()
+
+    def _start(self) -> _PooledDriver:
+        session = _PooledDriver(self._factory(headless=self.headless))
+        if self._cookies:
+            self._restore_cookies(session.driver, self._cookies)
+        logger.info(f"[DriverPool] Started browser (carried over {len(self._cookies)} cookies)")
+        return session
+
+    def _release(self, session: _PooledDriver, broken: bool) -> None:
+        reason = None
+        if broken or not session.healthy():
+            reason = "broken"
+        elif session.uses >= self.max_uses:
+            reason = f"used {session.uses} times"
+        elif (rss := session.rss()) and session.baseline_rss and rss - session.baseline_rss > self.max_rss_growth:
+            reason = f"memory grew to {rss // 2**20} MB"
+        if reason:
+            logger.info(f"[DriverPool] Recycling browser: {reason}")
+            self._retire(session)
+            return
+        with self._lock:
+            if not self._closed:
+                self._idle.append(session)
+                return
+        session.quit()
+
+    def _retire(self, session: _PooledDriver) -> None:
+        try:
+            self._cookies = session.driver.get_cookies() or self._cookies
+        except Exception:
+            pass
+        session.quit()
+
+    @staticmethod
+    def _restore_cookies(driver: uc.Chrome, cookies: list[dict]) -> None:
+        """Load cookies through CDP, which, unlike add_cookie, doesn't need the page to be open first."""
+        converted = []
+        for cookie in cookies:
+            cdp_cookie = {k: v for k, v in cookie.items() if k in ("name", "value", "domain", "path", "secure")}
+            cdp_cookie["httpOnly"] = cookie.get("httpOnly", False)
+            if "expiry" in cookie:
+                cdp_cookie["expires"] = cookie["expiry"]
+            if cookie.get("sameSite") in ("Strict", "Lax", "None"):
+                cdp_cookie["sameSite"] = cookie["sameSite"]
+            converted.append(cdp_cookie)
+        try:
+            driver.execute_cdp_cmd("Network.setCookies", {"cookies": converted})
+        except Exception as e:
+            logger.warning(f"[DriverPool] Failed to restore cookies: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.quit()
+
+
+_pools: dict[bool, DriverPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_driver_pool(headless: bool = True) -> DriverPool:
+    """The process-wide pool for headless or headed browsers."""
+    with _pools_lock:
+        if headless not in _pools:
+            _pools[headless] = DriverPool(headless=headless)
+        return _pools[headless]
+
+
+def close_driver_pools() -> None:
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
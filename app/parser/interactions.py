@@ -1,3 +1,5 @@
+import json
+import re
 import time
 from typing import Optional, Tuple
 
@@ -9,31 +11,68 @@ from selenium.webdriver.remote.webelement import WebElement
 from selenium.webdriver.support import expected_conditions as ec
 from selenium.webdriver.support.ui import WebDriverWait
 
+from app.config import config
+from app.infra.clearance import ClearanceStore, clearance_store
+from app.parser.blocking import blocked_patterns, is_blocked, site_domain
+
+MEDIA_REQUEST_RE = re.compile(r"\.(?:mp4|m3u8)(?:\?|$)")
+
+# "challenge" if a Cloudflare interstitial is shown, otherwise "ready" or "loading" by document.readyState.
+CHALLENGE_PROBE_JS = """
+const markers = '#challenge-form, #challenge-running, #challenge-stage, #cf-challenge-running, '
+    + '.cf-browser-verification, #turnstile-wrapper, iframe[src*="challenges.cloudflare.com"]';
+if (document.querySelector(markers)) return 'challenge';
+const phrases = new RegExp([
+    'Just a moment', 'Attention Required', 'Checking your browser', 'Verifying you are human',
+    'Проверяем, человек ли вы', 'проверить безопасность вашего подключения',
+].join('|'));
+if (phrases.test(document.title)) return 'challenge';
+const body = document.body ? document.body.textContent : '';
+if (body.length < 20000 && phrases.test(body)) return 'challenge';
+return document.readyState === 'loading' ? 'loading' : 'ready';
+"""
+
 
 class SeleniumService:
-    def __init__(self, driver: WebDriver, timeout: int = 10):
+    def __init__(
+        self,
+        driver: WebDriver,
+        timeout: int = 10,
+        proxy: str | None = None,
+        clearances: ClearanceStore | None = clearance_store,
+        blocking: bool = config.CDP_BLOCKING,
+    ):
         self.driver = driver
+        self.proxy = proxy
+        self.clearances = clearances
+        self.blocking = blocking
+        self._blocked_site: str | None = None
+        self._blocked: list[str] = []
         self._wait = WebDriverWait(driver, timeout)
         self.driver.set_page_load_timeout(timeout)
 
-    def _wait_for_challenge(self, timeout: int = 5) -> bool:
-        start = time.time()
-        while time.time() - start < timeout:
-            page = self.driver.page_source
-            if any(
-                phrase in page
-                for phrase in (
-                    "cdn-cgi/challenge-platform",
-                    "Checking your browser",
-                    "Verifying you are human",
-                    "Проверяем, человек ли вы",
-                    "проверить безопасность вашего подключения",
-                    "Attention Required",
-                )
-            ):
+    def _challenge_state(self) -> str:
+        try:
+            return self.driver.execute_script(CHALLENGE_PROBE_JS) or "loading"
+        except Exception as e:
+            logger.debug(f"Challenge probe failed: {e}")
+            return "loading"
+
+    def _wait_for_challenge(self, timeout: int = 5, poll_interval: float = 0.2) -> bool:
+        """
+        True if the current page is a Cloudflare challenge, False as soon as a normal page is ready.
+
+        A small JS probe checks challenge markers and document.readyState, so pages without
+        a challenge cost one round trip instead of a page_source dump every half second.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            state = self._challenge_state()
+            if state == "challenge":
                 return True
-            time.sleep(0.5)
-        return False
+            if state == "ready" or time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
 
     def get(
         self,
@@ -42,6 +81,7 @@ class SeleniumService:
         timeout: Optional[int] = None,
     ):
         try:
+            self._apply_blocking(url)
             self.driver.get(url)
 
             if self._wait_for_challenge():
@@ -52,6 +92,7 @@ class SeleniumService:
                     time.sleep(3)
 
                 logger.info("The captcha has been solved. Let's continue.")
+                self._share_clearance(url)
 
             logger.debug(f"Navigated to {url}")
 
@@ -61,6 +102,64 @@ class SeleniumService:
         except Exception as e:
             logger.error(f"Failed to get URL {url}: {e}", exc_info=True)
 
+    def _apply_blocking(self, url: str) -> None:
+        """Block trackers, ads and fonts for url's site with Network.setBlockedURLs (once per site)."""
+        site = site_domain(url)
+        if not self.blocking or site == self._blocked_site:
+            return
+        try:
+            patterns = blocked_patterns(url)
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+            self._blocked_site, self._blocked = site, patterns
+            logger.debug(f"Blocking {len(patterns)} URL patterns on {site}")
+        except Exception as e:
+            logger.warning(f"Request blocking is unavailable, continuing without it: {e}")
+            self.blocking = False
+
+    def get_media_url(self, url: str, timeout: int = 15) -> str | None:
+        """
+        Open url and return the first .mp4/.m3u8 request the page makes, stopping the load right there.
+
+        Needs the performance log (SeleniumDriver enables it with BROWSER_EARLY_RETURN). Returns None
+        if no media request shows up in time, e.g. on a challenge page; use get() then.
+        """
+        self._apply_blocking(url)
+        try:
+            self.driver.get_log("performance")  # drop entries left from the previous page
+            self.driver.execute_cdp_cmd("Page.navigate", {"url": url})
+        except Exception as e:
+            logger.debug(f"Early return is unavailable: {e}")
+            return None
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            for entry in self.driver.get_log("performance"):
+                try:
+                    message = json.loads(entry["message"])["message"]
+                except (KeyError, ValueError):
+                    continue
+                if message.get("method") != "Network.requestWillBeSent":
+                    continue
+                request_url = message["params"]["request"]["url"]
+                if MEDIA_REQUEST_RE.search(request_url) and not is_blocked(request_url, self._blocked):
+                    self.driver.execute_cdp_cmd("Page.stopLoading", {})
+                    logger.debug(f"Media request seen, stopped loading {url}")
+                    return request_url
+            time.sleep(0.2)
+        logger.debug(f"No media request within {timeout}s on {url}")
+        return None
+
+    def _share_clearance(self, url: str) -> None:
+        """Publish the solved challenge cookies so that HTTP sessions can reuse them."""
+        if not self.clearances:
+            return
+        try:
+            user_agent = self.driver.execute_script("return navigator.userAgent")
+            self.clearances.save(url, self.proxy, self.driver.get_cookies(), user_agent)
+        except Exception as e:
+            logger.warning(f"Failed to share clearance for {url}: {e}")
+
     def wait_for_element(self, element: Tuple[By, str], timeout: Optional[int] = None):
         try:
             wait = WebDriverWait(self.driver, timeout or self._wait._timeout)
@@ -1,17 +1,32 @@
+from datetime import datetime, timedelta
 from typing import Callable
 
-from beanie import Document
+from beanie import Document, PydanticObjectId
 from beanie.operators import In
 from loguru import logger
+from pydantic import BaseModel, Field
+from pymongo import UpdateOne
 
-from app.db.models import Category, Model, Studio, Tag, Video
+from app.config import config
+from app.db.models import CatalogHarvest, Category, JavctCatalogEntry, Model, Studio, Tag, Video
 from app.parser.base import ParserAdapter
 
+
+class _VideoCode(BaseModel):
+    id: PydanticObjectId = Field(alias="_id")
+    jav_code: str
+
+
 ENRICH_FIELD_BY_SITE = {
     "javct": "javct_enriched",
     "javtiful": "javtiful_enriched",
 }
 
+# Videos the catalogue join skipped, so a later harvest listing them can reopen them.
+CATALOG_MISS_FIELD_BY_SITE = {
+    "javct": "javct_catalog_miss_at",
+}
+
 
 class Parser:
     def __init__(self, adapter: ParserAdapter):
@@ -77,6 +92,85 @@ class Parser:
     async def get_directors(self):
         return await self._load_and_insert(Model, self.adapter.parse_directors, "directors")
 
+    async def get_catalog(self) -> int:
+        """
+        Harvest the site catalogue, upsert it into the local code -> URL table and record the complete harvest.
+
+        Videos an earlier join skipped as not carried are reopened when their code shows up.
+        """
+        entries = await self.adapter.harvest_catalog()
+        if not entries:
+            logger.info(f"[Parser] Empty catalogue from {self.adapter.site_name}")
+            return 0
+
+        await JavctCatalogEntry.get_motor_collection().bulk_write(
+            [
+                UpdateOne(
+                    {"jav_code": entry.jav_code},
+                    {
+                        "$set": {
+                            "url": str(entry.url),
+                            "last_modified": entry.last_modified,
+                            "harvested_at": entry.harvested_at,
+                        }
+                    },
+                    upsert=True,
+                )
+                for entry in entries
+            ],
+            ordered=False,
+        )
+        await CatalogHarvest.find_one(CatalogHarvest.site == self.adapter.site_name).upsert(
+            {"$set": {CatalogHarvest.entries: len(entries), CatalogHarvest.completed_at: datetime.utcnow()}},
+            on_insert=CatalogHarvest(site=self.adapter.site_name, entries=len(entries)),
+        )
+        logger.info(f"[Parser] Upserted {len(entries)} catalogue entries from {self.adapter.site_name}")
+        await self._reopen_catalog_misses({entry.jav_code for entry in entries})
+        return len(entries)
+
+    async def _reopen_catalog_misses(self, codes: set[str]) -> int:
+        enrich_field = ENRICH_FIELD_BY_SITE.get(self.adapter.site_name)
+        miss_field = CATALOG_MISS_FIELD_BY_SITE.get(self.adapter.site_name)
+        if not enrich_field or not miss_field:
+            return 0
+        missed = await Video.find({miss_field: {"$ne": None}}).project(_VideoCode).to_list()
+        listed = [video.id for video in missed if video.jav_code.lower() in codes]
+        if listed:
+            await Video.find(In(Video.id, listed)).update({"$set": {enrich_field: False, miss_field: None}})
+            logger.info(f"[{self.adapter.site_name}] Reopened {len(listed)} videos the catalogue now carries")
+        return len(listed)
+
+    async def _catalog_is_recent(self) -> bool:
+        harvest = await CatalogHarvest.find_one(CatalogHarvest.site == self.adapter.site_name)
+        if not harvest or datetime.utcnow() - harvest.completed_at > timedelta(seconds=config.CATALOG_MAX_AGE):
+            logger.warning(f"[{self.adapter.site_name}] No recent complete catalogue harvest, skipping the join")
+            return False
+        return True
+
+    async def _mark_unlisted_as_enriched(self, enrich_field: str, catalog: dict[str, str]) -> int:
+        """
+        Local join of pending videos against the site catalogue.
+
+        Videos whose codes the site doesn't carry are flagged as enriched right away, without
+        a single request, so only matched codes reach the detail fetch. The miss is stamped
+        separately so get_catalog can reopen them once the site lists the code. Only done
+        after a complete harvest younger than CATALOG_MAX_AGE.
+        """
+        if not await self._catalog_is_recent():
+            return 0
+        pending = await Video.find({enrich_field: False, "jav_code": {"$ne": ""}}).project(_VideoCode).to_list()
+        unlisted = [video.id for video in pending if video.jav_code.lower() not in catalog]
+        if unlisted:
+            update = {enrich_field: True}
+            if miss_field := CATALOG_MISS_FIELD_BY_SITE.get(self.adapter.site_name):
+                update[miss_field] = datetime.utcnow()
+            await Video.find(In(Video.id, unlisted)).update({"$set": update})
+        logger.info(
+            f"[{self.adapter.site_name}] Catalogue join: {len(pending) - len(unlisted)} matched, "
+            f"{len(unlisted)} not carried by the site"
+        )
+        return len(unlisted)
+
     async def get_videos(self, start_page: int | None = None, end_page: int = 1):
         raw_videos = await self.adapter.parse_videos(
             start_page=start_page,
@@ -231,6 +325,10 @@ class Parser:
             logger.warning(f"[{site_name}] No enrichment flag defined")
             return
 
+        catalog = await self.adapter.load_catalog() if hasattr(self.adapter, "load_catalog") else {}
+        if catalog:
+            await self._mark_unlisted_as_enriched(enrich_field, catalog)
+
         videos = Video.find({enrich_field: False, "jav_code": {"$ne": ""}}).limit(max_videos)
 
         # videos = Video.find({"type_javtiful": None, "javtiful_enriched": True, "jav_code": {"$ne": ""}}).limit(
@@ -1,14 +1,30 @@
 import asyncio
 import random
-from typing import AsyncGenerator, List, Optional
+import time
+from typing import TYPE_CHECKING, AsyncGenerator, List, Optional
 
 from curl_cffi.requests import AsyncSession
 from dateutil import parser as dateparser
 from loguru import logger
 from selectolax.lexbor import LexborHTMLParser as HTMLTree
+from selenium.webdriver.common.by import By
 
 from app.config import config
 from app.db.models import Category, Model, ParsedVideo, Studio, Tag
+from app.infra.clearance import clearance_store
+
+if TYPE_CHECKING:
+    from app.parser.interactions import SeleniumService
+
+# currentSrc of the first <video> that has one, else the last .mp4/.m3u8 the frame has requested.
+VIDEO_SRC_JS = """
+for (const v of document.querySelectorAll('video')) {
+    const src = v.currentSrc || v.src || (v.querySelector('source[src]') || {}).src;
+    if (src && !src.startsWith('blob:')) return src;
+}
+const media = performance.getEntriesByType('resource').map(e => e.name).filter(n => /\\.(mp4|m3u8)(\\?|$)/.test(n));
+return media.length ? media[media.length - 1] : null;
+"""
 
 
 class GuruAdapter:
@@ -41,7 +57,7 @@ class GuruAdapter:
         url = str(url)
         proxy = random.choice(self.proxy_pool)
         try:
-            resp = await self.session.get(url, proxy=proxy)
+            resp = await self.session.get(url, **await clearance_store.request_kwargs(url, proxy))
             if resp.status_code == 403 or "cf-chl" in resp.text:
                 logger.warning(f"CF block: {url}")
                 await asyncio.sleep(random.uniform(15, 35))
@@ -282,6 +298,42 @@ class GuruAdapter:
             logger.error(f"[guru] ✗ Unexpected parsing error at {url}: {e}", exc_info=True)
             return None
 
+    # --- Video source ---
+    def _extract_video_src(self, selenium: "SeleniumService", timeout_sec: int = 2, max_depth: int = 3) -> str | None:
+        """Poll the opened page and its player iframes for the playable video URL."""
+        driver = selenium.driver
+        deadline = time.monotonic() + timeout_sec
+        try:
+            while True:
+                if src := self._find_src_in_frame(driver, max_depth):
+                    logger.debug(f"[guru] Video src found: {src}")
+                    return src
+                if time.monotonic() >= deadline:
+                    return None
+                time.sleep(0.5)
+        finally:
+            driver.switch_to.default_content()
+
+    def _find_src_in_frame(self, driver, depth: int) -> str | None:
+        try:
+            if src := driver.execute_script(VIDEO_SRC_JS):
+                return src
+        except Exception as e:
+            logger.debug(f"[guru] Video src script failed: {e}")
+        if depth <= 0:
+            return None
+        for frame in driver.find_elements(By.TAG_NAME, "iframe"):
+            try:
+                driver.switch_to.frame(frame)
+            except Exception:
+                continue
+            try:
+                if src := self._find_src_in_frame(driver, depth - 1):
+                    return src
+            finally:
+                driver.switch_to.parent_frame()
+        return None
+
     # --- Метаданные ---
     async def parse_studios(self) -> List[Studio]:
         tree = await self._request(self.STUDIO_URL)
@@ -1,19 +1,24 @@
 import asyncio
 import random
 from typing import Optional
+from urllib.parse import urlparse
 
 from curl_cffi.requests import AsyncSession
+from dateutil import parser as dateparser
 from loguru import logger
 from selectolax.lexbor import LexborHTMLParser as HTMLTree
 
 from app.config import config
-from app.db.models import Category, Tag, Video
+from app.db.models import Category, JavctCatalogEntry, Tag, Video
+from app.infra.clearance import clearance_store
 
 
 class JavctAdapter:
     site_name = "javct"
     BASE_URL = "https://javct.net"
     CATEGORIES_URL = "https://javct.net/categories"
+    SITEMAP_URL = "https://javct.net/sitemap.xml"
+    SITEMAP_ATTEMPTS = 3
 
     def __init__(self):
         self.proxy_pool = config.PROXY_POOL  # list[str] socks5://user:pass@ip:port
@@ -26,6 +31,7 @@ class JavctAdapter:
             "Sec-CH-UA": '"Chromium";v="129", "Not=A?Brand";v="8"',
             "Sec-CH-UA-Platform": '"Windows"',
         }
+        self.catalog: dict[str, str] = {}  # lowercased jav_code -> video page URL
 
     async def __aenter__(self):
         self.session = AsyncSession(
@@ -41,7 +47,7 @@ class JavctAdapter:
     async def _request(self, url: str) -> Optional[HTMLTree]:
         proxy = random.choice(self.proxy_pool)
         try:
-            resp = await self.session.get(url, proxy=proxy)
+            resp = await self.session.get(url, **await clearance_store.request_kwargs(url, proxy))
             if resp.status_code == 403 or "cf-chl" in resp.text:
                 logger.warning(f"[Javct] Cloudflare block on {url}")
                 await asyncio.sleep(random.uniform(15, 35))
@@ -77,13 +83,78 @@ class JavctAdapter:
         logger.success(f"[Javct] ✓ Parsed {len(categories)} categories total")
         return list(categories.values())
 
+    @staticmethod
+    def _code_from_url(url: str) -> str | None:
+        path = urlparse(url).path
+        if not path.startswith("/v/"):
+            return None
+        return path[len("/v/") :].strip("/").lower() or None
+
+    def _collect_catalog_entries(self, tree: HTMLTree, entries: dict[str, JavctCatalogEntry]) -> int:
+        found = 0
+        for url in tree.css("url"):
+            loc = url.css_first("loc")
+            href = loc.text(strip=True) if loc else ""
+            code = self._code_from_url(href)
+            if not code:
+                continue
+            last_modified = None
+            if lastmod := url.css_first("lastmod"):
+                try:
+                    last_modified = dateparser.parse(lastmod.text(strip=True))
+                except Exception:
+                    pass
+            entries[code] = JavctCatalogEntry(jav_code=code, url=href, last_modified=last_modified)
+            found += 1
+        return found
+
+    async def harvest_catalog(self) -> list[JavctCatalogEntry]:
+        """
+        Collect every video page listed in the javct sitemap.
+
+        Handles both a sitemap index (nested sitemaps) and a plain urlset at SITEMAP_URL.
+        Only /v/{code} pages are kept. A partial catalogue would make the join flag listed
+        codes as missing, so if any nested sitemap fails to load nothing is returned.
+        """
+        tree = await self._request(self.SITEMAP_URL)
+        if not tree:
+            logger.error("[Javct] ✗ Failed to load sitemap")
+            return []
+
+        entries: dict[str, JavctCatalogEntry] = {}
+        nested_sitemaps = [loc.text(strip=True) for loc in tree.css("sitemap > loc")]
+        if not nested_sitemaps:
+            self._collect_catalog_entries(tree, entries)
+
+        for sitemap_url in nested_sitemaps:
+            sub_tree = None
+            for _ in range(self.SITEMAP_ATTEMPTS):
+                if sub_tree := await self._request(sitemap_url):
+                    break
+            if not sub_tree:
+                logger.error(f"[Javct] ✗ Failed to load sitemap {sitemap_url}, harvest aborted")
+                return []
+            found = self._collect_catalog_entries(sub_tree, entries)
+            logger.debug(f"[Javct] ✓ {found} videos in {sitemap_url}")
+            await asyncio.sleep(random.uniform(1, 3))
+
+        logger.success(f"[Javct] ✓ Harvested {len(entries)} videos from sitemap")
+        return list(entries.values())
+
+    async def load_catalog(self) -> dict[str, str]:
+        entries = await JavctCatalogEntry.find_all().to_list()
+        self.catalog = {entry.jav_code: str(entry.url) for entry in entries}
+        logger.info(f"[Javct] Loaded {len(self.catalog)} catalogue entries")
+        return self.catalog
+
     async def enrich_video(
         self,
         video: Video,
         all_categories: list[Category],
         all_tags: list[Tag],
     ) -> Video | None:
-        search_url = f"{self.BASE_URL}/v/{video.jav_code.lower()}"
+        code = video.jav_code.lower()
+        search_url = self.catalog.get(code) or f"{self.BASE_URL}/v/{code}"
         tree = await self._request(search_url)
         if not tree:
             logger.warning(f"[Javct] ✗ Failed to load page for {video.jav_code}")
@@ -8,6 +8,7 @@ from selectolax.lexbor import LexborHTMLParser as HTMLTree
 
 from app.config import config
 from app.db.models import Category, Tag, Video
+from app.infra.clearance import clearance_store
 
 
 class JavtifulAdapter:
@@ -41,7 +42,7 @@ class JavtifulAdapter:
     async def _request(self, url: str) -> Optional[HTMLTree]:
         proxy = random.choice(self.proxy_pool)
         try:
-            resp = await self.session.get(url, proxy=proxy)
+            resp = await self.session.get(url, **await clearance_store.request_kwargs(url, proxy))
             if resp.status_code == 403 or "cf-chl" in resp.text:
                 logger.warning(f"[Javtiful] Cloudflare block on {url}")
                 await asyncio.sleep(random.uniform(15, 35))
@@ -6,6 +6,9 @@ from pydantic import BaseModel
 
 from app.db.models import Video, VideoCSV, VideoSource
 
+# Exported resolutions, best first.
+RESOLUTIONS = ["4k", "2k", "1080p", "720p"]
+
 
 class CSVDump:
     def __init__(self, schema: Type[BaseModel], delimiter=";"):
@@ -29,15 +32,14 @@ class CSVDump:
                 "s3_path": best_hd_source.s3_path,
                 "poster_for_main_page_url": video.thumbnail_s3_url.unicode_string(),
                 "studio": video.studio.name if video.studio else "",
+                "poster_derivatives": [f"{d.name}={d.s3_url}" for d in video.thumbnail_derivatives],
             }
             validated_data.append(self._schema(**raw).model_dump(mode="json"))
         csv_string = self._make_csv_string(validated_data)
         return csv_string, len(validated_data)
 
     @staticmethod
-    def _fetch_best_source(
-        sources: list[VideoSource], res: list[str] = ["4k", "2k", "1080p", "720p"]
-    ) -> VideoSource | None:
+    def _fetch_best_source(sources: list[VideoSource], res: list[str] = RESOLUTIONS) -> VideoSource | None:
         """Select a source with the highest resolution.
         E.g., if sources = [
             VideoSource(origin="pornolab", status="imported", resolution="1080p"),
@@ -65,6 +67,12 @@ class CSVDump:
             return None
         return min(better_saved, key=lambda s: res.index(s.resolution))
 
+    @classmethod
+    def would_import(cls, sources: list[VideoSource], resolution: str) -> bool:
+        """Check whether a new source of the given resolution would be picked by _fetch_best_source."""
+        candidate = VideoSource(origin="candidate", resolution=resolution, s3_path="")
+        return cls._fetch_best_source([*sources, candidate]) is candidate
+
     def _make_csv_string(self, data: list[dict]):
         output = StringIO()
         writer = csv.writer(output, delimiter=self._delimiter)
@@ -7,7 +7,8 @@ from beanie import init_beanie
 from motor.motor_asyncio import AsyncIOMotorClient
 
 from app.config import config
-from app.db.models import Category, Model, Studio, Tag, Video
+from app.db.models import (CatalogHarvest, Category, JavctCatalogEntry, Model, S3ObjectEntry, StoredObject, Studio,
+                           Tag, Video)
 
 
 @pytest.fixture(scope="module")
@@ -40,10 +41,32 @@ async def init_db():
 
     await init_beanie(
         database=db,
-        document_models=[Video, Category, Tag, Model, Studio],
+        document_models=[
+            Video,
+            Category,
+            Tag,
+            Model,
+            Studio,
+            JavctCatalogEntry,
+            CatalogHarvest,
+            StoredObject,
+            S3ObjectEntry,
+        ],
     )
 
     yield db
 
     await client.drop_database(db_name)
     client.close()
+
+
+@pytest.fixture
+def make_video(init_db):
+    async def _make(jav_code: str, status: str = "parsed", **fields) -> Video:
+        video = Video(
+            title=jav_code, jav_code=jav_code, page_link=f"https://x/{jav_code}", javguru_status=status, **fields
+        )
+        await video.insert()
+        return video
+
+    return _make
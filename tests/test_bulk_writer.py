@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from app.db.bulk import BulkSetWriter
+from app.db.models import Video
+
+
+@pytest.mark.asyncio
+async def test_updates_flush_by_count_and_merge_per_document(make_video):
+    videos = [await make_video(f"TST-7{i:02}") for i in range(3)]
+    writer = BulkSetWriter(Video, max_items=2, max_wait=60)
+
+    await writer.set(videos[0].id, {"thumbnail_s3_url": "https://s3/a.jpg"})
+    await writer.set(videos[0].id, {"rewritten_title": "A"})
+    assert writer.written == 0
+    await writer.set(videos[1].id, {"thumbnail_s3_url": "https://s3/b.jpg"})
+    assert writer.written == 2
+
+    first = await Video.get(videos[0].id)
+    assert (str(first.thumbnail_s3_url), first.rewritten_title) == ("https://s3/a.jpg", "A")
+    assert (await Video.get(videos[2].id)).thumbnail_s3_url is None
+
+
+@pytest.mark.asyncio
+async def test_timer_flushes_a_slow_trickle_and_exit_flushes_the_rest(make_video):
+    videos = [await make_video(f"TST-7{i:02}") for i in range(2)]
+    async with BulkSetWriter(Video, max_items=100, max_wait=0.01) as writer:
+        await writer.set(videos[0].id, {"thumbnail_s3_url": "https://s3/a.jpg"})
+        await asyncio.sleep(0.05)
+        assert writer.written == 1
+        await writer.set(videos[1].id, {"thumbnail_s3_url": "https://s3/b.jpg"})
+
+    assert writer.written == 2
+    assert (await Video.get(videos[1].id)).thumbnail_s3_url is not None
@@ -0,0 +1,43 @@
+import pytest
+
+from app.parser.interactions import CHALLENGE_PROBE_JS, SeleniumService
+
+
+class FakeDriver:
+    def __init__(self, states):
+        self.states = list(states)
+        self.scripts = []
+
+    def set_page_load_timeout(self, timeout):
+        pass
+
+    def execute_script(self, script):
+        self.scripts.append(script)
+        return self.states.pop(0) if len(self.states) > 1 else self.states[0]
+
+    @property
+    def page_source(self):
+        raise AssertionError("page_source must not be pulled")
+
+
+@pytest.mark.parametrize(
+    "states, expected, probes",
+    [
+        (["ready"], False, 1),
+        (["loading", "loading", "ready"], False, 3),
+        (["loading", "challenge"], True, 2),
+    ],
+)
+def test_wait_for_challenge_returns_on_first_decisive_probe(states, expected, probes):
+    driver = FakeDriver(states)
+    selenium = SeleniumService(driver, clearances=None)
+
+    assert selenium._wait_for_challenge(timeout=5, poll_interval=0) is expected
+    assert driver.scripts == [CHALLENGE_PROBE_JS] * probes
+
+
+def test_wait_for_challenge_gives_up_on_endless_loading():
+    driver = FakeDriver(["loading"])
+    selenium = SeleniumService(driver, clearances=None)
+
+    assert selenium._wait_for_challenge(timeout=0.05, poll_interval=0.01) is False
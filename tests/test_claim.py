@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.models import DownloadProgress, Video, VideoSource
+from app.config import config
+from app.download.service import _finish_download, claim_videos_for_download, release_claim
+
+
+@pytest.mark.asyncio
+async def test_claim_moves_downloadable_videos_to_downloading(make_video):
+    parsed = await make_video("TST-101", "parsed")
+    resumable = await make_video("TST-102", "failed", download_progress=DownloadProgress(staging_key="k"))
+    await make_video("TST-103", "failed")
+    await make_video("TST-104", "added")
+    await make_video("TST-106", "failed", download_progress=DownloadProgress(staging_key="k"), download_attempts=5)
+    await make_video(
+        "TST-105", "parsed", sources=[VideoSource(origin="pornolab", resolution="1080p", s3_path="https://s3/x")]
+    )
+    upgradable = await make_video(
+        "TST-107", "parsed", sources=[VideoSource(origin="pornolab", resolution="720p", s3_path="https://s3/y")]
+    )
+
+    claim, ids = await claim_videos_for_download(limit=10)
+
+    assert sorted(ids) == sorted([str(parsed.id), str(resumable.id), str(upgradable.id)])
+    for video_id in ids:
+        video = await Video.get(video_id)
+        assert video.javguru_status == "downloading"
+        assert video.download_claim == claim
+
+
+@pytest.mark.asyncio
+async def test_overlapping_claims_never_share_a_video(make_video):
+    for i in range(5):
+        await make_video(f"TST-2{i:02}", "parsed")
+
+    results = await asyncio.gather(*(claim_videos_for_download(limit=3) for _ in range(3)))
+
+    claimed = [video_id for _, ids in results for video_id in ids]
+    assert len(claimed) == len(set(claimed))
+    assert 3 <= len(claimed) <= 5
+    assert len({claim for claim, _ in results}) == 3
+    for claim, ids in results:
+        for video_id in ids:
+            assert (await Video.get(video_id)).download_claim == claim
+
+
+@pytest.mark.asyncio
+async def test_last_failed_attempt_aborts_the_open_upload(make_video, monkeypatch):
+    aborted = []
+
+    async def fake_abort(key, upload_id):
+        aborted.append((key, upload_id))
+
+    monkeypatch.setattr("app.download.service.s3.abort_multipart_upload", fake_abort)
+    progress = DownloadProgress(staging_key="k", upload_id="u")
+    retry = await make_video("TST-301", "downloading", download_progress=progress, download_attempts=1)
+    spent = await make_video("TST-302", "downloading", download_progress=progress, download_attempts=5)
+
+    await _finish_download(retry, False)
+    await _finish_download(spent, False)
+
+    assert aborted == [("k", "u")]
+    assert (await Video.get(retry.id)).download_progress is not None
+    spent = await Video.get(spent.id)
+    assert spent.javguru_status == "failed" and spent.download_progress is None
+
+
+@pytest.mark.asyncio
+async def test_released_claim_returns_its_videos_to_the_pool(make_video):
+    await make_video("TST-401", "parsed")
+    claim, ids = await claim_videos_for_download(limit=10)
+
+    assert await release_claim(claim) == 1
+    video = await Video.get(ids[0])
+    assert video.javguru_status == "parsed"
+    assert video.download_claim is None
+
+    _, reclaimed = await claim_videos_for_download(limit=10)
+    assert reclaimed == ids
+
+
+@pytest.mark.asyncio
+async def test_stale_claims_are_taken_over(make_video):
+    timeout = timedelta(seconds=config.DOWNLOAD_CLAIM_TIMEOUT)
+    stale = await make_video(
+        "TST-402", "downloading", download_claim="dead", claimed_at=datetime.utcnow() - timeout - timedelta(minutes=1)
+    )
+    await make_video("TST-403", "downloading", download_claim="alive", claimed_at=datetime.utcnow())
+
+    claim, ids = await claim_videos_for_download(limit=10)
+
+    assert ids == [str(stale.id)]
+    assert (await Video.get(stale.id)).download_claim == claim
@@ -0,0 +1,135 @@
+import hashlib
+from io import BytesIO
+
+import pytest
+
+from app.db.models import MediaProbe, StoredObject, Video, VideoSource
+from app.download.dedupe import backfill_stored_objects, register_stored_object
+from app.download.service import GuruDownloader
+
+PAYLOAD = b"0123456789" * 1000
+MD5 = hashlib.md5(PAYLOAD).hexdigest()
+EXISTING_PATH = f"https://s3/videos/pornolab/ABC-001_{MD5}.mp4"
+
+
+class DummyParser:
+    def _extract_video_src(self, *_, **__):
+        return "http://fake/video.mp4"
+
+
+class DummySelenium:
+    def get(self, *_, **__):
+        return None
+
+
+async def fake_probe(*_, **__):
+    return MediaProbe(height=1080)
+
+
+@pytest.mark.asyncio
+async def test_buffer_mode_points_to_stored_object(monkeypatch, init_db):
+    """
+    Ensure that a file whose MD5 is already stored is not uploaded again.
+    """
+
+    async def fake_download(*_, **__):
+        return BytesIO(PAYLOAD)
+
+    async def fail_put(*_, **__):
+        raise AssertionError("duplicate must not be uploaded")
+
+    monkeypatch.setattr("app.download.service.GuruDownloader._download_to_buffer", fake_download)
+    monkeypatch.setattr("app.download.service.s3.put_object", fail_put)
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe)
+
+    await register_stored_object(MD5, EXISTING_PATH, "pornolab")
+    video = Video(title="Dup", jav_code="TST-020", page_link="https://x/dup", javguru_status="added")
+    await video.insert()
+
+    assert await GuruDownloader(DummySelenium(), DummyParser())(video)
+
+    saved = await Video.get(video.id)
+    assert saved.sources[0].s3_path == EXISTING_PATH
+    assert saved.sources[0].hash_md5 == MD5
+    assert saved.sources[0].file_size == len(PAYLOAD)
+    assert await StoredObject.count() == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_mode_aborts_duplicate_upload(monkeypatch, init_db):
+    """
+    Ensure that stream mode aborts the multipart upload instead of completing it when the MD5 is known.
+    """
+    events = []
+
+    class FakeUpload:
+        upload_id = "upload-1"
+        pending = len(PAYLOAD)
+
+        def __init__(self, key, **_):
+            self.key = key
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *_):
+            pass
+
+        async def write(self, chunk):
+            pass
+
+        async def abort(self):
+            events.append("abort")
+
+    async def fake_iter(self, url, *_, **__):
+        yield PAYLOAD
+
+    async def fail_move(*_, **__):
+        raise AssertionError("duplicate must not be moved into place")
+
+    async def fake_save_progress(video, progress):
+        pass
+
+    monkeypatch.setattr("app.download.service.GuruDownloader._iter_download", fake_iter)
+    monkeypatch.setattr("app.download.service.GuruDownloader._save_progress", staticmethod(fake_save_progress))
+    monkeypatch.setattr("app.download.service.s3.multipart_upload", lambda key, **kw: FakeUpload(key, **kw))
+    monkeypatch.setattr("app.download.service.s3.move_object", fail_move)
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe)
+
+    await register_stored_object(MD5, EXISTING_PATH, "pornolab")
+    video = Video(title="Dup", jav_code="TST-021", page_link="https://x/dup", javguru_status="added")
+    await video.insert()
+
+    assert await GuruDownloader(DummySelenium(), DummyParser(), mode="stream")(video)
+
+    assert events == ["abort"]
+    assert video.sources[0].s3_path == EXISTING_PATH
+    assert video.sources[0].file_size == len(PAYLOAD)
+
+
+@pytest.mark.asyncio
+async def test_backfill_registers_each_hash_once(init_db):
+    def source(origin, md5):
+        return VideoSource(origin=origin, resolution="1080p", s3_path=f"https://s3/{origin}/{md5}.mp4", hash_md5=md5)
+
+    await Video(
+        title="A",
+        jav_code="TST-030",
+        page_link="https://x/a",
+        javguru_status="downloaded",
+        sources=[source("guru", "aaa"), source("pornolab", "bbb")],
+    ).insert()
+    await Video(
+        title="B",
+        jav_code="TST-031",
+        page_link="https://x/b",
+        javguru_status="downloaded",
+        sources=[source("ijavtorrent", "aaa"), source("pornolab", "")],
+    ).insert()
+
+    assert await backfill_stored_objects() == 2
+    assert await backfill_stored_objects() == 0
+
+    stored = await StoredObject.find_one(StoredObject.hash_md5 == "aaa")
+    assert stored.s3_path == "https://s3/guru/aaa.mp4"
+    assert stored.file_name == "aaa.mp4"
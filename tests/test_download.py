@@ -1,4 +1,5 @@
 # tests/test_download.py
+import hashlib
 import io
 from unittest.mock import AsyncMock, patch
 
@@ -150,3 +151,87 @@ async def test_downloader_empty_content(mock_load_data):
         assert isinstance(result.content, io.BytesIO)
         assert len(result.content.getvalue()) == 0
         assert result.md5 == source["hash_md5"]
+
+
+@pytest.mark.asyncio
+async def test_downloader_spools_to_disk_above_threshold(mock_load_data):
+    data = mock_load_data("download_source.json")
+    record = next(r for r in data if r["jav_code"] == "MOCK-CHUNKS")
+    source = record["sources"][0]
+
+    fake_content = b"x" * source["file_size"]
+    chunks = [fake_content[i : i + 3] for i in range(0, len(fake_content), 3)] + [b""]
+    mock_response = MockResponse(fake_content)
+    mock_response._chunks = chunks.copy()
+    mock_session = MockSession(mock_response)
+
+    with patch("aiohttp.ClientSession") as mock_client_session:
+        mock_client_session.return_value.__aenter__ = AsyncMock(return_value=mock_session)
+        mock_client_session.return_value.__aexit__ = AsyncMock(return_value=None)
+
+        downloader = Downloader(chunk_size=3, spool_max_memory=4)
+        result: DownloadedFile = await downloader.download_file(url="https://fake.local/" + source["file_name"])
+
+    with result.content as spool:
+        assert spool.rolled_over
+        assert spool.size == source["file_size"]
+        with spool.view() as view:
+            assert bytes(view) == fake_content
+    assert result.md5 == source["hash_md5"]
+
+
+@pytest.mark.asyncio
+async def test_downloader_streams_into_async_sink_with_growing_reads():
+    fake_content = bytes(range(256)) * 64
+    read_sizes = []
+
+    class GreedyResponse(MockResponse):
+        def __init__(self, content: bytes):
+            super().__init__(content)
+            self._rest = content
+
+            async def _read(n):
+                read_sizes.append(n)
+                chunk, self._rest = self._rest[:n], self._rest[n:]
+                return chunk
+
+            self.content.read = AsyncMock(side_effect=_read)
+
+    class AsyncSink:
+        def __init__(self):
+            self.parts = []
+
+        async def write(self, data):
+            self.parts.append(data)
+
+    sink = AsyncSink()
+    with patch("aiohttp.ClientSession") as mock_client_session:
+        mock_client_session.return_value.__aenter__ = AsyncMock(return_value=MockSession(GreedyResponse(fake_content)))
+        mock_client_session.return_value.__aexit__ = AsyncMock(return_value=None)
+
+        result = await Downloader(chunk_size=256, max_chunk_size=4096).download_to("https://fake.local/a.mp4", sink)
+
+    assert b"".join(sink.parts) == fake_content
+    assert result.size == len(fake_content)
+    assert result.md5 == hashlib.md5(fake_content).hexdigest()
+    assert read_sizes[:5] == [256, 512, 1024, 2048, 4096]
+    assert max(read_sizes) == 4096
+
+
+@pytest.mark.asyncio
+async def test_downloader_reuses_one_session_inside_context():
+    class FreshResponseSession:
+        def get(self, url, *args, **kwargs):
+            return MockContextManager(MockResponse(url.encode()))
+
+    with patch("aiohttp.ClientSession") as mock_client_session:
+        mock_client_session.return_value.__aenter__ = AsyncMock(return_value=FreshResponseSession())
+        mock_client_session.return_value.__aexit__ = AsyncMock(return_value=None)
+
+        async with Downloader() as downloader:
+            first = await downloader.download_file("https://fake.local/a.mp4")
+            second = await downloader.download_file("https://fake.local/b.mp4")
+
+    assert first.content.getvalue() == b"https://fake.local/a.mp4"
+    assert second.content.getvalue() == b"https://fake.local/b.mp4"
+    assert mock_client_session.call_count == 1
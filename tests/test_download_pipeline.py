@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app.db.models import Video
+from app.download.service import claim_videos_for_download, run_download_pipeline
+
+
+class FakeDownloader:
+    def __init__(self, fail: set[str] = frozenset()):
+        self.fail = fail
+        self.events: list[tuple[str, str]] = []
+        self.resolves: dict[str, int] = {}
+
+    async def resolve(self, video: Video) -> str | None:
+        self.resolves[video.jav_code] = self.resolves.get(video.jav_code, 0) + 1
+        self.events.append(("resolved", video.jav_code))
+        return None if video.jav_code in self.fail else f"https://cdn/{video.jav_code}.mp4"
+
+    async def transfer(self, video: Video, src: str) -> bool:
+        self.events.append(("transfer_start", video.jav_code))
+        await asyncio.sleep(0.01)
+        self.events.append(("transfer_end", video.jav_code))
+        return True
+
+
+@pytest.mark.asyncio
+async def test_pipeline_resolves_ahead_of_transfers(make_video):
+    for i in range(4):
+        await make_video(f"TST-3{i:02}")
+    claim, ids = await claim_videos_for_download(limit=10)
+    downloader = FakeDownloader(fail={"TST-302"})
+
+    await run_download_pipeline(ids, downloader, claim, transfers=1, lookahead=2)
+
+    statuses = {v.jav_code: v.javguru_status for v in await Video.find_all().to_list()}
+    assert statuses == {"TST-300": "downloaded", "TST-301": "downloaded", "TST-302": "failed", "TST-303": "downloaded"}
+    assert all(v.download_claim is None for v in await Video.find_all().to_list())
+    # The next page is resolved while the first file is still transferring.
+    events = downloader.events
+    assert events.index(("resolved", "TST-301")) < events.index(("transfer_end", "TST-300"))
+
+
+@pytest.mark.asyncio
+async def test_expired_src_is_resolved_again(make_video):
+    for i in range(2):
+        await make_video(f"TST-3{i:02}")
+    claim, ids = await claim_videos_for_download(limit=10)
+    downloader = FakeDownloader()
+
+    await run_download_pipeline(ids, downloader, claim, transfers=2, src_ttl=-1)
+
+    assert downloader.resolves == {"TST-300": 2, "TST-301": 2}
+    assert {v.javguru_status for v in await Video.find_all().to_list()} == {"downloaded"}
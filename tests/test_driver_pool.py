@@ -0,0 +1,92 @@
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from app.parser.driver import DriverPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.alive = True
+        self.cookies = []
+        self.cdp_calls = []
+
+    def execute_script(self, script):
+        if not self.alive:
+            raise WebDriverException("browser is gone")
+        return "complete"
+
+    def get_cookies(self):
+        return self.cookies
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp_calls.append((cmd, params))
+
+
+class FakeSeleniumDriver:
+    started = []
+
+    def __init__(self, headless=True):
+        self.driver = FakeDriver()
+        self.quit = False
+        FakeSeleniumDriver.started.append(self)
+
+    def __exit__(self, *_):
+        self.quit = True
+
+
+@pytest.fixture
+def pool():
+    FakeSeleniumDriver.started = []
+    pool = DriverPool(size=1, max_uses=3, factory=FakeSeleniumDriver)
+    yield pool
+    pool.close()
+
+
+def test_lease_reuses_warm_browser(pool):
+    with pool.lease() as first:
+        pass
+    with pool.lease() as second:
+        pass
+    assert first is second
+    assert len(FakeSeleniumDriver.started) == 1
+
+
+def test_recycles_after_max_uses_and_keeps_cookies(pool):
+    clearance = {"name": "cf_clearance", "value": "abc", "domain": ".jav.guru", "path": "/", "expiry": 1900000000}
+    for _ in range(3):
+        with pool.lease() as driver:
+            driver.cookies = [clearance]
+
+    (first,) = FakeSeleniumDriver.started
+    assert first.quit
+
+    with pool.lease() as driver:
+        pass
+    assert len(FakeSeleniumDriver.started) == 2
+    cmd, params = driver.cdp_calls[0]
+    assert cmd == "Network.setCookies"
+    assert params["cookies"][0]["name"] == "cf_clearance"
+    assert params["cookies"][0]["expires"] == 1900000000
+
+
+def test_broken_browser_is_replaced(pool):
+    with pytest.raises(WebDriverException):
+        with pool.lease() as driver:
+            raise WebDriverException("tab crashed")
+    with pool.lease() as driver:
+        driver.alive = False
+    with pool.lease() as driver:
+        pass
+
+    assert len(FakeSeleniumDriver.started) == 3
+    assert all(holder.quit for holder in FakeSeleniumDriver.started[:2])
+
+
+def test_close_quits_idle_browsers(pool):
+    with pool.lease():
+        pass
+    pool.close()
+    assert FakeSeleniumDriver.started[0].quit
+    with pytest.raises(RuntimeError):
+        with pool.lease():
+            pass
@@ -2,10 +2,18 @@ from io import BytesIO
 
 import pytest
 
-from app.db.models import Video, VideoSource
+from app.db.models import MediaProbe, Video, VideoSource
+from app.download.probe import probe_media
 from app.download.service import GuruDownloader
 
 
+def fake_probe(height=None, runtime_minutes=None):
+    async def _probe(*_, **__):
+        return MediaProbe(height=height, duration_ms=runtime_minutes * 60000 if runtime_minutes else None)
+
+    return _probe
+
+
 # ---------- UNIT TESTS ----------
 @pytest.mark.parametrize(
     "height,expected",
@@ -17,15 +25,16 @@ from app.download.service import GuruDownloader
         (2160, "4k"),
     ],
 )
-def test_detect_resolution(monkeypatch, height, expected):
+def test_probe_resolution(monkeypatch, height, expected):
     """
-    Ensure that _detect_resolution correctly maps video height -> resolution string.
+    Ensure that probe_media correctly maps video height -> resolution string.
     """
 
     buf = BytesIO(b"fake")
 
     class FakeTrack:
         track_type = "Video"
+        format = width = duration = None
 
         def __init__(self, h):
             self.height = h
@@ -34,11 +43,11 @@ def test_detect_resolution(monkeypatch, height, expected):
         def __init__(self, h):
             self.tracks = [FakeTrack(h)]
 
-    monkeypatch.setattr("app.download.service.MediaInfo.parse", lambda *_: FakeMediaInfo(height))
+    monkeypatch.setattr("app.download.probe.MediaInfo.parse", lambda *_: FakeMediaInfo(height))
 
-    d = GuruDownloader(None, None)
-    res = d._detect_resolution(buf, "test.mp4")
-    assert res == expected
+    probe = probe_media(buf, "test.mp4")
+    assert probe.height == height
+    assert probe.resolution == expected
 
 
 @pytest.mark.parametrize(
@@ -49,15 +58,16 @@ def test_detect_resolution(monkeypatch, height, expected):
         (3_600_000, 60),
     ],
 )
-def test_detect_runtime(monkeypatch, duration, expected):
+def test_probe_runtime(monkeypatch, duration, expected):
     """
-    Ensure that _detect_runtime correctly converts duration (ms) -> minutes.
+    Ensure that probe_media correctly converts duration (ms) -> minutes.
     """
 
     buf = BytesIO(b"fake")
 
     class FakeTrack:
         track_type = "Video"
+        format = width = height = None
 
         def __init__(self, d):
             self.duration = d
@@ -66,11 +76,41 @@ def test_detect_runtime(monkeypatch, duration, expected):
         def __init__(self, d):
             self.tracks = [FakeTrack(d)]
 
-    monkeypatch.setattr("app.download.service.MediaInfo.parse", lambda *_: FakeMediaInfo(duration))
+    monkeypatch.setattr("app.download.probe.MediaInfo.parse", lambda *_: FakeMediaInfo(duration))
+
+    probe = probe_media(buf, "test.mp4")
+    assert probe.duration_ms == duration
+    assert probe.runtime_minutes == expected
+
+
+def test_probe_collects_codecs_and_container(monkeypatch):
+    """
+    Ensure that probe_media reads every track of a single parse into one MediaProbe.
+    """
+
+    class FakeTrack:
+        format = width = height = duration = overall_bit_rate = None
+
+        def __init__(self, track_type, **fields):
+            self.track_type = track_type
+            self.__dict__.update(fields)
+
+    class FakeMediaInfo:
+        tracks = [
+            FakeTrack("General", format="MPEG-4", overall_bit_rate=4_500_000, duration=7_260_000.0),
+            FakeTrack("Video", format="AVC", width=1920, height=1080, duration=7_200_000),
+            FakeTrack("Audio", format="AAC"),
+        ]
 
-    d = GuruDownloader(None, None)
-    res = d._detect_runtime(buf, "test.mp4")
-    assert res == expected
+    calls = []
+    monkeypatch.setattr("app.download.probe.MediaInfo.parse", lambda *a: calls.append(a) or FakeMediaInfo())
+
+    probe = probe_media(BytesIO(b"fake"), "test.mp4")
+    assert len(calls) == 1
+    assert (probe.container, probe.video_codec, probe.audio_codec) == ("MPEG-4", "AVC", "AAC")
+    assert (probe.width, probe.height, probe.bitrate) == (1920, 1080, 4_500_000)
+    assert probe.runtime_minutes == 120
+    assert probe.resolution == "1080p"
 
 
 # ---------- INTEGRATION TESTS ----------
@@ -96,8 +136,7 @@ async def test_download_one_full_video(monkeypatch, init_db):
 
     monkeypatch.setattr("app.download.service.GuruDownloader._download_to_buffer", fake_download)
     monkeypatch.setattr("app.download.service.s3.put_object", fake_put)
-    monkeypatch.setattr("app.download.service.GuruDownloader._detect_resolution", lambda *_: "1080p")
-    monkeypatch.setattr("app.download.service.GuruDownloader._detect_runtime", lambda *_: 99)
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe(height=1080, runtime_minutes=99))
 
     video = Video(
         title="Full Test Video",
@@ -154,6 +193,7 @@ async def test_download_one_full_video(monkeypatch, init_db):
     assert guru_src.file_size == 2048
     assert guru_src.hash_md5 is not None
     assert guru_src.s3_path.startswith("https://")
+    assert guru_src.probe.height == 1080
 
     assert saved.runtime_minutes == 99
 
@@ -180,8 +220,7 @@ async def test_download_one_sets_runtime(monkeypatch, init_db):
 
     monkeypatch.setattr("app.download.service.GuruDownloader._download_to_buffer", fake_download)
     monkeypatch.setattr("app.download.service.s3.put_object", fake_put)
-    monkeypatch.setattr("app.download.service.GuruDownloader._detect_resolution", lambda *_: "720p")
-    monkeypatch.setattr("app.download.service.GuruDownloader._detect_runtime", lambda *_: 99)
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe(height=720, runtime_minutes=99))
 
     video = Video(
         title="TestVid",
@@ -222,7 +261,7 @@ async def test_download_one_inserts_source(monkeypatch, init_db):
 
     monkeypatch.setattr("app.download.service.GuruDownloader._download_to_buffer", fake_download)
     monkeypatch.setattr("app.download.service.s3.put_object", fake_put)
-    monkeypatch.setattr("app.download.service.GuruDownloader._detect_resolution", lambda *_: "720p")
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe(height=720))
 
     video = Video(
         title="TestVid",
@@ -289,7 +328,7 @@ async def test_append_second_source(monkeypatch, init_db):
 
     monkeypatch.setattr("app.download.service.GuruDownloader._download_to_buffer", fake_download)
     monkeypatch.setattr("app.download.service.s3.put_object", fake_put)
-    monkeypatch.setattr("app.download.service.GuruDownloader._detect_resolution", lambda *_: "1080p")
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe(height=1080))
 
     downloader = GuruDownloader(DummySelenium(), DummyParser())
     ok = await downloader(video)
@@ -302,3 +341,332 @@ async def test_append_second_source(monkeypatch, init_db):
     origins = [s.origin for s in saved.sources]
     assert "guru" in origins
     assert "pornolab" in origins
+
+
+@pytest.mark.asyncio
+async def test_preprobe_skips_source_that_would_not_be_imported(monkeypatch, init_db):
+    """
+    Ensure that a remote file no better than the imported source is not downloaded at all.
+    """
+
+    video = Video(
+        title="TestVid",
+        jav_code="TST-001",
+        page_link="https://x/",
+        javguru_status="downloading",
+        sources=[VideoSource(origin="pornolab", status="imported", resolution="1080p", s3_path="https://s3/x.mp4")],
+    )
+    await video.insert()
+
+    class DummyParser:
+        def _extract_video_src(self, *_, **__):
+            return "http://fake/video.mp4"
+
+    class DummySelenium:
+        def get(self, *_, **__):
+            return None
+
+    async def fake_probe_remote(session, url):
+        return MediaProbe(height=1080)
+
+    async def fail_download(*_, **__):
+        raise AssertionError("low-value video must not be downloaded")
+
+    monkeypatch.setattr("app.download.service.probe_remote", fake_probe_remote)
+    monkeypatch.setattr("app.download.service.GuruDownloader._download_to_buffer", fail_download)
+
+    downloader = GuruDownloader(DummySelenium(), DummyParser(), preprobe=True)
+    assert not await downloader(video)
+    assert video.javguru_status == "skipped"
+    assert len(video.sources) == 1
+
+
+@pytest.mark.asyncio
+async def test_stream_mode_uploads_in_parts(monkeypatch, init_db):
+    """
+    Ensure that stream mode pipes chunks into a multipart upload and names the object by MD5.
+    """
+    import hashlib
+
+    payload = b"0123456789" * 1000
+    uploaded, moved = [], []
+
+    class DummyParser:
+        def _extract_video_src(self, *_, **__):
+            return "http://fake/video.mp4"
+
+    class DummySelenium:
+        def get(self, *_, **__):
+            return None
+
+    class FakeUpload:
+        upload_id = "upload-1"
+        pending = 1
+
+        def __init__(self, key, on_part=None, **_):
+            self.key = key
+            self.on_part = on_part
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *_):
+            await self.on_part(1, "etag-1", sum(len(c) for c in uploaded))
+
+        async def write(self, chunk):
+            uploaded.append(chunk)
+
+        async def abort(self):
+            uploaded.clear()
+
+    async def fake_iter(self, url, *_, **__):
+        for i in range(0, len(payload), 4096):
+            yield payload[i : i + 4096]
+
+    async def fake_move(source, target, size):
+        moved.append((source, target, size))
+
+    monkeypatch.setattr("app.download.service.GuruDownloader._iter_download", fake_iter)
+    monkeypatch.setattr("app.download.service.s3.multipart_upload", lambda key, **kw: FakeUpload(key, **kw))
+    monkeypatch.setattr("app.download.service.s3.move_object", fake_move)
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe(height=1080, runtime_minutes=42))
+
+    video = Video(title="Stream", jav_code="TST-010", page_link="https://x/stream", javguru_status="added")
+    await video.insert()
+
+    downloader = GuruDownloader(DummySelenium(), DummyParser(), mode="stream")
+    assert await downloader(video)
+
+    md5 = hashlib.md5(payload).hexdigest()
+    assert b"".join(uploaded) == payload
+    assert moved[0][1].endswith(f"TST-010_{md5}.mp4")
+    assert moved[0][2] == len(payload)
+
+    saved = await Video.get(video.id)
+    assert saved.sources[0].hash_md5 == md5
+    assert saved.sources[0].file_size == len(payload)
+    assert saved.runtime_minutes == 42
+
+
+@pytest.mark.asyncio
+async def test_stream_mode_resumes_from_confirmed_offset(monkeypatch, init_db):
+    """
+    Ensure that an interrupted streaming download continues with a Range request after the stored parts.
+    """
+    from app.db.models import DownloadProgress, UploadedPart
+    from app.download.utils import MediaWindow
+
+    requested_offsets, uploaded = [], []
+
+    class DummyParser:
+        def _extract_video_src(self, *_, **__):
+            return "http://fake/video.mp4"
+
+    class DummySelenium:
+        def get(self, *_, **__):
+            return None
+
+    class FakeUpload:
+        pending = 0
+
+        def __init__(self, key, upload_id=None, parts=None, on_part=None, **_):
+            self.upload_id = upload_id
+            self.parts = parts
+            self.on_part = on_part
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *_):
+            await self.on_part(len(self.parts) + 1, "etag-2", sum(len(c) for c in uploaded))
+
+        async def write(self, chunk):
+            uploaded.append(chunk)
+
+    async def fake_iter(self, url, start=0, **_):
+        requested_offsets.append(start)
+        yield b"tail-bytes"
+
+    async def fake_list_parts(key, upload_id):
+        return [{"PartNumber": 1, "ETag": "etag-1"}]
+
+    async def fake_scan(key):
+        import hashlib
+
+        return hashlib.md5(b"resumed"), MediaWindow()
+
+    async def fake_move(*_):
+        return None
+
+    monkeypatch.setattr("app.download.service.GuruDownloader._iter_download", fake_iter)
+    monkeypatch.setattr("app.download.service.GuruDownloader._scan_uploaded", staticmethod(fake_scan))
+    monkeypatch.setattr("app.download.service.s3.multipart_upload", lambda key, **kw: FakeUpload(key, **kw))
+    monkeypatch.setattr("app.download.service.s3.list_parts", fake_list_parts)
+    monkeypatch.setattr("app.download.service.s3.move_object", fake_move)
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe(height=1080, runtime_minutes=42))
+
+    video = Video(
+        title="Resume",
+        jav_code="TST-011",
+        page_link="https://x/resume",
+        javguru_status="failed",
+        download_progress=DownloadProgress(
+            staging_key="test-folder/TST-011_x.part",
+            upload_id="upload-1",
+            parts=[
+                UploadedPart(part_number=1, etag="etag-1", size=100),
+                UploadedPart(part_number=2, etag="etag-lost", size=100),
+            ],
+            bytes_received=200,
+            total_size=210,
+        ),
+    )
+    await video.insert()
+
+    downloader = GuruDownloader(DummySelenium(), DummyParser(), mode="stream")
+    assert await downloader(video)
+
+    assert requested_offsets == [100]
+    saved = await Video.get(video.id)
+    assert saved.download_progress is None
+    assert saved.sources[0].file_size == 110
+
+
+@pytest.mark.asyncio
+async def test_spool_mode_uploads_from_view(monkeypatch, init_db):
+    """
+    Ensure that spool mode rolls big downloads to disk, probes the file by path and uploads it in parts.
+    """
+    import hashlib
+
+    payload = b"abcdefgh" * 1024
+    uploaded, probed = [], []
+
+    class DummyParser:
+        def _extract_video_src(self, *_, **__):
+            return "http://fake/video.mp4"
+
+    class DummySelenium:
+        def get(self, *_, **__):
+            return None
+
+    class FakeUpload:
+        part_size = 3000
+
+        def __init__(self, key, **_):
+            self.key = key
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *_):
+            return None
+
+        async def write(self, chunk):
+            uploaded.append(bytes(chunk))
+
+    async def fake_iter(self, url, *_, **__):
+        for i in range(0, len(payload), 1000):
+            yield payload[i : i + 1000]
+
+    async def fake_probe_spool(buf, name):
+        probed.append(buf.name)
+        return MediaProbe(height=720, duration_ms=7 * 60000)
+
+    monkeypatch.setattr("app.download.service.GuruDownloader._iter_download", fake_iter)
+    monkeypatch.setattr("app.download.service.s3.multipart_upload", lambda key, **kw: FakeUpload(key, **kw))
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe_spool)
+
+    video = Video(title="Spool", jav_code="TST-012", page_link="https://x/spool", javguru_status="added")
+    await video.insert()
+
+    downloader = GuruDownloader(DummySelenium(), DummyParser(), mode="spool", spool_max_memory=4096)
+    assert await downloader(video)
+
+    assert b"".join(uploaded) == payload
+    assert probed[0] and probed[0].endswith(".mp4")
+
+    saved = await Video.get(video.id)
+    assert saved.sources[0].hash_md5 == hashlib.md5(payload).hexdigest()
+    assert saved.sources[0].file_size == len(payload)
+
+
+@pytest.mark.asyncio
+async def test_stream_mode_completes_a_fully_uploaded_file_without_fetching(monkeypatch, init_db):
+    """
+    Ensure that when every part is confirmed the upload is completed instead of requesting an empty Range.
+    """
+    from app.db.models import DownloadProgress, UploadedPart
+    from app.download.utils import MediaWindow
+
+    requested_offsets, completed = [], []
+
+    class DummyParser:
+        def _extract_video_src(self, *_, **__):
+            return "http://fake/video.mp4"
+
+    class DummySelenium:
+        def get(self, *_, **__):
+            return None
+
+    class FakeUpload:
+        pending = 0
+
+        def __init__(self, key, upload_id=None, parts=None, **_):
+            self.upload_id = upload_id
+            self.parts = parts
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *_):
+            completed.append(self.parts)
+
+    async def fake_iter(self, url, start=0, **_):
+        requested_offsets.append(start)
+        yield b""
+
+    async def fake_list_parts(key, upload_id):
+        return [{"PartNumber": 1, "ETag": "etag-1"}, {"PartNumber": 2, "ETag": "etag-2"}]
+
+    async def fake_scan(key):
+        import hashlib
+
+        return hashlib.md5(b"complete"), MediaWindow()
+
+    async def fake_move(*_):
+        return None
+
+    monkeypatch.setattr("app.download.service.GuruDownloader._iter_download", fake_iter)
+    monkeypatch.setattr("app.download.service.GuruDownloader._scan_uploaded", staticmethod(fake_scan))
+    monkeypatch.setattr("app.download.service.s3.multipart_upload", lambda key, **kw: FakeUpload(key, **kw))
+    monkeypatch.setattr("app.download.service.s3.list_parts", fake_list_parts)
+    monkeypatch.setattr("app.download.service.s3.move_object", fake_move)
+    monkeypatch.setattr("app.download.service.probe_media_async", fake_probe(height=1080, runtime_minutes=42))
+
+    video = Video(
+        title="Complete",
+        jav_code="TST-012",
+        page_link="https://x/complete",
+        javguru_status="failed",
+        download_progress=DownloadProgress(
+            staging_key="test-folder/TST-012_x.part",
+            upload_id="upload-1",
+            parts=[
+                UploadedPart(part_number=1, etag="etag-1", size=100),
+                UploadedPart(part_number=2, etag="etag-2", size=50),
+            ],
+            bytes_received=150,
+            total_size=150,
+        ),
+    )
+    await video.insert()
+
+    downloader = GuruDownloader(DummySelenium(), DummyParser(), mode="stream")
+    assert await downloader(video)
+
+    assert requested_offsets == []
+    assert len(completed) == 1
+    saved = await Video.get(video.id)
+    assert saved.download_progress is None
+    assert saved.sources[0].file_size == 150
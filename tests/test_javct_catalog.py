@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta
+
+import pytest
+from selectolax.lexbor import LexborHTMLParser as HTMLTree
+
+from app.db.models import CatalogHarvest, JavctCatalogEntry, Video
+from app.parser.service import Parser
+from app.parser.sites.javct import JavctAdapter
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex><sitemap><loc>https://javct.net/sitemap-videos-1.xml</loc></sitemap></sitemapindex>"""
+
+SITEMAP_VIDEOS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset>
+  <url><loc>https://javct.net/v/abc-123</loc><lastmod>2024-05-01</lastmod></url>
+  <url><loc>https://javct.net/v/XYZ-001/</loc></url>
+  <url><loc>https://javct.net/category/cosplay</loc></url>
+</urlset>"""
+
+
+@pytest.fixture
+def fake_sitemap(monkeypatch):
+    pages = {
+        JavctAdapter.SITEMAP_URL: SITEMAP_INDEX,
+        "https://javct.net/sitemap-videos-1.xml": SITEMAP_VIDEOS,
+    }
+
+    async def fake_request(self, url):
+        return HTMLTree(pages[url]) if url in pages else None
+
+    async def no_sleep(*_):
+        return None
+
+    monkeypatch.setattr(JavctAdapter, "_request", fake_request)
+    monkeypatch.setattr("app.parser.sites.javct.asyncio.sleep", no_sleep)
+    return pages
+
+
+@pytest.mark.asyncio
+async def test_harvest_catalog_reads_nested_sitemaps(init_db, fake_sitemap):
+    entries = await JavctAdapter().harvest_catalog()
+
+    assert sorted(e.jav_code for e in entries) == ["abc-123", "xyz-001"]
+    abc = next(e for e in entries if e.jav_code == "abc-123")
+    assert str(abc.url) == "https://javct.net/v/abc-123"
+    assert abc.last_modified is not None
+
+
+@pytest.mark.asyncio
+async def test_unlisted_videos_are_enriched_without_requests(init_db, fake_sitemap):
+    for code in ("ABC-123", "NOPE-999"):
+        await Video(title=code, jav_code=code, page_link=f"https://x/{code}", javguru_status="parsed").insert()
+
+    parser = Parser(adapter=JavctAdapter())
+    assert await parser.get_catalog() == 2
+    assert await JavctCatalogEntry.count() == 2
+
+    catalog = await parser.adapter.load_catalog()
+    assert await parser._mark_unlisted_as_enriched("javct_enriched", catalog) == 1
+
+    listed = await Video.find_one(Video.jav_code == "ABC-123")
+    unlisted = await Video.find_one(Video.jav_code == "NOPE-999")
+    assert listed.javct_enriched is False
+    assert unlisted.javct_enriched is True
+
+
+@pytest.mark.asyncio
+async def test_failed_nested_sitemap_aborts_the_harvest_and_the_join(init_db, fake_sitemap):
+    del fake_sitemap["https://javct.net/sitemap-videos-1.xml"]
+    await Video(title="t", jav_code="ABC-123", page_link="https://x/ABC-123", javguru_status="parsed").insert()
+    await JavctCatalogEntry(jav_code="old-001", url="https://javct.net/v/old-001").insert()
+
+    parser = Parser(adapter=JavctAdapter())
+    assert await parser.get_catalog() == 0
+    assert await CatalogHarvest.count() == 0
+
+    catalog = await parser.adapter.load_catalog()
+    assert await parser._mark_unlisted_as_enriched("javct_enriched", catalog) == 0
+    assert (await Video.find_one(Video.jav_code == "ABC-123")).javct_enriched is False
+
+
+@pytest.mark.asyncio
+async def test_join_is_skipped_after_a_stale_harvest(init_db, fake_sitemap):
+    await Video(title="t", jav_code="NOPE-999", page_link="https://x/NOPE-999", javguru_status="parsed").insert()
+    parser = Parser(adapter=JavctAdapter())
+    await parser.get_catalog()
+    harvest = await CatalogHarvest.find_one(CatalogHarvest.site == "javct")
+    assert harvest.entries == 2
+    harvest.completed_at = datetime.utcnow() - timedelta(days=30)
+    await harvest.save()
+
+    catalog = await parser.adapter.load_catalog()
+    assert await parser._mark_unlisted_as_enriched("javct_enriched", catalog) == 0
+
+
+@pytest.mark.asyncio
+async def test_later_harvest_reopens_codes_the_join_skipped(init_db, fake_sitemap):
+    await Video(title="t", jav_code="NEW-777", page_link="https://x/NEW-777", javguru_status="parsed").insert()
+    parser = Parser(adapter=JavctAdapter())
+    await parser.get_catalog()
+    assert await parser._mark_unlisted_as_enriched("javct_enriched", await parser.adapter.load_catalog()) == 1
+    missed = await Video.find_one(Video.jav_code == "NEW-777")
+    assert missed.javct_enriched is True and missed.javct_catalog_miss_at is not None
+
+    fake_sitemap["https://javct.net/sitemap-videos-1.xml"] = SITEMAP_VIDEOS.replace(
+        b"</urlset>", b"<url><loc>https://javct.net/v/new-777</loc></url></urlset>"
+    )
+    await parser.get_catalog()
+
+    reopened = await Video.find_one(Video.jav_code == "NEW-777")
+    assert reopened.javct_enriched is False and reopened.javct_catalog_miss_at is None
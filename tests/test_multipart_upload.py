@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import hashlib
+
+import pytest
+from botocore.exceptions import ClientError
+
+from app.infra.s3 import MultipartUpload, S3Client
+
+PART = MultipartUpload.MIN_PART_SIZE
+
+
+def client_error(status: int, code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "UploadPart")
+
+
+class FakeBotoClient:
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self.parts: dict[int, bytes] = {}
+        self.active = self.max_active = 0
+        self.completed = None
+        self.aborted = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        pass
+
+    async def create_multipart_upload(self, **_):
+        return {"UploadId": "upload-1"}
+
+    async def upload_part(self, PartNumber, Body, ContentMD5, **_):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            # Later parts finish first, so completions arrive out of order.
+            await asyncio.sleep(0.01 / PartNumber)
+            if self.failures:
+                raise self.failures.pop(0)
+            assert ContentMD5 == base64.b64encode(hashlib.md5(Body).digest()).decode()
+            self.parts[PartNumber] = Body
+            return {"ETag": f'"etag-{PartNumber}"'}
+        finally:
+            self.active -= 1
+
+    async def complete_multipart_upload(self, MultipartUpload, **_):
+        self.completed = MultipartUpload["Parts"]
+        return {"Key": "video.mp4"}
+
+    async def abort_multipart_upload(self, **_):
+        self.aborted = True
+
+
+class FakeSession:
+    def __init__(self, client):
+        self.client = client
+
+    def create_client(self, *_, **__):
+        return self.client
+
+
+def make_s3(boto: FakeBotoClient) -> S3Client:
+    s3 = S3Client("s3.local", "key", "secret", "videos")
+    s3._session = FakeSession(boto)
+    return s3
+
+
+@pytest.mark.asyncio
+async def test_parts_upload_concurrently_and_report_in_order():
+    boto = FakeBotoClient()
+    payload = bytes(range(256)) * (PART * 4 // 256) + b"tail"
+    reported = []
+
+    async def on_part(number, etag, size):
+        reported.append(number)
+
+    async with make_s3(boto).multipart_upload("video.mp4", part_size=PART, on_part=on_part, concurrency=3) as upload:
+        for offset in range(0, len(payload), 1_000_000):
+            await upload.write(payload[offset : offset + 1_000_000])
+
+    assert boto.max_active == 3
+    assert reported == [1, 2, 3, 4, 5]
+    assert [p["PartNumber"] for p in boto.completed] == [1, 2, 3, 4, 5]
+    assert b"".join(boto.parts[n] for n in sorted(boto.parts)) == payload
+    assert upload.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_transient_part_errors_are_retried_and_fatal_ones_abort():
+    boto = FakeBotoClient(failures=[client_error(503, "SlowDown")])
+    s3 = make_s3(boto)
+    upload = MultipartUpload(s3, "video.mp4", retry_backoff=0)
+    async with upload:
+        await upload.write(b"x" * 10)
+    assert boto.parts == {1: b"x" * 10}
+
+    boto = FakeBotoClient(failures=[client_error(403, "AccessDenied")])
+    with pytest.raises(ClientError):
+        async with MultipartUpload(make_s3(boto), "video.mp4", retry_backoff=0) as upload:
+            await upload.write(b"x" * PART)
+    assert boto.aborted and boto.completed is None
+
+
+@pytest.mark.asyncio
+async def test_upload_file_reads_parts_from_mmap(tmp_path):
+    path = tmp_path / "video.mp4"
+    payload = b"v" * (PART * 2 + 123)
+    path.write_bytes(payload)
+    boto = FakeBotoClient()
+
+    assert await make_s3(boto).upload_file(path, "video.mp4", part_size=PART) == {"Key": "video.mp4"}
+
+    assert [len(boto.parts[n]) for n in sorted(boto.parts)] == [PART, PART, 123]
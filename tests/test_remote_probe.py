@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from app.db.models import MediaProbe, VideoSource
+from app.download.probe import probe_remote
+from app.utils.csv_dump import CSVDump
+
+PAYLOAD = bytes(random.Random(3).getrandbits(8) for _ in range(10_000))
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: bytes, headers: dict):
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    async def read(self):
+        return self._body
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class FakeRangeSession:
+    def __init__(self, ranges: bool = True):
+        self.ranges = ranges
+        self.requested = []
+
+    def get(self, url, headers=None, **_):
+        first, last = (int(x) for x in headers["Range"].removeprefix("bytes=").split("-"))
+        self.requested.append((first, last))
+        if not self.ranges:
+            return FakeResponse(200, PAYLOAD, {"Content-Length": str(len(PAYLOAD))})
+        last = min(last, len(PAYLOAD) - 1)
+        return FakeResponse(206, PAYLOAD[first : last + 1], {"Content-Range": f"bytes {first}-{last}/{len(PAYLOAD)}"})
+
+
+@pytest.mark.asyncio
+async def test_probe_remote_fetches_head_and_tail_only(monkeypatch):
+    seen = {}
+
+    def fake_probe_media(buf, file_name=""):
+        data = buf.read()
+        seen.update(size=len(data), head=data[:1000], tail=data[-1000:], middle=data[5000:6000])
+        return MediaProbe(height=1080, duration_ms=3_600_000)
+
+    monkeypatch.setattr("app.download.probe.probe_media", fake_probe_media)
+    session = FakeRangeSession()
+
+    probe = await probe_remote(session, "https://cdn/video.mp4", window_size=1000)
+
+    assert probe.resolution == "1080p"
+    assert session.requested == [(0, 999), (9000, 9999)]
+    assert seen["size"] == len(PAYLOAD)
+    assert seen["head"] == PAYLOAD[:1000]
+    assert seen["tail"] == PAYLOAD[-1000:]
+    assert seen["middle"] == bytes(1000)
+
+
+@pytest.mark.asyncio
+async def test_probe_remote_gives_up_without_range_support():
+    session = FakeRangeSession(ranges=False)
+    assert await probe_remote(session, "https://cdn/video.mp4", window_size=1000) is None
+    assert session.requested == [(0, 999)]
+
+
+def test_would_import_only_upgrades():
+    imported = [VideoSource(origin="pornolab", status="imported", resolution="1080p", s3_path="")]
+
+    assert CSVDump.would_import([], "720p")
+    assert not CSVDump.would_import([], "480p")
+    assert not CSVDump.would_import(imported, "1080p")
+    assert CSVDump.would_import(imported, "4k")
@@ -0,0 +1,59 @@
+import json
+
+from app.parser.blocking import SITE_RULES, BlockingRules, blocked_patterns, is_blocked
+from app.parser.interactions import SeleniumService
+
+
+def perf_entry(url: str) -> dict:
+    message = {"message": {"method": "Network.requestWillBeSent", "params": {"request": {"url": url}}}}
+    return {"message": json.dumps(message)}
+
+
+class FakeDriver:
+    def __init__(self, logs=()):
+        self.cdp = []
+        self.logs = [[], *logs]
+
+    def set_page_load_timeout(self, timeout):
+        pass
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp.append((cmd, params))
+
+    def get_log(self, kind):
+        return self.logs.pop(0) if self.logs else []
+
+
+def test_site_rules_extend_and_exempt_defaults(monkeypatch):
+    monkeypatch.setitem(SITE_RULES, "example.com", BlockingRules(deny=["*/player-ads/*"], allow=["*.woff*"]))
+
+    patterns = blocked_patterns("https://www.example.com/video/1")
+    assert "*/player-ads/*" in patterns
+    assert "*.woff*" not in patterns
+    assert "*.woff*" in blocked_patterns("https://jav.guru/")
+    assert is_blocked("https://www.googletagmanager.com/gtm.js?id=1", patterns)
+    assert not is_blocked("https://cdn.example.com/video.mp4", patterns)
+
+
+def test_blocked_urls_are_set_once_per_site():
+    driver = FakeDriver()
+    selenium = SeleniumService(driver, clearances=None, blocking=True)
+
+    selenium._apply_blocking("https://jav.guru/1/")
+    selenium._apply_blocking("https://jav.guru/2/")
+
+    assert [cmd for cmd, _ in driver.cdp] == ["Network.enable", "Network.setBlockedURLs"]
+    assert driver.cdp[1][1]["urls"] == blocked_patterns("https://jav.guru/")
+
+
+def test_get_media_url_returns_first_unblocked_media_request():
+    driver = FakeDriver(
+        logs=[
+            [perf_entry("https://jav.guru/1/"), perf_entry("https://ads.exoclick.com/preroll.mp4")],
+            [perf_entry("https://cdn.example/v/abc.m3u8?t=1"), perf_entry("https://cdn.example/v/seg1.ts")],
+        ]
+    )
+    selenium = SeleniumService(driver, clearances=None, blocking=True)
+
+    assert selenium.get_media_url("https://jav.guru/1/", timeout=1) == "https://cdn.example/v/abc.m3u8?t=1"
+    assert [cmd for cmd, _ in driver.cdp][-2:] == ["Page.navigate", "Page.stopLoading"]
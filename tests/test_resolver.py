@@ -0,0 +1,69 @@
+import base64
+
+import pytest
+
+from app.download.resolver import SrcResolver, find_media_url
+
+PAGE = "https://jav.guru/123/abc-001/"
+
+
+def test_find_media_url_prefers_video_tag():
+    html = '<video><source src="/media/abc.mp4"></video><iframe src="https://player.example/e/1"></iframe>'
+    assert find_media_url(html, PAGE) == ("https://jav.guru/media/abc.mp4", [])
+
+
+def test_find_media_url_reads_escaped_url_from_inline_script():
+    html = '<script>var player = {"file":"https:\\/\\/cdn.example\\/v\\/abc.m3u8?token=1"};</script>'
+    assert find_media_url(html, PAGE) == ("https://cdn.example/v/abc.m3u8?token=1", [])
+
+
+def test_find_media_url_collects_iframes_to_follow():
+    encoded = base64.b64encode(b"https://jav.guru/searcho/?dr=xyz").decode()
+    html = (
+        f'<script>var OLID = {{"iframe_url":"{encoded}"}};</script>'
+        '<iframe data-src="//player.example/e/1"></iframe><video src="blob:https://jav.guru/1"></video>'
+    )
+    media_url, iframes = find_media_url(html, PAGE)
+    assert media_url is None
+    assert iframes == ["https://jav.guru/searcho/?dr=xyz", "https://player.example/e/1"]
+
+
+@pytest.fixture
+def fresh_stats(monkeypatch):
+    monkeypatch.setattr(SrcResolver, "attempts", SrcResolver.attempts.__class__())
+    monkeypatch.setattr(SrcResolver, "hits", SrcResolver.hits.__class__())
+
+
+@pytest.mark.asyncio
+async def test_resolver_follows_iframe_chain(monkeypatch, fresh_stats):
+    pages = {
+        PAGE: '<iframe src="https://player.example/e/1"></iframe>',
+        "https://player.example/e/1": '<script>sources: [{file: "https://cdn.example/abc.mp4"}]</script>',
+    }
+    referers = []
+
+    async def fake_fetch(session, url, referer, proxy):
+        referers.append(referer)
+        return pages.get(url)
+
+    def fail_fallback(page_url):
+        raise AssertionError("browser must not be used when HTTP works")
+
+    monkeypatch.setattr(SrcResolver, "_fetch", staticmethod(fake_fetch))
+
+    resolver = SrcResolver(fallback=fail_fallback, proxy_pool=[])
+    assert await resolver.resolve(PAGE) == "https://cdn.example/abc.mp4"
+    assert referers == [None, PAGE]
+    assert SrcResolver.success_rates() == "http 1/1 (100%)"
+
+
+@pytest.mark.asyncio
+async def test_resolver_falls_back_to_browser(monkeypatch, fresh_stats):
+    async def challenged(session, url, referer, proxy):
+        return None
+
+    monkeypatch.setattr(SrcResolver, "_fetch", staticmethod(challenged))
+
+    resolver = SrcResolver(fallback=lambda page_url: "https://cdn.example/from-browser.mp4", proxy_pool=[])
+    assert await resolver.resolve(PAGE) == "https://cdn.example/from-browser.mp4"
+    assert SrcResolver.success_rates() == "http 0/1 (0%) · browser 1/1 (100%)"
@@ -0,0 +1,63 @@
+import io
+
+import pytest
+
+from app.infra.s3 import S3Client
+
+
+class FakeClient:
+    def __init__(self, session):
+        self.session = session
+
+    async def __aenter__(self):
+        self.session.opened += 1
+        return self
+
+    async def __aexit__(self, *_):
+        self.session.closed += 1
+
+    async def put_object(self, **kwargs):
+        return {"ETag": '"etag"'}
+
+    async def head_object(self, **kwargs):
+        return {"ContentLength": 1}
+
+    async def generate_presigned_url(self, method, Params, ExpiresIn):
+        return f"https://s3/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class FakeSession:
+    def __init__(self):
+        self.opened = self.closed = 0
+        self.configs = []
+
+    def create_client(self, service, config=None, **kwargs):
+        self.configs.append(config)
+        return FakeClient(self)
+
+
+@pytest.fixture
+def client():
+    s3 = S3Client("s3.local", "key", "secret", "videos", max_pool_connections=7)
+    s3._session = FakeSession()
+    return s3
+
+
+@pytest.mark.asyncio
+async def test_started_client_is_reused_until_closed(client):
+    async with client:
+        for _ in range(3):
+            await client.put_object(io.BytesIO(b"x"), "a.jpg")
+        await client.object_info("a.jpg")
+        assert (client._session.opened, client._session.closed) == (1, 0)
+    assert client._session.closed == 1
+    assert client._session.configs[0].max_pool_connections == 7
+
+
+@pytest.mark.asyncio
+async def test_calls_without_start_use_one_off_clients(client):
+    await client.put_object(io.BytesIO(b"x"), "a.jpg")
+    await client.object_info("a.jpg")
+    assert (client._session.opened, client._session.closed) == (2, 2)
+
+    assert await client.get_download_link("a.jpg") == "https://s3/videos/a.jpg?expires=3600"
@@ -0,0 +1,161 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import config
+from app.db.models import DownloadProgress, S3ObjectEntry, StoredObject, Video, VideoSource
+from app.download.s3_index import find_orphans, refresh_s3_index, repair_sources
+
+VIDEOS = f"{config.S3_JAVGURU_FOLDER}/"
+THUMBS = f"{config.S3_THUMBNAILS_FOLDER}/"
+
+
+def url(key: str) -> str:
+    return f"https://s3.example.com/{config.S3_BUCKET}/{key}"
+
+
+class FakeS3:
+    def __init__(self, keys: dict[str, int]):
+        self.keys = keys
+
+    async def iter_objects(self, prefix):
+        for key, size in self.keys.items():
+            if key.startswith(prefix):
+                yield {"Key": key, "Size": size, "ETag": f'"{key}-etag"'}
+
+    async def object_exists(self, key):
+        return key in self.keys
+
+
+@pytest.mark.asyncio
+async def test_refresh_upserts_listed_objects_and_drops_missing_ones(init_db):
+    await refresh_s3_index(s3_client=FakeS3({f"{VIDEOS}a.mp4": 10, f"{THUMBS}a.jpg": 1}), batch_size=1)
+    await refresh_s3_index(s3_client=FakeS3({f"{VIDEOS}a.mp4": 20}))
+
+    entries = await S3ObjectEntry.find_all().to_list()
+    assert [(e.key, e.size, e.etag) for e in entries] == [(f"{VIDEOS}a.mp4", 20, f"{VIDEOS}a.mp4-etag")]
+
+
+@pytest.mark.asyncio
+async def test_orphans_and_source_repair(init_db):
+    bucket = {
+        f"{VIDEOS}kept.mp4": 100,
+        f"{VIDEOS}stored.mp4": 5,
+        f"{VIDEOS}staging.part": 5,
+        f"{VIDEOS}orphan.mp4": 7,
+        f"{THUMBS}kept.jpg": 1,
+    }
+    s3 = FakeS3(bucket)
+    await refresh_s3_index(s3_client=s3)
+    listed = datetime.utcnow() - timedelta(minutes=1)
+    await S3ObjectEntry.find_all().update({"$set": {"seen_at": listed}})
+    video = Video(
+        title="t",
+        jav_code="TST-501",
+        page_link="https://x/1",
+        javguru_status="downloaded",
+        thumbnail_s3_url=url(f"{THUMBS}gone.jpg"),
+        sources=[
+            VideoSource(origin="guru", resolution="1080p", s3_path=url(f"{VIDEOS}kept.mp4"), created_at=listed),
+            VideoSource(
+                origin="guru", resolution="720p", s3_path=url(f"{VIDEOS}gone.mp4"), file_size=3, created_at=listed
+            ),
+            VideoSource(origin="pornolab", resolution="720p", s3_path="https://other-bucket/pornolab/x.mp4"),
+        ],
+        download_progress=DownloadProgress(staging_key=f"{VIDEOS}staging.part"),
+    )
+    await video.insert()
+    await StoredObject(hash_md5="m", s3_path=url(f"{VIDEOS}stored.mp4"), origin="guru").insert()
+    await StoredObject(
+        hash_md5="g", s3_path=url(f"{VIDEOS}gone.mp4"), origin="guru", created_at=listed - timedelta(days=1)
+    ).insert()
+
+    assert [e.key for e in await find_orphans()] == [f"{VIDEOS}orphan.mp4", f"{THUMBS}kept.jpg"]
+
+    assert await repair_sources(dry_run=True, s3_client=s3) == {
+        "sources_deleted": 1,
+        "sizes_filled": 1,
+        "thumbnails_cleared": 1,
+        "stored_objects_deleted": 1,
+    }
+    assert (await Video.get(video.id)).thumbnail_s3_url is not None
+
+    await repair_sources(s3_client=s3)
+    repaired = await Video.get(video.id)
+    assert [(s.status, s.file_size) for s in repaired.sources] == [("saved", 100), ("deleted", 3), ("saved", 0)]
+    assert repaired.thumbnail_s3_url is None
+    assert [obj.hash_md5 for obj in await StoredObject.find_all().to_list()] == ["m"]
+
+
+@pytest.mark.asyncio
+async def test_repair_leaves_objects_uploaded_after_the_listing(init_db):
+    s3 = FakeS3({f"{VIDEOS}old.mp4": 1})
+    await refresh_s3_index(s3_client=s3)
+    # Uploaded while or after the folder was listed, so the index doesn't have them yet.
+    s3.keys.update({f"{VIDEOS}new.mp4": 1, f"{VIDEOS}late.mp4": 1, f"{THUMBS}new.jpg": 1})
+    video = Video(
+        title="t",
+        jav_code="TST-502",
+        page_link="https://x/2",
+        javguru_status="downloaded",
+        thumbnail_s3_url=url(f"{THUMBS}new.jpg"),
+        sources=[
+            VideoSource(origin="guru", resolution="1080p", s3_path=url(f"{VIDEOS}new.mp4")),
+            VideoSource(
+                origin="guru",
+                resolution="720p",
+                s3_path=url(f"{VIDEOS}late.mp4"),
+                created_at=datetime.utcnow() - timedelta(days=1),
+            ),
+        ],
+    )
+    await video.insert()
+    await StoredObject(hash_md5="n", s3_path=url(f"{VIDEOS}new.mp4"), origin="guru").insert()
+
+    assert await repair_sources(s3_client=s3) == {
+        "sources_deleted": 0,
+        "sizes_filled": 0,
+        "thumbnails_cleared": 0,
+        "stored_objects_deleted": 0,
+    }
+    repaired = await Video.get(video.id)
+    assert [s.status for s in repaired.sources] == ["saved", "saved"]
+    assert repaired.thumbnail_s3_url is not None
+    assert await StoredObject.count() == 1
+
+
+@pytest.mark.asyncio
+async def test_repair_keeps_changes_made_while_it_ran(init_db):
+    s3 = FakeS3({f"{VIDEOS}kept.mp4": 1, f"{THUMBS}kept.jpg": 1})
+    await refresh_s3_index(s3_client=s3)
+    listed = datetime.utcnow() - timedelta(days=1)
+    video = Video(
+        title="t",
+        jav_code="TST-503",
+        page_link="https://x/3",
+        javguru_status="downloaded",
+        thumbnail_s3_url=url(f"{THUMBS}gone.jpg"),
+        sources=[VideoSource(origin="guru", resolution="720p", s3_path=url(f"{VIDEOS}gone.mp4"), created_at=listed)],
+    )
+    await video.insert()
+    concurrent = VideoSource(origin="guru", resolution="1080p", s3_path=url(f"{VIDEOS}fresh.mp4"))
+
+    async def object_exists(key):
+        # A download and a thumbnail run finish while repair is checking the video.
+        stored = await Video.get(video.id)
+        if key.endswith("gone.mp4"):
+            stored.sources.append(concurrent)
+        else:
+            stored.thumbnail_s3_url = url(f"{THUMBS}fresh.jpg")
+        await stored.save()
+        return False
+
+    s3.object_exists = object_exists
+    await repair_sources(s3_client=s3)
+
+    repaired = await Video.get(video.id)
+    assert [(s.s3_path, s.status) for s in repaired.sources] == [
+        (url(f"{VIDEOS}gone.mp4"), "deleted"),
+        (url(f"{VIDEOS}fresh.mp4"), "saved"),
+    ]
+    assert str(repaired.thumbnail_s3_url) == url(f"{THUMBS}fresh.jpg")
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from app.db.models import Video
+from app.download import scheduler
+from app.download.scheduler import DownloadCandidate, TransferScheduler, schedule
+from app.download.service import claim_videos_for_download
+
+
+def candidate(site="jav.guru", **fields) -> DownloadCandidate:
+    return DownloadCandidate(_id="0" * 24, site=site, **fields)
+
+
+def test_priority_keys_and_site_turns():
+    old = candidate(release_date=datetime(2020, 1, 1))
+    new = candidate(release_date=datetime(2024, 1, 1))
+    retried = candidate(release_date=datetime(2024, 6, 1), download_attempts=2)
+    short = candidate(release_date=datetime(2024, 1, 1), runtime_minutes=60)
+    other_site = [candidate(site="javct.net", release_date=datetime(2019, 1, 1)) for _ in range(2)]
+
+    ordered = schedule([old, retried, new, *other_site, short])
+
+    assert [c.site for c in ordered[:4]] == ["jav.guru", "javct.net", "jav.guru", "javct.net"]
+    assert [c for c in ordered if c.site == "jav.guru"] == [short, new, old, retried]
+
+
+@pytest.mark.asyncio
+async def test_claim_returns_ids_in_priority_order(init_db):
+    for code, released in [("TST-401", 2019), ("TST-402", 2024), ("TST-403", 2022)]:
+        video = Video(title=code, jav_code=code, page_link=f"https://x/{code}", javguru_status="parsed")
+        video.release_date = datetime(released, 1, 1)
+        await video.insert()
+
+    _, ids = await claim_videos_for_download(limit=2)
+
+    assert [(await Video.get(i)).jav_code for i in ids] == ["TST-402", "TST-403"]
+
+
+@pytest.mark.asyncio
+async def test_transfer_scheduler_caps_each_host():
+    transfers = TransferScheduler(capacity=4, host_concurrency=1)
+    for url in ["https://slow.cdn/1", "https://slow.cdn/2", "https://fast.cdn/1"]:
+        await transfers.put(url, url)
+    await transfers.close()
+
+    first = await transfers.get()
+    second = await transfers.get()
+    assert [first[1], second[1]] == ["https://slow.cdn/1", "https://fast.cdn/1"]
+
+    third = asyncio.create_task(transfers.get())
+    await asyncio.sleep(0)
+    assert not third.done()
+    await transfers.release("slow.cdn")
+    assert (await third)[1] == "https://slow.cdn/2"
+    assert await transfers.get() is None
+
+
+class FakeRedis:
+    """Shared by every HostLimits of a test, like one Redis behind several worker processes."""
+
+    data: dict = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def expire(self, key, seconds):
+        return key in self.data
+
+    async def incrby(self, key, amount):
+        self.data[key] = self.data.get(key, 0) + amount
+        return self.data[key]
+
+    async def decrby(self, key, amount):
+        return await self.incrby(key, -amount)
+
+    async def aclose(self):
+        pass
+
+
+@pytest.fixture
+def workers():
+    FakeRedis.data = {}
+    return lambda **kwargs: scheduler.HostLimits(client=FakeRedis, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_host_slots_are_shared_across_workers(workers, monkeypatch):
+    monkeypatch.setattr(scheduler.HostLimits, "POLL", 0.01)
+    first, second = workers(concurrency=1), workers(concurrency=1)
+    order = []
+
+    async def transfer(limits, name, url):
+        async with limits.slot(url):
+            order.append(f"{name} start")
+            await asyncio.sleep(0.05)
+            order.append(f"{name} end")
+
+    await asyncio.gather(
+        transfer(first, "a", "https://cdn/1"),
+        transfer(second, "b", "https://cdn/2"),
+        transfer(second, "c", "https://other/"),
+    )
+
+    assert order.index("a end") < order.index("b start")
+    assert order.index("c start") < order.index("a end")
+    assert not [key for key in FakeRedis.data if ":slot:" in key]
+
+
+@pytest.mark.asyncio
+async def test_bandwidth_window_is_shared_across_workers(workers, monkeypatch):
+    now, delays = [100.0], []
+
+    async def fake_sleep(delay):
+        delays.append(delay)
+        now[0] += delay
+
+    monkeypatch.setattr(scheduler.time, "time", lambda: now[0])
+    monkeypatch.setattr(scheduler.asyncio, "sleep", fake_sleep)
+    first, second = workers(rate=1000), workers(rate=1000)
+
+    await first.throttle("https://cdn/a", 1000)
+    await second.throttle("https://other/a", 1000)
+    await second.throttle("https://cdn/b", 500)
+
+    assert delays == [1.0]
+    assert FakeRedis.data == {
+        "download_host:cdn:bytes:100": 1000,
+        "download_host:other:bytes:100": 1000,
+        "download_host:cdn:bytes:101": 500,
+    }
@@ -0,0 +1,106 @@
+import asyncio
+import random
+
+import pytest
+
+from app.download.exceptions import DownloadFailedException
+from app.download.segments import SegmentedFetcher
+
+PAYLOAD = bytes(random.Random(7).getrandbits(8) for _ in range(10_000))
+
+
+class FakeRangeResponse:
+    def __init__(self, status: int, body: bytes, headers: dict):
+        self.status = status
+        self.headers = headers
+        self._body = body
+
+    async def read(self):
+        await asyncio.sleep(random.uniform(0, 0.01))  # finish out of order
+        return self._body
+
+
+class FakeRangeSession:
+    def __init__(self, ranges: bool = True, failures: int = 0):
+        self.ranges = ranges
+        self.failures = failures
+        self.requested = []
+
+    def get(self, url, headers=None, **_):
+        first, last = (int(x) for x in headers["Range"].removeprefix("bytes=").split("-"))
+        self.requested.append((first, last))
+        if not self.ranges:
+            response = FakeRangeResponse(200, PAYLOAD, {"Content-Length": str(len(PAYLOAD))})
+        elif self.failures and first > 0:
+            self.failures -= 1
+            response = FakeRangeResponse(503, b"", {})
+        else:
+            body = PAYLOAD[first : last + 1]
+            response = FakeRangeResponse(206, body, {"Content-Range": f"bytes {first}-{last}/{len(PAYLOAD)}"})
+        return FakeContext(response)
+
+
+class FakeContext:
+    def __init__(self, response):
+        self._response = response
+
+    async def __aenter__(self):
+        return self._response
+
+    async def __aexit__(self, *args):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_segments_are_reassembled_in_order():
+    session = FakeRangeSession()
+    fetcher = SegmentedFetcher(session, concurrency=4, segment_size=1000)
+
+    total_size, ranged = await fetcher.probe("https://cdn/video.mp4")
+    chunks = [chunk async for chunk in fetcher.iter_range("https://cdn/video.mp4", 0, total_size)]
+
+    assert (total_size, ranged) == (len(PAYLOAD), True)
+    assert len(chunks) == 10
+    assert b"".join(chunks) == PAYLOAD
+
+
+@pytest.mark.asyncio
+async def test_segments_start_from_offset():
+    fetcher = SegmentedFetcher(FakeRangeSession(), concurrency=3, segment_size=3000)
+
+    chunks = [chunk async for chunk in fetcher.iter_range("https://cdn/video.mp4", 2500, len(PAYLOAD))]
+
+    assert b"".join(chunks) == PAYLOAD[2500:]
+
+
+@pytest.mark.asyncio
+async def test_failed_segment_is_retried(monkeypatch):
+    async def no_sleep(*_):
+        return None
+
+    session = FakeRangeSession(failures=2)
+    fetcher = SegmentedFetcher(session, concurrency=2, segment_size=4000, retries=3)
+    monkeypatch.setattr("app.download.segments.asyncio.sleep", no_sleep)
+
+    chunks = [chunk async for chunk in fetcher.iter_range("https://cdn/video.mp4", 0, len(PAYLOAD))]
+
+    assert b"".join(chunks) == PAYLOAD
+
+
+@pytest.mark.asyncio
+async def test_probe_reports_missing_range_support():
+    fetcher = SegmentedFetcher(FakeRangeSession(ranges=False))
+
+    assert await fetcher.probe("https://cdn/video.mp4") == (len(PAYLOAD), False)
+
+
+@pytest.mark.asyncio
+async def test_segment_gives_up_after_retries(monkeypatch):
+    async def no_sleep(*_):
+        return None
+
+    fetcher = SegmentedFetcher(FakeRangeSession(failures=10), concurrency=2, segment_size=4000, retries=2)
+    monkeypatch.setattr("app.download.segments.asyncio.sleep", no_sleep)
+
+    with pytest.raises(DownloadFailedException):
+        _ = [chunk async for chunk in fetcher.iter_range("https://cdn/video.mp4", 0, len(PAYLOAD))]
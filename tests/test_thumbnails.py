@@ -0,0 +1,202 @@
+import hashlib
+
+import pytest
+
+from app.config import config
+from app.db.models import S3ObjectEntry, ThumbnailDerivative, ThumbnailMeta, Video, VideoCSV
+from app.download.derivatives import DerivativeRenderer, DerivativeSpec, RenderedImage, render_derivatives
+from app.download.thumbnails import ThumbnailSaver
+
+
+class FakeContent:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i : i + size]
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: bytes = b"", headers: dict | None = None):
+        self.status = status
+        self.content = FakeContent(body)
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        pass
+
+
+class FakeTransport:
+    def __init__(self, responses: dict[str, FakeResponse]):
+        self.responses = responses
+        self.sent_headers = {}
+
+    def session(self, url):
+        return self
+
+    def get(self, url, headers=None, **_):
+        self.sent_headers[url] = headers or {}
+        return self.responses[url]
+
+
+class FakeS3:
+    def __init__(self):
+        self.uploaded = {}
+
+    async def put_object(self, file, key, content_type):
+        self.uploaded[key] = file.getvalue()
+
+
+def md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+@pytest.fixture
+def make_poster_video(make_video):
+    def _make(code: str, **fields):
+        return make_video(code, thumbnail_url=f"https://img.example/{code}.jpg", **fields)
+
+    return _make
+
+
+@pytest.mark.asyncio
+async def test_failures_are_isolated_and_indexed_thumbnails_linked(make_poster_video):
+    ok, broken, indexed = [await make_poster_video(code) for code in ("TST-601", "TST-602", "TST-603")]
+    folder = f"{config.S3_THUMBNAILS_FOLDER}/"
+    await S3ObjectEntry(key=f"{folder}tst-603.jpg", folder=folder, size=1, etag="e", seen_at="2024-01-01").insert()
+    transport = FakeTransport(
+        {
+            "https://img.example/TST-601.jpg": FakeResponse(200, b"poster" * 3000),
+            "https://img.example/TST-602.jpg": FakeResponse(404),
+        }
+    )
+    s3 = FakeS3()
+
+    stats = await ThumbnailSaver(s3_client=s3, transport=transport, workers=2, progress_every=1)()
+
+    assert (stats.saved, stats.linked, stats.failed) == (1, 1, 1)
+    poster_key = f"{folder}{md5(b'poster' * 3000)}.jpg"
+    assert s3.uploaded == {poster_key: b"poster" * 3000}
+    assert str((await Video.get(ok.id)).thumbnail_s3_url).endswith(f"/{poster_key}")
+    assert (await Video.get(broken.id)).thumbnail_s3_url is None
+    assert str((await Video.get(indexed.id)).thumbnail_s3_url).endswith(f"/{folder}tst-603.jpg")
+
+
+class FakeRenderer(DerivativeRenderer):
+    def __init__(self):
+        super().__init__(specs=[])
+        self.specs = [DerivativeSpec("webp", 320), DerivativeSpec("webp", 640)]
+
+    def __enter__(self):
+        return self
+
+    async def render(self, data):
+        return [RenderedImage(spec, f"{spec.name}:{len(data)}".encode(), spec.width) for spec in self.specs]
+
+
+@pytest.mark.asyncio
+async def test_derivatives_are_uploaded_and_stored_on_the_video(make_poster_video):
+    video = await make_poster_video("TST-611")
+    transport = FakeTransport({"https://img.example/TST-611.jpg": FakeResponse(200, b"jpeg")})
+    s3 = FakeS3()
+
+    await ThumbnailSaver(s3_client=s3, transport=transport, renderer=FakeRenderer())()
+
+    folder = config.S3_THUMBNAILS_FOLDER
+    assert s3.uploaded[f"{folder}/{md5(b'jpeg')}_320.webp"] == b"webp_320:4"
+    saved = await Video.get(video.id)
+    assert [(d.name, d.width, d.size) for d in saved.thumbnail_derivatives] == [
+        ("webp_320", 320, 10),
+        ("webp_640", 640, 10),
+    ]
+    assert saved.thumbnail_derivatives[1].s3_url.endswith(f"/{folder}/{md5(b'jpeg')}_640.webp")
+
+
+@pytest.mark.asyncio
+async def test_identical_posters_share_one_object(make_poster_video):
+    first, second = await make_poster_video("TST-621"), await make_poster_video("TST-622")
+    headers = {"ETag": '"abc"', "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    transport = FakeTransport(
+        {
+            "https://img.example/TST-621.jpg": FakeResponse(200, b"same", headers),
+            "https://img.example/TST-622.jpg": FakeResponse(200, b"same", headers),
+        }
+    )
+    s3 = FakeS3()
+
+    stats = await ThumbnailSaver(s3_client=s3, transport=transport, renderer=FakeRenderer())()
+
+    assert (stats.saved, stats.shared) == (1, 1)
+    assert len(s3.uploaded) == 3  # one poster and its two derivatives
+    first, second = await Video.get(first.id), await Video.get(second.id)
+    assert first.thumbnail_s3_url == second.thumbnail_s3_url
+    assert first.thumbnail_derivatives == second.thumbnail_derivatives
+    assert (second.thumbnail_meta.md5, second.thumbnail_meta.etag) == (md5(b"same"), '"abc"')
+
+
+@pytest.mark.asyncio
+async def test_refresh_sends_conditional_requests_and_reuploads_changed_posters(make_poster_video):
+    old = ThumbnailMeta(md5=md5(b"old"), etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT")
+    s3_url = f"https://s3.example.com/{config.S3_THUMBNAILS_FOLDER}/{old.md5}.jpg"
+    fresh = await make_poster_video("TST-631", thumbnail_s3_url=s3_url, thumbnail_meta=old)
+    same = await make_poster_video("TST-632", thumbnail_s3_url=s3_url, thumbnail_meta=old)
+    changed = await make_poster_video("TST-633", thumbnail_s3_url=s3_url, thumbnail_meta=old)
+    await make_poster_video("TST-634")  # never saved, not part of a refresh
+    transport = FakeTransport(
+        {
+            "https://img.example/TST-631.jpg": FakeResponse(304),
+            "https://img.example/TST-632.jpg": FakeResponse(200, b"old", {"ETag": '"v2"'}),
+            "https://img.example/TST-633.jpg": FakeResponse(200, b"new", {"ETag": '"v3"'}),
+        }
+    )
+    s3 = FakeS3()
+
+    stats = await ThumbnailSaver(s3_client=s3, transport=transport, refresh=True)()
+
+    assert (stats.unchanged, stats.saved, stats.failed) == (2, 1, 0)
+    assert transport.sent_headers["https://img.example/TST-631.jpg"] == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT",
+    }
+    assert list(s3.uploaded) == [f"{config.S3_THUMBNAILS_FOLDER}/{md5(b'new')}.jpg"]
+    assert (await Video.get(fresh.id)).thumbnail_meta.etag == '"v1"'
+    same = await Video.get(same.id)
+    assert (str(same.thumbnail_s3_url), same.thumbnail_meta.etag) == (s3_url, '"v2"')
+    changed = await Video.get(changed.id)
+    assert str(changed.thumbnail_s3_url).endswith(f"/{md5(b'new')}.jpg")
+    assert changed.thumbnail_meta.md5 == md5(b"new")
+
+
+def test_csv_appends_derivatives_as_the_last_column():
+    derivatives = [ThumbnailDerivative(name="webp_320", s3_url="https://s3/p_320.webp", width=320, size=1)]
+    row = VideoCSV(
+        jav_code="TST-612",
+        title="t",
+        release_date="2024-01-01",
+        file_hash="h",
+        models=[],
+        categories=[],
+        tags=[],
+        s3_path="https://s3/v.mp4",
+        poster_for_main_page_url="https://s3/p.jpg",
+        poster_derivatives=[f"{d.name}={d.s3_url}" for d in derivatives],
+        studio="",
+    ).model_dump(mode="json")
+
+    assert list(row)[-3:] == ["studio", "poster_for_video_page_url", "poster_derivatives"]
+    assert row["poster_derivatives"] == "webp_320=https://s3/p_320.webp"
+
+
+def test_render_derivatives_never_upscales():
+    cv2 = pytest.importorskip("cv2")
+    np = pytest.importorskip("numpy")
+    _, poster = cv2.imencode(".jpg", np.zeros((300, 200, 3), np.uint8))
+
+    small, large = render_derivatives(poster.tobytes(), [DerivativeSpec("webp", 100), DerivativeSpec("webp", 640)], 80)
+
+    assert cv2.imdecode(np.frombuffer(small.data, np.uint8), cv2.IMREAD_COLOR).shape[:2] == (150, 100)
+    assert large.width == 200
@@ -0,0 +1,79 @@
+import aiohttp
+import pytest
+from aiohttp_socks import ProxyConnector
+
+from app.download import transport
+from app.download.transport import DownloadTransport
+from app.infra.proxy_manager import ProxyManager
+
+PROXIES = ["socks5://a:1080", "socks5://b:1080"]
+
+
+class FakeProxyConnector(aiohttp.TCPConnector):
+    created: list[str] = []
+
+    @classmethod
+    def from_url(cls, url, rdns=True, **options):
+        cls.created.append(url)
+        return cls(**options)
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_pooled_per_host_and_proxy(monkeypatch):
+    monkeypatch.setattr(transport, "ProxyConnector", FakeProxyConnector)
+    FakeProxyConnector.created = []
+    pool = DownloadTransport(proxy_hosts=["*.slow-cdn.com"], proxies=ProxyManager(PROXIES))
+
+    direct = pool.session("https://fast-cdn.com/a.mp4")
+    assert pool.session("https://fast-cdn.com/b.mp4") is direct
+
+    first = pool.session("https://v1.slow-cdn.com/a.mp4")
+    second = pool.session("https://v1.slow-cdn.com/b.mp4")
+    assert first is not second
+    assert pool.session("https://v1.slow-cdn.com/c.mp4") is first
+    assert FakeProxyConnector.created == PROXIES
+    assert direct.connector.limit_per_host == pool.connections_per_host
+
+    await pool.close()
+    assert direct.closed and first.closed and second.closed
+
+
+@pytest.mark.asyncio
+async def test_proxied_hosts_get_a_socks_connector():
+    pool = DownloadTransport(proxy_hosts=["*.slow-cdn.com"], proxies=ProxyManager(PROXIES))
+
+    assert pool.route("https://v1.slow-cdn.com/a.mp4") == PROXIES[0]
+    assert isinstance(pool.session("https://v1.slow-cdn.com/b.mp4").connector, ProxyConnector)
+    assert not isinstance(pool.session("https://fast-cdn.com/a.mp4").connector, ProxyConnector)
+    await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_receive_buffer_is_set_before_connecting():
+    from aiohttp import web
+
+    async def body(_):
+        return web.Response(body=b"x" * 1024 * 1024)
+
+    app = web.Application()
+    app.router.add_get("/", body)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/"
+
+    pool = DownloadTransport(rcvbuf=8192)
+    try:
+        session = pool.session(url)
+        assert isinstance(session.connector, transport.TunedConnector)
+        async with session.get(url) as response:
+            sock = response.connection.transport.get_extra_info("socket")
+            assert len(await response.read()) == 1024 * 1024
+        # Linux reports twice the requested size for bookkeeping overhead.
+        assert sock.getsockopt(transport.socket.SOL_SOCKET, transport.socket.SO_RCVBUF) in (8192, 2 * 8192)
+    finally:
+        await pool.close()
+        await runner.cleanup()
+
+    assert not isinstance(DownloadTransport().session(url).connector, transport.TunedConnector)